@@ -23,12 +23,64 @@ TOPOLOGY_ANALYSIS_STIMULATION_COMMAND = MESH_COMMAND_RBC_CHANNEL_CONFIG
 # MDR Analysis Configuration
 MDR_DEBUG_FILE_PATH = '.results/mdr_debug.csv'
 MDR_FILE_PATH = '.results/mdr.csv'
+MDR_ANALYSIS_UPDATE_INTERVAL_SECONDS = 2
 TRICKLE_I_MIN_MS = 32
 TRICKLE_REDUNDANCY_CONSTANT = 4
+MDR_MESSAGE_TIMEOUT_SECONDS = 5
+MDR_WINDOW_SECONDS = 10
+MDR_WINDOW_SERIES_LENGTH = 500
+MDR_STOP_CONFIDENCE = 0.95
+MDR_STOP_HALF_WIDTH = 0.02         # Stop when the MDR is known within +-2 %
+MDR_STOP_MIN_MESSAGES = 200
+MDR_STOP_MAX_MESSAGES = 20000
 
 # Latency Analysis Configuration
 LATENCY_DEBUG_FILE_PATH = '.results/latency_debug.csv'
 LATENCY_FILE_PATH = '.results/latency.csv'
-LATENCY_DATA_POINT_AMOUNT = 1000
 LATENCY_ANALYSIS_UPDATE_INTERVAL_SECONDS = 2
 LATENCY_HISTOGRAM_TIMESLOT_SIZE_SEC = 5
+LATENCY_FLOOD_TIMEOUT_SECONDS = 2
+LATENCY_MAX_IN_FLIGHT_MESSAGES = 5000
+LATENCY_MAP_PERCENTILES = (50, 90, 99)
+LATENCY_SKETCH_RELATIVE_ACCURACY = 0.01
+LATENCY_SKETCH_MAX_BINS = 2048
+LATENCY_STOP_STATISTIC = 'mean'    # 'mean' or a percentile, e.g. 90
+LATENCY_STOP_CONFIDENCE = 0.95
+LATENCY_STOP_RELATIVE_HALF_WIDTH = 0.05  # Stop when the statistic is known within +-5 %
+LATENCY_STOP_MIN_SAMPLES = 100
+LATENCY_STOP_MAX_SAMPLES = 5000
+
+# Capture Reader Configuration
+CAPTURE_READER_MAX_ROWS = 100000
+
+# Capture Writer Configuration
+CAPTURE_FLUSH_INTERVAL_SECONDS = 0.5
+CAPTURE_FILE_LINES_TO_PRESERVE = 50000
+CAPTURE_FILE_LINE_THRESHOLD = 100000
+CAPTURE_DEBUG_FILE_MAX_BYTES = 50 * 1024 * 1024
+
+# Results Store Configuration
+RESULTS_DB_PATH = '.results/results.db'
+RESULTS_BATCH_SIZE = 500
+RESULTS_FLUSH_INTERVAL_SECONDS = 5
+RESULTS_PAGE_SIZE = 50
+
+# Topology Engine Configuration
+TOPOLOGY_EVIDENCE_WINDOW_SECONDS = 60
+TOPOLOGY_CONVERGENCE_STABLE_SECONDS = 30
+TOPOLOGY_CONVERGENCE_MIN_EVIDENCE_PER_NODE = 10
+TOPOLOGY_AUTO_STOP_TX = True
+
+# Flood Tracer Configuration
+FLOOD_TRACE_TIMEOUT_SECONDS = 2
+FLOOD_TRACE_MAX_MESSAGES = 50000
+FLOOD_TRACE_RETENTION_SECONDS = 600
+
+# Packet Store Configuration
+PACKET_STORE_CHUNK_ROWS = 65536
+PACKET_STORE_RETENTION_SECONDS = 600
+PACKET_STORE_FIRST_SEEN_MEMORY_SECONDS = 30
+
+# Analysis Scheduler Configuration
+SCHEDULER_COST_FACTOR = 2
+SCHEDULER_MAX_INTERVAL_FACTOR = 8
@@ -0,0 +1,159 @@
+import io
+import os
+import pandas as pd
+from threading import Lock
+from typing import List
+from pandas.api.types import union_categoricals
+from data.timestamp_parser import parse_packet_timestamps, HourWrapUnwrapper, INVALID_TIMESTAMP
+from config import CAPTURE_READER_MAX_ROWS
+
+# Columns of a capture file that the analyses use. 'Channel' is only present in some captures and is not needed.
+CAPTURE_COLUMNS = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version']
+
+# Explicit dtypes so pandas does not have to infer them for every chunk
+CAPTURE_DTYPES = {
+    'Timestamp': 'int64',
+    'MAC': 'category',
+    'Command': 'category',
+    'Flags': 'category',
+    'Index': 'int64',
+    'Payload': 'object',
+    'Version': 'int64',
+}
+
+# Integer keys computed once per packet when it is read. All analyses group and join on these instead of strings.
+#   MessageKey: 64-bit fingerprint of (Index, Version, Payload), identifies one message and all its rebroadcasts
+#   IndexVersionKey: Index in the upper and Version in the lower 32 bits, so the key of the next version is key + 1
+KEY_DTYPES = {
+    'MessageKey': 'uint64',
+    'IndexVersionKey': 'int64',
+}
+
+def add_message_keys(frame: pd.DataFrame) -> None:
+    """ Add the MessageKey and IndexVersionKey columns to a frame of packets. """
+    message_columns = pd.DataFrame({'Index': frame['Index'], 'Version': frame['Version'],
+                                    'Payload': frame['Payload'].fillna('NoPayload').astype(object)})
+    frame['MessageKey'] = pd.util.hash_pandas_object(message_columns, index=False).to_numpy()
+    frame['IndexVersionKey'] = (frame['Index'].to_numpy(dtype='int64') << 32) | frame['Version'].to_numpy(dtype='int64')
+
+def prepare_capture_rows(new_rows: pd.DataFrame, unwrapper: HourWrapUnwrapper) -> pd.DataFrame:
+    """ Convert timestamps of freshly parsed rows to unwrapped microseconds, drop invalid rows and add the message keys. """
+    timestamps = parse_packet_timestamps(new_rows['Timestamp'])
+    valid = timestamps != INVALID_TIMESTAMP
+    if not valid.all():
+        print(f"Dropping {(~valid).sum()} packets with invalid timestamps")
+        new_rows = new_rows[valid].reset_index(drop=True)
+    new_rows['Timestamp'] = unwrapper.unwrap(timestamps[valid])
+    new_rows = new_rows[CAPTURE_COLUMNS]
+    add_message_keys(new_rows)
+    return new_rows
+
+def frame_from_rows(rows: List[List], header: List[str], unwrapper: HourWrapUnwrapper) -> pd.DataFrame:
+    """ Build a frame with the capture schema from rows as they are logged by the rx threads, without going through a file. """
+    new_rows = pd.DataFrame(rows, columns=header)[CAPTURE_COLUMNS]
+    new_rows = new_rows.astype(dict(CAPTURE_DTYPES, Timestamp='object'))
+    # An empty payload is read back from the file as NaN, keep it the same so the message keys match
+    new_rows['Payload'] = new_rows['Payload'].replace('', None)
+    return prepare_capture_rows(new_rows, unwrapper)
+
+class CaptureReader:
+    """
+    Tail-following reader for a capture CSV file.
+
+    The reader remembers the byte offset up to which the file has been parsed and only parses newly appended,
+    complete lines on every update. Timestamps are converted to int64 microseconds and unwrapped across hour rollovers
+    in arrival order. Parsed rows are appended to an in-memory frame that keeps at most `max_rows` rows.
+    If the file is rewritten underneath the reader (truncated by `_initialize_log_file` or replaced by
+    `delete_lines_preserving_header`), the reader starts over from the beginning of the new file.
+    """
+
+    def __init__(self, file_path: str, max_rows: int = CAPTURE_READER_MAX_ROWS) -> None:
+        self.file_path = file_path
+        self.max_rows = max_rows
+        self.unwrapper = HourWrapUnwrapper()
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """ Forget everything that has been read so far. """
+        self.offset = 0
+        self.inode = None
+        self.header = None
+        self.unwrapper.reset()
+        self.frame = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in {**CAPTURE_DTYPES, **KEY_DTYPES}.items()})
+
+    def get_frame(self) -> pd.DataFrame:
+        """
+        Returns the rows read so far.
+
+        The returned frame is replaced, not modified, on every update, so it can be used by the caller without copying.
+        It must not be modified in place.
+        """
+        return self.frame
+
+    def update(self) -> pd.DataFrame:
+        """
+        Parse all complete lines appended to the capture file since the last update.
+
+        Returns:
+            pd.DataFrame: The newly parsed rows. They are also appended to the frame returned by `get_frame`.
+        """
+        with self.lock:
+            try:
+                stat = os.stat(self.file_path)
+            except OSError:
+                return self.frame.iloc[0:0]
+
+            # The file was replaced (new inode) or truncated (smaller than what was already read)
+            if (self.inode is not None and stat.st_ino != self.inode) or stat.st_size < self.offset:
+                self.reset()
+            self.inode = stat.st_ino
+
+            if stat.st_size == self.offset:
+                return self.frame.iloc[0:0]
+
+            with open(self.file_path, 'rb') as file:
+                file.seek(self.offset)
+                chunk = file.read(stat.st_size - self.offset)
+
+            # Only parse complete lines, a partially written line is parsed on the next update
+            end = chunk.rfind(b'\n') + 1
+            if end == 0:
+                return self.frame.iloc[0:0]
+            chunk = chunk[:end]
+            self.offset += end
+
+            if self.header is None:
+                header_end = chunk.find(b'\n') + 1
+                self.header = chunk[:header_end].decode().strip().split(',')
+                chunk = chunk[header_end:]
+                if not chunk:
+                    return self.frame.iloc[0:0]
+
+            new_rows = self._parse_chunk(chunk)
+            self.frame = self._append(self.frame, new_rows)
+            return new_rows
+
+    def _parse_chunk(self, chunk: bytes) -> pd.DataFrame:
+        """ Parse a block of complete CSV lines with the capture schema. """
+        dtypes = dict(CAPTURE_DTYPES, Timestamp='object')
+        new_rows = pd.read_csv(io.BytesIO(chunk), header=None, names=self.header, usecols=CAPTURE_COLUMNS, dtype=dtypes)
+
+        return prepare_capture_rows(new_rows, self.unwrapper)
+
+    def _append(self, frame: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+        """ Append new rows to the frame, keeping the categorical columns categorical and dropping the oldest rows. """
+        if frame.empty:
+            combined = new_rows
+        else:
+            combined = pd.concat([frame, new_rows], ignore_index=True)
+            for column in self._categorical_columns():
+                combined[column] = union_categoricals([frame[column], new_rows[column]], ignore_order=True)
+
+        if len(combined) > self.max_rows:
+            combined = combined.iloc[-self.max_rows:].reset_index(drop=True)
+        return combined
+
+    @staticmethod
+    def _categorical_columns() -> List[str]:
+        return [column for column, dtype in CAPTURE_DTYPES.items() if dtype == 'category']
@@ -0,0 +1,115 @@
+import csv
+import io
+import os
+import time
+from typing import List
+from common import delete_lines_preserving_header
+from config import CAPTURE_FLUSH_INTERVAL_SECONDS
+
+class WindowedRetention:
+    """ Keeps the newest lines of a capture file once it grows past a line threshold. Used for files that are analysed. """
+
+    def __init__(self, lines_to_preserve: int, threshold: int) -> None:
+        self.lines_to_preserve = lines_to_preserve
+        self.threshold = threshold
+
+    def apply(self, sink: 'CaptureSink') -> None:
+        if sink.line_count < self.threshold:
+            return
+        sink.close()
+        delete_lines_preserving_header(sink.file_path, self.lines_to_preserve, self.threshold)
+        # The header and every line from `lines_to_preserve` onwards are kept
+        sink.line_count -= self.lines_to_preserve - 1
+        sink.open('a')
+
+class ArchiveRetention:
+    """ Moves a capture file to a numbered archive once it grows past a size limit. Used for debug files. """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.archive_count = 0
+
+    def apply(self, sink: 'CaptureSink') -> None:
+        if sink.file.tell() < self.max_bytes:
+            return
+        sink.close()
+        self.archive_count += 1
+        os.replace(sink.file_path, f"{sink.file_path}.{self.archive_count}")
+        sink.open('w')
+
+class CaptureSink:
+    """ A capture file that stays open while packets are logged, with its own retention policy. """
+
+    def __init__(self, file_path: str, retention=None) -> None:
+        self.file_path = file_path
+        self.retention = retention
+        self.header = None
+        self.file = None
+        self.line_count = 0
+
+    def open(self, mode: str) -> None:
+        """ Open the file. In 'w' mode the file is truncated and the header is written. """
+        self.file = open(self.file_path, mode, newline='')
+        if mode == 'w':
+            csv.writer(self.file).writerow(self.header)
+            self.line_count = 1
+
+    def write(self, data: str, lines: int) -> None:
+        self.file.write(data)
+        self.file.flush()
+        self.line_count += lines
+        if self.retention is not None:
+            self.retention.apply(self)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class TeeWriter:
+    """
+    Writes capture rows to several sinks.
+
+    Every row is serialized once into a shared buffer, so logging a packet costs the same no matter how many sinks
+    there are. The buffer is written to all sinks, and their retention policies applied, at most once per
+    `flush_interval` seconds or when `flush` is called. The writer is meant to be used from a single (rx) thread.
+    """
+
+    def __init__(self, sinks: List[CaptureSink], header: List[str],
+                 flush_interval: float = CAPTURE_FLUSH_INTERVAL_SECONDS) -> None:
+        self.sinks = sinks
+        self.header = header
+        self.flush_interval = flush_interval
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+        os.makedirs('.results', exist_ok=True)
+        for sink in self.sinks:
+            sink.header = header
+            sink.open('w')
+
+    def write_row(self, row: List) -> None:
+        """ Serialize a row once. It reaches the sinks on the next flush. """
+        self.writer.writerow(row)
+        self.pending_rows += 1
+        if time.monotonic() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Write all buffered rows to every sink and apply the retention policies. """
+        self.last_flush = time.monotonic()
+        if self.pending_rows == 0:
+            return
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        for sink in self.sinks:
+            sink.write(data, self.pending_rows)
+        self.pending_rows = 0
+
+    def close(self) -> None:
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
@@ -1,9 +1,21 @@
+import numpy as np
 import pandas as pd
-import string
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
-from config import NETWORK_TOPOLOGY_THRESHOLD, TRICKLE_I_MIN_MS, TRICKLE_REDUNDANCY_CONSTANT
-import json
+from typing import List, Dict, Tuple, Optional
+from config import NETWORK_TOPOLOGY_THRESHOLD, TRICKLE_I_MIN_MS, TRICKLE_REDUNDANCY_CONSTANT, LATENCY_MAP_PERCENTILES
+from data.capture_reader import CaptureReader
+from data.packet_store import PacketStore
+from data.topology_engine import TopologyEngine, RESPONSE_FLAGS
+from data.mdr_engine import MDREngine
+from data.latency_engine import LatencyEngine
+from data.flood_tracer import FloodTracer
+from data.trickle_window import max_packets_in_window
+from data.state_snapshot import StateSnapshot
+from data.site_registry import SiteRegistry, SiteInfo
+from data.node_registry import NodeRegistry
+from data.edge_store import EdgeStore
+from threading import Lock, RLock
+from types import MappingProxyType
+import os
 
 class DataService:
     _instance = None  # Class-level attribute to store the singleton instance
@@ -16,514 +28,538 @@ class DataService:
         return cls._instance
 
     def init_once(self):
-        self.connections = []
+        self.edge_store = EdgeStore()
         self.mac_label_map = {}
         self.all_unique_macs = set()
         self.mdr_results = {}
         self.site_info = None
+        self.nodes = NodeRegistry()
+        self.capture_readers = {}
+        self.packet_stores = {}
+        self.topology_engine = None
+        self.topology_lock = Lock()
+        self.mdr_engines = {}
+        self.mdr_lock = Lock()
+        self.latency_engines = {}
+        self.latency_lock = Lock()
+        self.flood_tracer = None
+        # Version of the snapshot whose connections are the topology graph of the flood tracer
+        self.flood_graph_version = None
+        self.flood_lock = Lock()
+        # The attributes above hold the working state and are only touched by writers, under `state_lock`. Readers use the
+        # published snapshot, which is replaced as a whole after every update.
+        self.state_lock = RLock()
+        self.snapshot = StateSnapshot()
         
     def reset(self) -> None:
-        self.connections = []
-        self.mac_label_map = {}
-        self.all_unique_macs = set()
-        self.mdr_results = {}
+        with self.state_lock:
+            self.edge_store.reset()
+            self.mac_label_map = {}
+            self.all_unique_macs = set()
+            self.mdr_results = {}
+            self.nodes.reset()
+            self._publish(edges=True, labels=True, macs=True, mdr=True)
+        with self.topology_lock:
+            self.topology_engine = None
+        with self.flood_lock:
+            self.flood_tracer = None
         
-    def get_connections(self) -> List[Tuple[str, str]]:
-        return self.connections
+    def get_snapshot(self) -> StateSnapshot:
+        """ Returns the latest published state. It never changes, a newer state is published as a new snapshot. """
+        return self.snapshot
+    
+    def get_connections(self) -> Tuple[Tuple[str, str], ...]:
+        return self.snapshot.connections
+    
+    def get_isolated_nodes(self) -> frozenset:
+        return self.snapshot.isolated_nodes
     
     def get_mac_label_map(self) -> Dict:
-        return self.mac_label_map
+        return self.snapshot.mac_label_map
     
-    def data_service_register_site_information(self, site_name: str) -> None:
-        """ Load site data from a JSON file for a given site name. """
-        with open(f'.auth/{site_name}.json') as file:
-            self.site_info = json.load(file)
-
-    def data_processing_find_connections(self, file_path: str, site_name: str) -> List[Tuple[str, str]]:
-        
+    def _publish(self, edges: bool = False, labels: bool = False, macs: bool = False, mdr: bool = False) -> None:
         """
-        Processes discovery data to find connections between nodes and map the network topology.
-
-        1. Load the mesh packet data from the specified CSV file into a structured format (DataFrame).
-        2. Parse the timestamps in the data to a datetime format.
-        3. Find all unique MAC addresses in the data and add them to the set of all unique MAC addresses if they are not already present.
-        4. Load the site data from the JSON file for the specified site name. This data holds information about the devices in the network,
-            their MAC addresses and indices, and other relevant information.
-        5. From the loaded data, filter only the RESPONSE messages. Response messages are ones that we want to analyze.
-            The tool sends GET messages to each index and the nodes generate RESPONSE messages to those GET messages.
-            Other nodes that hear the RESPONSE message will start to rebroadcast it. If the rebroadcast occurs within 32ms (Trickle configuration), 
-            then there is a direct connection between the two nodes.
-        6. For each unique MAC address in the loaded dataset, find all new version packets that originate from the source MAC address.
-        7. To avoid false positives when it comes to finding packets that originate from the source MAC, find the index of the source MAC address
-            in the site data and filter the packets to include only those that have the same index as the source MAC address, because a node
-            sends response messages on its own index.
-                * It can happen that the tool miss the original message from some other node, and if the current MAC address is the one that rebroadcasts
-                that message first, the algorithm will indentify that MAC address as the source.
-        8. Find potential connection by merging the source messages with all other messages in the data that have the same index, payload, and version to
-            identify which other nodes has sent the same message as the source node.
-        9. Calculate the time difference between the source message and its message pair from step before.
-        10. Filter out all pairs whose time diffrenece is larger than 32ms. This means that the message was not rebroadcasted within the first trickle period.
-        11. Filter out all pairs whose time difference is less than 16ms. This means that the tool has not heard the original message but has heard a rebroadcast of it.
-            First trickle period is 16 to 32ms, which means that no node should rebroadcast the message before 16ms.
-        12. Count how many times a message is rebroadcasted by other nodes. If a message is rebroadcasted at least NETWORK_TOPOLOGY_THRESHOLD times, then there is a connection.
-            A threshold is set to avoid false positives.
+        Publish the working state as the new snapshot. Only the parts flagged as changed are copied, the others are shared
+        with the previous snapshot. Must be called with `state_lock` held.
         """
+        self.snapshot = self.snapshot.update(edge_store=self.edge_store if edges else None,
+                                             mac_label_map=self.mac_label_map if labels else None,
+                                             all_unique_macs=self.all_unique_macs if macs else None,
+                                             mdr_results=self.mdr_results if mdr else None)
     
-        # Load the discovery data from the specified CSV file into a structured format (DataFrame).
-        data = self.load_data(file_path)
-        
-        # Parse Timestamps
-        data['Timestamp'] = data['Timestamp'].apply(self.get_packet_timestamp)
-
-        # Find all unique MACs and add them to all_unique_macs
-        self.all_unique_macs.update(set(data['MAC'].unique()))
-        
-        # Open the text file and read lines
-        with open(f'.auth/{site_name}.json', 'r') as file:
-            site_data = json.load(file)
-
-        site_devices = site_data['devices']
-        
-        # Filter only RESPONSE messages
-        data_resp = data[data['Flags'] == '[RESP]']
-       
-        for mac_address in self.all_unique_macs:
-            # Convert the MAC address from the user-friendly format to the format used in the data
-            user_mac = mac_address.replace(":", "")
-            
-            # Find all new version packets that originates from the source MAC
-            source_packets = self.get_first_occurrences(data_resp, mac_address)
-            
-            # Can happen that a node is detected and is not in data
-            try:
-                # Get the index for the specified MAC address
-                mac_index = site_devices[user_mac]['deviceAddress']
-            except:
-                mac_index = None
-                
-            if mac_index is not None:
-                source_packets = source_packets[source_packets['Index'] == mac_index]
-            
-            
-            if source_packets.empty:
-                continue
-
-            # Filter for potential connections. There is a potential connection with another node if the Index, Payload, and Version 
-            # are the same as the source. We do this by merging the source_packets DataFrame with the data DataFrame.
-            potential_connections = data.merge(source_packets, on=['Index', 'Payload', 'Version'], suffixes=('', '_source'))
-            # Filter out potential connections that originate from the same MAC address
-            potential_connections = potential_connections[potential_connections['MAC'] != mac_address]
-
-            # Calculate time difference between the source and potential connection
-            potential_connections['time_diff'] = (potential_connections['Timestamp'] - potential_connections['Timestamp_source']).dt.total_seconds().abs()
-            # MAC address is directly connected to another node if the time difference is less than 32 milliseconds
-            directly_connected = potential_connections[potential_connections['time_diff'] < 0.032] # 32 milliseconds
-            
-            # Find versions where there is at least one packet with a time_diff less than 16. This means that the tool has not received original packet. Received packet
-            # in this case is trickle.
-            versions_to_remove = directly_connected[directly_connected['time_diff'] < 0.016]['Version'].unique()
-
-            # Remove all rows with those versions
-            directly_connected = directly_connected[~directly_connected['Version'].isin(versions_to_remove)]
-            
-
-            # Count occurrences of each MAC address in directly_connected and filter out those with less than 5 occurrences.
-            # It can happen that the tool does not hear original source MAC message and will translate what it hears to a connection that
-            # does not exist. This is why we filter out MACs with less than 5 occurrences.
-            mac_occurrences = directly_connected['MAC'].value_counts()
-            mac_occurrences = mac_occurrences[mac_occurrences >= NETWORK_TOPOLOGY_THRESHOLD]
-
-            # Use the filtered mac_occurrences index for further processing to ensure only MACs with 5 or more occurrences are considered
-            filtered_macs = mac_occurrences.index.tolist()
-
-            # Now, only consider MAC addresses that are in filtered_macs for connection analysis
-            directly_connected_filtered = directly_connected[directly_connected['MAC'].isin(filtered_macs)]
-
-            # Proceed with connection analysis using directly_connected_filtered
-            # For each MAC in filtered_macs, process their connections
-            new_connections = set(directly_connected_filtered['MAC'].unique())
-            for conn_mac in new_connections:
-                self._add_connection(mac_address, conn_mac)
-
-            # After processing all direct connections, add connections to '0' if no other connections are found for a MAC
-            for mac_address in self.all_unique_macs:
-                if not any(mac_address in connection for connection in self.connections):
-                    self.connections.append((mac_address, '0'))
-            
-        # Assign letters to each unique MAC address
-        self._assign_letter_to_each_unique_mac(self.connections)
-            
-            
-        return self.connections
+    def get_capture_reader(self, file_path: str) -> CaptureReader:
+        """ Returns the tail-following reader for a capture file, creating it on first use. """
+        key = os.path.realpath(file_path)
+        if key not in self.capture_readers:
+            self.capture_readers[key] = CaptureReader(file_path)
+        return self.capture_readers[key]
     
-    @staticmethod
-    def load_data(filepath: str) -> pd.DataFrame:
-        """Load the CSV data into a pandas DataFrame."""
-        data = pd.read_csv(filepath)
-        return data
+    def start_packet_store(self, file_path: str, header: List[str]) -> PacketStore:
+        """
+        Create an empty packet store for the analysis that logs to a capture file. The rx thread appends its rows to the store,
+        and the capture file is only an export of them.
+        """
+        store = PacketStore(header)
+        self.packet_stores[os.path.realpath(file_path)] = store
+        self.reset_capture(file_path)
+        return store
+    
+    def get_packet_store(self, file_path: str) -> PacketStore:
+        """ Returns the packet store of the analysis that logs to a capture file, None if there is none. """
+        return self.packet_stores.get(os.path.realpath(file_path))
     
-    def _assign_letter_to_each_unique_mac(self, connections: List[Tuple[str, str]]) -> None:
+    def load_capture(self, file_path: str) -> pd.DataFrame:
         """
-            Find all unique MAC addresses and assign a unique letter to each one.
-            
-            Parameters:
-            connections (List[Tuple[str, str]]): A list of tuples representing connections.
-            
-            Returns:
-            None
+        Returns all retained packets of a capture. Packets of a running analysis come from its packet store, otherwise
+        rows appended to the capture file since the last call are parsed.
         """
-        unique_macs = set()
-        for connection in connections:
-            unique_macs.update(connection)
-        
-        # Create iterator over 1 to 500
-        numbers = iter(range(1, 501))  # Creates an iterator over 1 to 500
-        for mac in unique_macs:
-            if mac == "0":
-                continue
-            # Find MAC in site data
-            try:
-                node_name = self.site_info['devices'][mac.replace(":", "")]['title']
-            except: 
-                node_name = "UNIDENTIFIED" # Not in site data
-            self.mac_label_map[mac] = {'number': next(numbers), 'title': node_name}
-            
-    def _remove_zero_connections(self, mac_address: str) -> None:
+        store = self.get_packet_store(file_path)
+        if store is not None:
+            return store.read()[0]
+        reader = self.get_capture_reader(file_path)
+        reader.update()
+        return reader.get_frame()
+    
+    def reset_capture(self, file_path: str) -> None:
+        """ Drop rows read from a capture file, e.g. when the file is re-initialized for a new analysis run. """
+        self.get_capture_reader(file_path).reset()
+    
+    def data_service_register_site_information(self, site_name: str) -> None:
+        """ Load site data from the site registry for a given site name. """
+        self.site_info = SiteRegistry().get(site_name)
+
+    def process_topology_packets(self, file_path: str, site_name: str, passive: bool = False) -> List[Tuple[str, Tuple[str, str]]]:
         """
-        Removes the connections with '0' from the list of connections for the given MAC address.
-        Args:
-            mac_address (str): The MAC address for which connections need to be removed.
+        Find the connections between nodes from the packets as they are received, see `TopologyEngine`. In `passive` mode
+        floods of every flag type are used, so no stimulation is needed.
+
+        1. Read the packets added to the packet store of the capture since the last update.
+        2. Feed the packets to the topology engine, which returns the connections that were added or removed.
+        3. Apply the deltas to the edge store. A connection is removed when its evidence has left the evidence window of the
+            engine (TOPOLOGY_EVIDENCE_WINDOW_SECONDS). MAC addresses without any connection are isolated nodes.
+        4. Assign a number only to MAC addresses that are new, so already plotted nodes keep their labels.
+
         Returns:
-            None
+            List[Tuple[str, Tuple[str, str]]]: The ('add' or 'remove', connection) deltas of this update.
         """
-        self.connections = [conn for conn in self.connections if not (mac_address == conn[0] and '0' == conn[1]) and not (mac_address == conn[1] and '0' == conn[0])]
-        
+        with self.topology_lock:
+            source_flags = None if passive else RESPONSE_FLAGS
+            if self.topology_engine is None or self.topology_engine.source_flags != source_flags:
+                self.topology_engine = TopologyEngine(self._load_site_data(site_name).index_by_mac, source_flags=source_flags)
+            
+            packets = self.get_packet_store(file_path).read_new('topology')
+            deltas = self.topology_engine.process(packets)
+            
+        with self.state_lock:
+            new_macs = set(packets.get_unique_macs()) - self.all_unique_macs
+            self.all_unique_macs.update(new_macs)
+            for mac_address in new_macs:
+                self.edge_store.add_node(mac_address)
+            
+            for action, (mac1, mac2) in deltas:
+                if action == 'add':
+                    self.edge_store.add(mac1, mac2)
+                else:
+                    self.edge_store.remove(mac1, mac2)
+            
+            self._assign_number_to_new_macs(new_macs)
+            if deltas or new_macs:
+                self._publish(edges=True, labels=bool(new_macs), macs=bool(new_macs))
+            return deltas
+    
+    def get_topology_convergence(self) -> Optional[Dict]:
+        """ Returns the convergence of the streaming topology (see `TopologyEngine.get_convergence`), None before the first update. """
+        with self.topology_lock:
+            return self.topology_engine.get_convergence() if self.topology_engine is not None else None
+    
+    def get_topology_node_evidence(self) -> Optional[Dict[str, Dict]]:
+        """ Returns the evidence of every node of the streaming topology (see `TopologyEngine.get_node_evidence`), None before the first update. """
+        with self.topology_lock:
+            return self.topology_engine.get_node_evidence() if self.topology_engine is not None else None
     
-    def _add_connection(self, mac1: str, mac2: str) -> None:
+    def process_flood_packets(self, file_path: str, final: bool = False) -> FloodTracer:
         """
-        Adds a connection between two MAC addresses to the connections list.
+        Trace the propagation of every message as packets are received (see `FloodTracer`).
 
-        Remove any existing connections to '0' for both MAC addresses, and then add the new connection to the connections list
-        if it does not already exist.
-
-        Args:
-            mac1 (str): The first MAC address.
-            mac2 (str): The second MAC address.
+        1. Hand the topology graph of the current snapshot to the tracer, if it changed since the last update.
+        2. Feed the packets added to the packet store of the capture since the last update to the tracer, which closes
+           the traces of messages whose flood timed out. On the final update all traces are closed.
 
         Returns:
-            None
+            FloodTracer: The tracer, to query traces by message or time range. Query it under `flood_lock`.
         """
-        if mac1 != '0' and mac2 != '0':
-            ordered_connection = tuple(sorted([mac1, mac2]))
-            # Remove existing connections to '0' for both MAC addresses
-            self._remove_zero_connections(ordered_connection[0])
-            self._remove_zero_connections(ordered_connection[1])
-            # Add the new connection if it does not already exist
-            if ordered_connection not in self.connections:
-                self.connections.append(ordered_connection)
-                
-    @staticmethod
-    def get_packet_timestamp(packet_timestamp: str):
-        # Remove brackets and split by the dot
-        parts = packet_timestamp.strip('[]').split('.')
-        if len(parts) != 4:
-            print(f"Invalid timestamp format: {packet_timestamp}")
-            return None
-        
-        try:
-            # Extract each part of the timestamp
-            minutes, seconds, milliseconds, microseconds = [int(part) for part in parts]
-            
-            # Construct a timedelta since the minimum component we have is minutes
-            # This timedelta represents the duration since the start of the hour
-            delta = timedelta(minutes=minutes, seconds=seconds, milliseconds=milliseconds, microseconds=microseconds)
-            
-            # Construct a base datetime object (you might adjust this according to your needs)
-            # Here we use a base date of 1st January 1970 with the hour set to 0
-            base_datetime = datetime(1970, 1, 1, hour=0)
-            
-            # Add the timedelta to the base datetime
-            final_datetime = base_datetime + delta
-            return final_datetime
-        except ValueError as e:
-            print(f"Error parsing timestamp: {e}")
-            return None
-        
+        with self.flood_lock:
+            if self.flood_tracer is None:
+                self.flood_tracer = FloodTracer()
+                self.flood_graph_version = None
+            snapshot = self.snapshot
+            if snapshot.version != self.flood_graph_version:
+                self.flood_tracer.set_graph(snapshot.connections)
+                self.flood_graph_version = snapshot.version
+            self.flood_tracer.process(self.get_packet_store(file_path).read_new('flood'))
+            if final:
+                self.flood_tracer.finish()
+            return self.flood_tracer
+    
+    def reset_flood_tracer(self) -> None:
+        """ Forget the streaming flood trace, e.g. when a new analysis run starts. """
+        with self.flood_lock:
+            self.flood_tracer = None
+    
+    def get_flood_trace(self, index: int, version: int) -> Optional[Dict]:
+        """ Returns the summary, timeline and propagation tree of a message of the streaming trace, None if it is not traced. """
+        with self.flood_lock:
+            trace = self.flood_tracer.get_trace(index, version) if self.flood_tracer is not None else None
+            if trace is None:
+                return None
+            return {**trace.get_summary(), "timeline": list(trace.timeline), "parents": dict(trace.parents), "suppressed": list(trace.suppressed)}
+    
+    def get_flood_metrics(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> Optional[Dict]:
+        """ Returns the aggregate metrics of the streaming trace for messages sent in [start_us, end_us), None before the first update. """
+        with self.flood_lock:
+            return self.flood_tracer.get_metrics(start_us, end_us) if self.flood_tracer is not None else None
+    
+    def _assign_number_to_new_macs(self, new_macs: set) -> None:
+        """ Assign the next free number to each new MAC address, leaving the numbers of known MAC addresses unchanged. """
+        for mac in new_macs:
+            if mac in self.mac_label_map:
+                continue
+            self.mac_label_map[mac] = MappingProxyType({'number': self.nodes.get_number(self.nodes.intern(mac)), 'title': self._get_node_name(mac)})
+    
+    def _get_node_name(self, mac: str) -> str:
+        """ Returns the title of the MAC address in the registered site, UNIDENTIFIED if it is not in the site data. """
+        return self.site_info.get_title(mac) if self.site_info else "UNIDENTIFIED"
+    
     @staticmethod
-    def get_first_occurrences(df, mac_address):
+    def find_direct_connections(data: pd.DataFrame, index_by_mac: Dict[str, int]) -> Tuple[List[Tuple[str, str]], bool]:
         """
-        Find which packets are generated by the given MAC address.
+        Find direct connections between nodes from RESPONSE floods of a whole capture, for all MAC addresses at once.
+
+        The app finds connections incrementally with `TopologyEngine`, which follows the same rules. This batch version is the
+        reference the engine is checked against in testing/topology_benchmark.py.
+
+        1. From the data, filter only the RESPONSE messages. Response messages are ones that we want to analyze.
+            The tool sends GET messages to each index and the nodes generate RESPONSE messages to those GET messages.
+            Other nodes that hear the RESPONSE message will start to rebroadcast it. If the rebroadcast occurs within 32ms (Trickle configuration), 
+            then there is a direct connection between the two nodes.
+        2. The first packet of every index and version is the source packet, if it is a RESPONSE, and its MAC address is the source MAC address.
+        3. To avoid false positives when it comes to finding packets that originate from the source MAC, keep only source packets that have the same
+            index as the source MAC address in the site data, because a node sends response messages on its own index.
+                * It can happen that the tool miss the original message from some other node, and if the current MAC address is the one that rebroadcasts
+                that message first, the algorithm will indentify that MAC address as the source.
+        4. Pair every packet in the data with the source packet that has the same index, payload, and version (MessageKey) to identify which other
+            nodes has sent the same message as the source node, and calculate the time difference between them.
+        5. Filter out all pairs whose time diffrenece is larger than 32ms. This means that the message was not rebroadcasted within the first trickle period.
+        6. Filter out all versions of a source MAC address that have a pair whose time difference is less than 16ms. This means that the tool has not
+            heard the original message but has heard a rebroadcast of it. First trickle period is 16 to 32ms, which means that no node should rebroadcast
+            the message before 16ms.
+        7. Count how many times each node rebroadcasts messages of each source MAC address. If a node rebroadcasts at least NETWORK_TOPOLOGY_THRESHOLD
+            times, then there is a connection. A threshold is set to avoid false positives.
+
+        Returns:
+            Tuple[List[Tuple[str, str]], bool]: (source MAC, connected MAC) pairs, and whether any source packets were found.
         """
+        # Source packets: the first packet of every index and version, if it is a RESPONSE
+        source_packets = data.drop_duplicates(subset='IndexVersionKey')
+        source_packets = source_packets[source_packets['Flags'] == '[RESP]']
 
-        # Group the DataFrame by 'Version', 'Index', and 'Payload' and get the first occurrence in each group
-        copy_df = df.copy()
-        copy_df['Payload'] = copy_df['Payload'].fillna('NoPayload')
-        copy_df = copy_df.groupby(['Version', 'Index']).first().reset_index()
-        
-        # Filter the DataFrame to include only rows with the given MAC address
-        copy_df = copy_df[copy_df['MAC'] == mac_address]
+        # Keep only source packets on the index of their MAC address. MACs that are not in the site data keep all their packets.
+        source_macs = source_packets['MAC'].astype(object)
+        mac_index = source_macs.map(index_by_mac)
+        source_packets = source_packets[mac_index.isna() | (source_packets['Index'] == mac_index)]
+        if source_packets.empty:
+            return [], False
+
+        # Pair every packet with the source packet of its message. Every message has at most one source packet.
+        source_position = pd.Index(source_packets['MessageKey']).get_indexer(data['MessageKey'])
+        paired = source_position >= 0
+        pairs = pd.DataFrame({
+            'MAC_source': source_packets['MAC'].to_numpy()[source_position[paired]],
+            'Version': data['Version'].to_numpy()[paired],
+            'MAC': data['MAC'].to_numpy()[paired],
+            'time_diff': np.abs(data['Timestamp'].to_numpy()[paired] - source_packets['Timestamp'].to_numpy()[source_position[paired]]) / 1e6,
+        })
+        # Filter out pairs with packets that originate from the source MAC address itself
+        pairs = pairs[pairs['MAC'] != pairs['MAC_source']]
+
+        # MAC address is directly connected to another node if the time difference is less than 32 milliseconds
+        directly_connected = pairs[pairs['time_diff'] < 0.032] # 32 milliseconds
+
+        # Remove all versions of a source MAC where there is at least one packet with a time_diff less than 16 milliseconds. This means that the tool has
+        # not received original packet. Received packet in this case is trickle.
+        too_early = (directly_connected['time_diff'] < 0.016).groupby([directly_connected['MAC_source'], directly_connected['Version']]).transform('any')
+        directly_connected = directly_connected[~too_early]
 
-        # Convert the DataFrame to a list of Series and return it
-        return copy_df
+        # Count occurrences of each connected MAC address per source MAC and filter out those with less than NETWORK_TOPOLOGY_THRESHOLD occurrences.
+        # It can happen that the tool does not hear original source MAC message and will translate what it hears to a connection that
+        # does not exist.
+        mac_occurrences = directly_connected.groupby(['MAC_source', 'MAC']).size()
+        mac_occurrences = mac_occurrences[mac_occurrences >= NETWORK_TOPOLOGY_THRESHOLD]
+
+        return list(mac_occurrences.index), True
     
-    def _load_site_data(self, site: str):
-        """ Load site data from a JSON file for a given site name. """
+    def _load_site_data(self, site: str) -> SiteInfo:
+        """ Get the site data from the site registry for a given site name. """
         try:
-            with open(f'.auth/{site}.json') as file:
-                return json.load(file)
+            return SiteRegistry().get(site)
         except IOError:
             return None
         
     def clean_mdr_data(self):
-        self.mdr_results = {}
+        with self.state_lock:
+            self.mdr_results = {}
+            self._publish(mdr=True)
+        self.mdr_engines = {}
         
-    def data_processing_mdr(self, source_mac: str, destination_mac: str, file_path: str, site_name: str, node_neighbor_map: Dict) -> List[Dict]:
-
-        # Load your dataset
-        df = pd.read_csv(file_path)
-        df['Timestamp'] = df['Timestamp'].apply(self.get_packet_timestamp)
+    def start_mdr_engine(self, source_mac: str, destination_mac: str, site_name: str, node_neighbor_map: Dict) -> None:
+        """ Create the streaming MDR engine for a source and destination pair. Packets are fed to it with `process_mdr_packets`. """
+        site = self._load_site_data(site_name)
+        source_index = site.index_by_mac[source_mac]
+        destination_index = site.index_by_mac[destination_mac]
         
-        site_data = self._load_site_data(site_name)
-        site_devices = site_data['devices']
+        # Find all destination node neighbors and their MAC addresses
+        neighbors = node_neighbor_map[self.nodes.get_number(self.nodes.get_id(destination_mac))]
+        neighbor_macs = [self.nodes.get_mac_by_number(number) for number in neighbors]
         
-        source_index = site_devices[source_mac.replace(":", "")]['deviceAddress']
-        destination_index = site_devices[destination_mac.replace(":", "")]['deviceAddress']
+        self.mdr_engines[f"{source_mac}->{destination_mac}"] = MDREngine(source_mac, destination_mac, source_index, destination_index, neighbor_macs)
         
-        return [self.calculate_mdr(df, source_mac, destination_mac, source_index, destination_index, node_neighbor_map)]
-    
-    def calculate_mdr(self, df, source_mac, destination_mac, source_index, destination_index, node_neighbor_map):
+    def process_mdr_packets(self, source_mac: str, destination_mac: str, file_path: str, final: bool = False) -> List[Dict]:
+        """
+        Message-Delivery-Rate of a source and destination pair for packets as they are received (see `MDREngine`).
+
+        The packets added to the packet store of the capture since the last update are fed to the MDR engine of the pair. On the final update all messages
+        that are still pending are resolved as timeouts. The result has the same format as `add_or_update_mdr_pair`, extended with
+        the number of timeouts, the number of resolved (acknowledged or timed out) messages and the sliding window series of the engine.
+        """
+        with self.mdr_lock:
+            engine = self.mdr_engines[f"{source_mac}->{destination_mac}"]
+            engine.process(self.get_packet_store(file_path).read_new(f"mdr {source_mac}->{destination_mac}"))
+            if final:
+                engine.finish()
+            
+            result = self.add_or_update_mdr_pair(source_mac, destination_mac, engine.source_messages, engine.get_acks(), engine.get_throughput())
+            result['timeouts'] = engine.timeouts
+            result['resolved'] = engine.get_resolved()
+            result['window_series'] = engine.get_window_series()
+            return [result]
         
+    def data_processing_mdr_matrix(self, file_path: str, site_name: str, node_neighbor_map: Dict) -> Tuple[List[str], np.ndarray, List[Dict]]:
+        """ Load new packets from the capture file and compute the MDR of every node pair in the MAC label map (see `calculate_mdr_matrix`). """
+        df = self.load_capture(file_path)
+        return self.calculate_mdr_matrix(df, self._load_site_data(site_name).index_by_mac, node_neighbor_map)
+    
+    def calculate_mdr_matrix(self, df: pd.DataFrame, index_by_mac: Dict[str, int], node_neighbor_map: Dict) -> Tuple[List[str], np.ndarray, List[Dict]]:
         '''
-        Done in two steps:
-        # STEP 1 # 
-            1. Find all messages that originates from the source
-            2. Separate all SET, GET messages on destination Index
-            3. Destination node will answer to SET and GET messages with incremented version. Pair all SET and GET packets with all observed acknowledgements.
-            The acknowledgement does not have to come from the destination node itself. The tool can miss it. But if the destination node has received 
-            the SET or GET message and acknowledged it (and the tool missed it), the acknowledgement message will be rebroadcasted by all other nodes.
-            4. If a pair is found to the source message, then there is an acknowledgement. Otherwise not.
-            
-        # STEP 2 #
-            1. Separate all messages that the source sent on its own index and that are not SET or GET.
-            2. Find all messages sent by the destination node.
-            3. Pair all source node messages with destination node messages. If a pair is found, then there is a direct acknowledgement.
-               If not, then the destination node has not rebroadcasted the message or the tool has not heard it.
-               A node does not rebroadcast a message if it does not receive it or if the same message is rebroadcasted by other neighbors at least 4 times 
-               before the destination node itself should rebroadcast. This is due to Trickle algorithm redundancy constant.
-               If the destination node has not rebroadcasted the source message and neighbors have rebroadcasted it at least 4 times, then it can be said
-               with high probability that the destination node has received it but dropped it due to trickle redundancy.
-            4. Isolate all unacknowledged messages
-            5. Find all neighbors of the destination node
-            6. Find all packets that the neighbors has sent
-            7. From all neighbor packets, get only those that are the same as the unacknowledged messages
-            8. Apply a 32ms (First trickle period) window to all neighbors packets from previous step and count how many times each packet is rebroadcasted
-            9. If any of those packets are rebroadcasted at least 4 times in any of the 32ms window, it can be considered that the destination node has received that 
-               message and dropped its rebroadcast.
+        Directional MDR for every pair of nodes in the MAC label map in a single pass over the capture. The rules are the same as
+        in `MDREngine`, applied to all sources and destinations at once:
+        
+            1. Find all messages that originate from any node. Source messages and throughput are counted per source.
+            2. SET and GET messages are acknowledged for the destination that owns the index they are sent on, if any ACK or RESP
+               with the next version is observed.
+            3. Other messages on the index of the source are directly acknowledged for every node that has sent the same message.
+            4. Every packet of the other messages is counted for each node that has the sender as a neighbor. A message is indirectly
+               acknowledged for a node if it is not directly acknowledged and the neighbors of that node rebroadcast it more than
+               TRICKLE_REDUNDANCY_CONSTANT times within one trickle period.
+            5. Acknowledgements are summed per (source, destination) pair.
+        
+        Returns:
+            Tuple[List[str], np.ndarray, List[Dict]]: The MAC addresses in order of their label number, the dense N x N MDR matrix in %
+            (rows are sources, NaN where the source has sent at most 10 messages and on the diagonal), and the sparse list of pairs
+            with at least one acknowledgement in the format of `add_or_update_mdr_pair`.
         '''
-        try:
-            # Find all new version messages that originates from the source
-            source_messages = self.get_first_occurrences(df, source_mac)
-            
-            # THROUGPUT Calculation
-            throughput_df = source_messages['Timestamp']
-            througput_df = throughput_df.sort_values()
-            # Find newest and oldes value
-            newest_packet = througput_df.iloc[0]
-            oldest_packet = througput_df.iloc[-1]
-            time_diff = (oldest_packet - newest_packet).total_seconds()
-            throughput = len(source_messages) / time_diff
-            
-            ## STEP 1 ##
-            # Isolate all SET and GET messages that originates from the source node
-            source_set_and_get_messages = source_messages[((source_messages['Flags'] == '[SET]') | (source_messages['Flags'] == '[GET]')) & (source_messages['Index'] == destination_index)]
-            
-            # The destination must answer with new version messages if it receives a SET or a GET message from the source
-            # To each SET and GET message that originates from the source, add a new column with the next version that corresponds to the version 
-            # that the destination node must answer with
-            source_set_and_get_messages = source_set_and_get_messages.copy()
-            source_set_and_get_messages.loc[:, 'Next_Version'] = source_set_and_get_messages['Version'] + 1
-            
-            # Isolate all RESP and ACK from the dataframe before merging
-            all_ack_and_resp_packets = df[((df['Flags'] == '[ACK]') | (df['Flags'] == '[RESP]'))]
-            
-            # If the destination node has received the SET or GET message by the source node, we can either catch the answer from the destination node itself
-            # or from other nodes that has received the answer of the destination node and started re-broadcasting.
-            # For this reason, we need to pair all SET and GET messages with all observed acknowledgements.
-            merged_set_and_get_packets = pd.merge(source_set_and_get_messages, all_ack_and_resp_packets, 
-                                        left_on=['Index', 'Next_Version'], 
-                                        right_on=['Index', 'Version'], how='left', indicator=True)  # indicator adds _merge column
-            # If a source message is rebroadcasted many times by many nodes it will be merged with all of them. We need only one of them to
-            # understand if the destination node has received the message or not. So, we need to drop duplicates based on 'Index' and 'Version'
-            merged_set_and_get_messages = merged_set_and_get_packets.drop_duplicates(subset=['Index', 'Version_x'])
-            
-            # From the merge, find all acknowledged packets and unacknowledged packets
-            acknowledged_merge_set_and_get_messages = merged_set_and_get_messages[merged_set_and_get_messages['_merge'] == 'both']
-            
-            unacknowledged_merge_set_and_get_messages = merged_set_and_get_messages[merged_set_and_get_messages['_merge'] == 'left_only']
-            # Rename columns for easier manipulation
-            unacknowledged_merge_set_and_get_messages = unacknowledged_merge_set_and_get_messages.copy()
-            unacknowledged_merge_set_and_get_messages.rename(columns={'Payload_x': 'Payload', 'Version_x': 'Version'}, inplace=True)
-            
-            ## STEP 2 ## Other messages
-            
-            # Isolate all other messages that originates from the source and on its own index. All other messages are not relevant because they would be meant for other nodes
-            # and not the destination node.
-            other_messages = source_messages[(source_messages['Flags'] != '[SET]') & (source_messages['Flags'] != '[GET]') & (source_messages['Index'] == source_index)]
-            
-            # Find all messages that are sent from destination
-            destination_messages = self.filter_packets_by_mac(df, destination_mac)
-            
-            # Pair all other messages with all observed acknowledgements from the destination node
-            merged_other_messages = pd.merge(other_messages, destination_messages, 
-                                        left_on=['Index', 'Version', 'Payload'], 
-                                        right_on=['Index', 'Version', 'Payload'], how='left', indicator=True)
-            # Find all acknowledged packets and unacknowledged packets
-            acknowledged_other_messages = merged_other_messages[merged_other_messages['_merge'] == 'both']
-            unacknowledged_other_messages = merged_other_messages[merged_other_messages['_merge'] == 'left_only']
-            
-            acks =  (len(acknowledged_merge_set_and_get_messages) + len(acknowledged_other_messages))
-            total_messages = len(source_messages)
-            
-            # Find all destination node neighbors
-            neighbors = node_neighbor_map[self.mac_label_map[destination_mac]['number']]
-            
-            # If there is no neighbors then there is nothing else to do. Return the mdr
-            if not neighbors:
-                return self.add_or_update_mdr_pair(source_mac, destination_mac, total_messages, acks, throughput)
-            # Get MAC addresses of all neighbors
-            neighbor_macs = [mac for mac, info in self.mac_label_map.items() if info['number'] in neighbors]
-            
-            # Get packets that belong to destination node neighbors
-            neighbor_packets = df[df['MAC'].isin(neighbor_macs)]
-            neighbor_packets = neighbor_packets.copy()
-            neighbor_packets['Payload'] = neighbor_packets['Payload'].fillna('NoPayload')
-            
-            # From all neighbor packets, get only those that are the same as the unacknowledged messages
-            criteria = unacknowledged_other_messages[['Version', 'Index', 'Payload']]
-            neighbor_packets = neighbor_packets.merge(criteria, on=['Version', 'Index', 'Payload'], how='inner')
-            
-            # Apply rolling window of 32ms to all neighbor packets with unique version and index, and count how many times each packet is rebroadcasted
-            neighbor_packets.reset_index(inplace=True)
-            grouped_packets = neighbor_packets.groupby(['Index', 'Version'])
-            rolling_window_result = grouped_packets.apply(lambda group: group.rolling(window=pd.Timedelta(TRICKLE_I_MIN_MS, 'ms'), on='Timestamp').count(), include_groups=False)
-            
-            # Get the maximum number of times each packet is rebroadcasted. Isolate those packets that are rebroadcasted more than 4 times. These are indirectly acknowledged.
-            grouped_packets = rolling_window_result.groupby(['Index', 'Version'])
-            max_rebroadcasts_per_group = pd.DataFrame(grouped_packets.apply(lambda group: group['index'].max()), columns=['Max'])
-            indirect_acks = max_rebroadcasts_per_group[max_rebroadcasts_per_group['Max'] > TRICKLE_REDUNDANCY_CONSTANT]
-            
-            acks += len(indirect_acks)
-            
-            return self.add_or_update_mdr_pair(source_mac, destination_mac, total_messages, acks, throughput)
-        except: 
-            return self.add_or_update_mdr_pair(source_mac, destination_mac, 0, 0, 0)
+        # Rows and columns are node ids
+        macs = self.nodes.get_macs()
+        mac_count = len(macs)
+        mac_ids = {mac: mac_id for mac_id, mac in enumerate(macs)}
+        # Node that owns each index
+        index_owner = {index_by_mac[mac]: mac_id for mac, mac_id in mac_ids.items() if mac in index_by_mac}
+        own_index = np.array([index_by_mac.get(mac, -1) for mac in macs], dtype=np.int64)
+        
+        # Find all new version messages and the node they originate from
+        source_messages = df.drop_duplicates(subset='IndexVersionKey')
+        source_ids = source_messages['MAC'].astype(object).map(mac_ids)
+        source_messages = source_messages[source_ids.notna()]
+        source_ids = source_ids[source_ids.notna()].to_numpy(dtype=np.int64)
+        
+        # THROUGHPUT Calculation per source
+        total_messages = np.bincount(source_ids, minlength=mac_count)
+        timestamps = source_messages['Timestamp'].to_numpy()
+        first_times = np.full(mac_count, np.iinfo(np.int64).max)
+        last_times = np.full(mac_count, np.iinfo(np.int64).min)
+        np.minimum.at(first_times, source_ids, timestamps)
+        np.maximum.at(last_times, source_ids, timestamps)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            throughput = np.where(total_messages > 1, total_messages / ((last_times - first_times) / 1e6), 0)
+        
+        acks = np.zeros((mac_count, mac_count), dtype=np.int64)
+        
+        ## STEP 1 ## SET and GET messages, acknowledged for the owner of the index by an ACK or RESP with the next version
+        is_set_or_get = source_messages['Flags'].isin(['[SET]', '[GET]']).to_numpy()
+        set_and_get_messages = source_messages[is_set_or_get]
+        destination_ids = set_and_get_messages['Index'].map(index_owner)
+        answer_keys = df.loc[df['Flags'].isin(['[ACK]', '[RESP]']), 'IndexVersionKey']
+        acknowledged = ((set_and_get_messages['IndexVersionKey'] + 1).isin(answer_keys) & destination_ids.notna()).to_numpy()
+        np.add.at(acks, (source_ids[is_set_or_get][acknowledged], destination_ids[acknowledged].to_numpy(dtype=np.int64)), 1)
+        
+        ## STEP 2 ## Other messages on the index of the source
+        is_other = ~is_set_or_get & (source_messages['Index'].to_numpy() == own_index[source_ids])
+        other_messages = source_messages[is_other]
+        other_source_ids = source_ids[is_other]
+        
+        # All packets of the other messages, with the number of the message and the id of the node that sent the packet
+        packets = df[df['MessageKey'].isin(other_messages['MessageKey'])]
+        packet_message = pd.Index(other_messages['MessageKey']).get_indexer(packets['MessageKey'])
+        packet_mac = packets['MAC'].astype(object).map(mac_ids)
+        known = packet_mac.notna().to_numpy()
+        packet_message = packet_message[known]
+        packet_mac = packet_mac[known].to_numpy(dtype=np.int64)
+        packet_times = packets['Timestamp'].to_numpy()[known]
+        
+        # Direct acknowledgement: the destination has sent the message itself
+        direct_keys = np.unique(packet_message * mac_count + packet_mac)
+        
+        # Indirect acknowledgement: count every packet for each node that has its sender as a neighbor
+        neighbor_edges = pd.DataFrame([(self.nodes.get_id_by_number(neighbor), self.nodes.get_id_by_number(number)) for number, neighbors in node_neighbor_map.items()
+                                       if 0 < number <= mac_count for neighbor in neighbors if 0 < neighbor <= mac_count],
+                                      columns=['sender', 'destination'], dtype=np.int64)
+        heard = pd.DataFrame({'message': packet_message, 'sender': packet_mac, 'Timestamp': packet_times}).merge(neighbor_edges, on='sender')
+        group_keys, max_rebroadcasts = max_packets_in_window((heard['message'] * mac_count + heard['destination']).to_numpy(),
+                                                             heard['Timestamp'].to_numpy(), TRICKLE_I_MIN_MS * 1000)
+        indirect_keys = group_keys[max_rebroadcasts > TRICKLE_REDUNDANCY_CONSTANT]
+        
+        acknowledged_keys = np.union1d(direct_keys, indirect_keys)
+        np.add.at(acks, (other_source_ids[acknowledged_keys // mac_count], acknowledged_keys % mac_count), 1)
+        
+        # MDR is only meaningful once the source has sent more than 10 messages
+        np.fill_diagonal(acks, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mdr_matrix = np.where((total_messages > 10)[:, None], acks / total_messages[:, None] * 100, np.nan)
+        np.fill_diagonal(mdr_matrix, np.nan)
+        
+        edges = [{
+            "source": macs[source_id],
+            "destination": macs[destination_id],
+            "source_messages": int(total_messages[source_id]),
+            "acks": int(acks[source_id, destination_id]),
+            "throughput": float(throughput[source_id]) if total_messages[source_id] > 10 else 0,
+            "mdr": float(mdr_matrix[source_id, destination_id]) if total_messages[source_id] > 10 else None
+        } for source_id, destination_id in zip(*np.nonzero(acks))]
+        
+        return macs, mdr_matrix, edges
     
     def add_or_update_mdr_pair(self, source, destination, source_messages, acks, throughput):
+        """ Update the MDR result of a pair and publish it. Returns a copy of the result that the caller may extend. """
         key = f"{source}->{destination}"
         
-        # If the pair is new, initialize its data
-        if key not in self.mdr_results:
-            self.mdr_results[key] = {
-                "source": source,
-                "destination": destination,
-                "source_messages": source_messages,
-                "acks": acks,
-                "throughput": throughput if ((source_messages) > 10) else 0,
-                "mdr": (acks / (source_messages) * 100) if ((source_messages) > 10) else None
-            }
-        elif (source_messages) > 10:
-            # Update existing data
-            entry = self.mdr_results[key]
-            entry["source_messages"] = source_messages
-            entry["acks"] = acks
-            entry["throughput"] = throughput
-            entry["mdr"] = (entry["acks"] / entry["source_messages"] * 100) if (entry["source_messages"] > 10) else None
-            
-        return self.mdr_results[key]
-            
-    @staticmethod
-    def filter_packets_by_mac(df, mac_address):
-        """
-        Filter packets in the dataframe by MAC address, ensuring unique versions and payloads
-        """
-        return df[df['MAC'] == mac_address].drop_duplicates(subset=['Version', 'Payload', 'Index'])
+        with self.state_lock:
+            # If the pair is new, initialize its data
+            if key not in self.mdr_results:
+                self.mdr_results[key] = MappingProxyType({
+                    "source": source,
+                    "destination": destination,
+                    "source_messages": source_messages,
+                    "acks": acks,
+                    "throughput": throughput if ((source_messages) > 10) else 0,
+                    "mdr": (acks / (source_messages) * 100) if ((source_messages) > 10) else None
+                })
+                self._publish(mdr=True)
+            elif (source_messages) > 10:
+                # Update existing data, as a new entry so the published snapshot is not changed
+                entry = dict(self.mdr_results[key])
+                entry["source_messages"] = source_messages
+                entry["acks"] = acks
+                entry["throughput"] = throughput
+                entry["mdr"] = (entry["acks"] / entry["source_messages"] * 100) if (entry["source_messages"] > 10) else None
+                self.mdr_results[key] = MappingProxyType(entry)
+                self._publish(mdr=True)
+            
+            return dict(self.mdr_results[key])
+            
+    def data_processing_latency_map(self, file_path: str) -> Tuple[List[str], np.ndarray, List[Dict]]:
+        """ Load new packets from the capture file and compute the latency from every node to every other node (see `calculate_latency_map`). """
+        return self.calculate_latency_map(self.load_capture(file_path))
     
-    def calculate_latency(self, source_mac, destination_mac, file_path: str, site_name: str, node_neighbor_map: Dict):
+    def calculate_latency_map(self, df: pd.DataFrame) -> Tuple[List[str], np.ndarray, List[Dict]]:
         '''
-        This function calculates Latency between two nodes. 
-        Latency for a message is calculated from the time the message is transmitted on the air by the source node
-        to the time any of the neighbors of the destination node rebroadcasts it.
-        
-            1. Find all messages that originates from the source
-            2. Separate all SET, GET messages on destination Index
-            3. Separate all messages that the source sent on its own index and that are not SET or GET.
-            ** Messages from steps 2 and 3 are all messages that destination node should acknowledge or rebroadcast.
-            ** Since we are calculating the latency up to the destination node, we are not looking for its own acknowledgements or rebroadcasts.
-            ** We are looking for re-rebroadcasts of the source messages by the destination node neighbors.
-            4. Find all neighbors of the destination node
-            5. Find all packets that the neighbors has sent
-            6. From all neighbor packets, get only those that are the same as source messages
-            7. Pair all neighbor packets with their corresponding source message
-            8. Drop duplicates with same MAC address. We are only interested in the first occurrence, which would be the
-            soonest one.
-            9. Calculate time difference between source messages and neighbor packets
-            10. For each message, find the minimum and maximum time difference
-            11. Calculate average latency and maximum latency
+        First-rebroadcast delay from every source to every other node in a single pass over the capture.
+        
+            1. Find all messages and the node they originate from (first packet of every index and version).
+            2. Pair every packet with the first packet of its message.
+            3. Keep only the first packet of each node per message. The latency of a message from its source to a node is the time until
+               the node first rebroadcasts it.
+            4. Summarize the latencies per (source, node) pair.
+        
+        Returns:
+            Tuple[List[str], np.ndarray, List[Dict]]: The MAC addresses in order of their label number, the dense N x N matrix of median
+            latencies in milliseconds (rows are sources, NaN where there are no samples), and per pair with samples a summary with the
+            number of samples, min, mean, the LATENCY_MAP_PERCENTILES percentiles and max.
         '''
-        print(f"Calculating RRT from {source_mac} to {destination_mac}")
-        try:
-            df = self.load_data(file_path)
-            # Convert timestamps to a Pandas compatible format for easy time calculations
-            df['Timestamp'] = df['Timestamp'].apply(self.get_packet_timestamp)
-            
-            site_data = self._load_site_data(site_name)
-            site_devices = site_data['devices']
-            
-            source_index = site_devices[source_mac.replace(":", "")]['deviceAddress']
-            destination_index = site_devices[destination_mac.replace(":", "")]['deviceAddress']
-            
-            
-            # Find all new version packets that originates from the source MAC
-            source_node_messages = self.get_first_occurrences(df, source_mac)
-            
-            # Find only SET, GET messages and all other messages that are sent on the source index. 
-            # These are all messages that destination node should acknowledge or rebroadcast.
-            source_node_set_get_messages = source_node_messages[((source_node_messages['Flags'] == '[SET]') | (source_node_messages['Flags'] == '[GET]')) & (source_node_messages['Index'] == destination_index)]
-            source_node_other_messages = source_node_messages[(source_node_messages['Flags'] != '[SET]') & (source_node_messages['Flags'] != '[GET]') & (source_node_messages['Index'] == source_index)]
-            # Join all source node messages together
-            all_source_node_messages = pd.concat([source_node_set_get_messages, source_node_other_messages])
-            
-            # Find all destination node neighbors
-            destination_node_neighbors = node_neighbor_map[self.mac_label_map[destination_mac]['number']]
-            # Get MAC addresses of all neighbors
-            destination_neighbor_macs = [mac for mac, info in self.mac_label_map.items() if info['number'] in destination_node_neighbors]
-            
-            # Get packets that belong to destination node neighbors
-            neighbor_packets = df[df['MAC'].isin(destination_neighbor_macs)]
-            neighbor_packets = neighbor_packets.copy()
-            neighbor_packets['Payload'] = neighbor_packets['Payload'].fillna('NoPayload')
-            
-            # From all neighbor packets, get only those that are the same as source messages
-            criteria = all_source_node_messages[['Version', 'Index', 'Payload']]
-            neighbor_packets = neighbor_packets.merge(criteria, on=['Version', 'Index', 'Payload'], how='inner')
-            
-            # Pair all neighbor packets with their corresponding source message
-            merged_df = pd.merge(all_source_node_messages, neighbor_packets, on=['Version', 'Index', 'Payload'], how='inner')
-            # Drop duplicates with same MAC address. We are only interested in the first occurrence, which would be the
-            # soonest one.
-            merged_df_mac_filtered = merged_df.drop_duplicates(subset=['Version', 'Index', 'Payload', 'MAC_y'])
-            # Calculate time difference between source messages and neighbor packets
-            merged_df_mac_filtered = merged_df_mac_filtered.copy()
-            merged_df_mac_filtered['TimeDiff'] = (merged_df_mac_filtered['Timestamp_y'] - merged_df_mac_filtered['Timestamp_x']).dt.total_seconds() * 1000
-            
-            # Group paired DataFrame by 'Version', 'Index', and 'Payload' and get the minimum and maximum time difference
-            merged_df_grouped = merged_df_mac_filtered.groupby(['Version', 'Index', 'Payload'])
-            merged_df_min_max = merged_df_grouped['TimeDiff'].agg(['min', 'max']).reset_index()
-            
-            # Calculate average latency and maximum latency
-            avg_mdr = merged_df_min_max['min'].mean()
-            max_mdr = merged_df_min_max['max'].max()
-            
-            return list(merged_df_min_max['min']), avg_mdr, max_mdr
-        except:
-            return [], 0, 0
\ No newline at end of file
+        macs = self.nodes.get_macs()
+        mac_ids = {mac: mac_id for mac_id, mac in enumerate(macs)}
+        
+        # Find all new version messages and the node they originate from
+        source_messages = df.drop_duplicates(subset='IndexVersionKey')
+        
+        # Pair every packet with the first packet of its message
+        source_position = pd.Index(source_messages['MessageKey']).get_indexer(df['MessageKey'])
+        paired = source_position >= 0
+        packets = pd.DataFrame({
+            'message': source_position[paired],
+            'source': source_messages['MAC'].astype(object).map(mac_ids).to_numpy()[source_position[paired]],
+            'node': df['MAC'].astype(object).map(mac_ids).to_numpy()[paired],
+            'latency': (df['Timestamp'].to_numpy()[paired] - source_messages['Timestamp'].to_numpy()[source_position[paired]]) / 1000,
+        }).dropna(subset=['source', 'node'])
+        packets = packets[packets['source'] != packets['node']]
+        
+        # Only the first packet of each node counts, which would be the soonest one
+        packets = packets.drop_duplicates(subset=['message', 'node'])
+        
+        grouped_latencies = packets.groupby(['source', 'node'])['latency']
+        summary = grouped_latencies.agg(['count', 'min', 'mean', 'max'])
+        percentiles = grouped_latencies.quantile([percentile / 100 for percentile in LATENCY_MAP_PERCENTILES]).unstack()
+        
+        latency_matrix = np.full((len(macs), len(macs)), np.nan)
+        median = grouped_latencies.median()
+        latency_matrix[median.index.get_level_values('source').astype(int), median.index.get_level_values('node').astype(int)] = median.to_numpy()
+        
+        pairs = []
+        for (source_id, node_id), row in summary.iterrows():
+            pair = {"source": macs[int(source_id)], "destination": macs[int(node_id)], "samples": int(row['count']),
+                    "min": float(row['min']), "mean": float(row['mean'])}
+            for percentile in LATENCY_MAP_PERCENTILES:
+                pair[f"p{percentile}"] = float(percentiles.loc[(source_id, node_id), percentile / 100])
+            pair["max"] = float(row['max'])
+            pairs.append(pair)
+        
+        return macs, latency_matrix, pairs
+    
+    def start_latency_engine(self, source_mac: str, destination_mac: str, site_name: str, node_neighbor_map: Dict) -> LatencyEngine:
+        """ Create the streaming latency engine for a source and destination pair. Subscribe to the returned engine to receive samples. """
+        site = self._load_site_data(site_name)
+        source_index = site.index_by_mac[source_mac]
+        destination_index = site.index_by_mac[destination_mac]
+        
+        # Find all destination node neighbors and their MAC addresses
+        destination_node_neighbors = node_neighbor_map[self.nodes.get_number(self.nodes.get_id(destination_mac))]
+        destination_neighbor_macs = [self.nodes.get_mac_by_number(number) for number in destination_node_neighbors]
+        
+        engine = LatencyEngine(source_mac, source_index, destination_index, destination_neighbor_macs)
+        self.latency_engines[f"{source_mac}->{destination_mac}"] = engine
+        return engine
+    
+    def process_latency_packets(self, source_mac: str, destination_mac: str, file_path: str, final: bool = False) -> Tuple[float, float]:
+        """
+        Latency of a source and destination pair for packets as they are received (see `LatencyEngine`).
+
+        The packets added to the packet store of the capture since the last update are fed to the latency engine of the pair, which pushes the latencies
+        of finalized messages to its subscribers. On the final update all messages in flight are finalized.
+
+        Returns:
+            Tuple[float, float]: The average and maximum latency of the run so far in milliseconds.
+        """
+        with self.latency_lock:
+            engine = self.latency_engines[f"{source_mac}->{destination_mac}"]
+            engine.process(self.get_packet_store(file_path).read_new(f"latency {source_mac}->{destination_mac}"))
+            if final:
+                engine.finish()
+            return engine.get_avg_latency(), engine.get_max_latency()
@@ -0,0 +1,62 @@
+from typing import List, Tuple
+
+class EdgeStore:
+    """
+    Undirected topology edges between MAC addresses.
+
+    Nodes are kept in an adjacency map and nodes without any edge in a set of isolated nodes, so adding and removing an
+    edge are O(1). The store does not expire edges itself: they are added and removed by the edge deltas of the
+    `TopologyEngine`, whose evidence window decides how long an edge lives.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.adjacency = {}
+        self.isolated = set()
+        self.edges = set()
+
+    def add_node(self, node: str) -> None:
+        """ Add a node without edges. Nothing changes if the node is known. """
+        if node not in self.adjacency:
+            self.adjacency[node] = set()
+            self.isolated.add(node)
+
+    def add(self, node1: str, node2: str) -> bool:
+        """ Add the edge and its nodes. Returns whether the edge is new. """
+        edge = self.get_edge_key(node1, node2)
+        if edge in self.edges:
+            return False
+        for node, neighbor in (edge, edge[::-1]):
+            self.add_node(node)
+            self.adjacency[node].add(neighbor)
+            self.isolated.discard(node)
+        self.edges.add(edge)
+        return True
+
+    def remove(self, node1: str, node2: str) -> bool:
+        """ Remove the edge, its nodes stay known. Returns whether the edge existed. """
+        edge = self.get_edge_key(node1, node2)
+        if edge not in self.edges:
+            return False
+        self.edges.discard(edge)
+        for node, neighbor in (edge, edge[::-1]):
+            self.adjacency[node].discard(neighbor)
+            if not self.adjacency[node]:
+                self.isolated.add(node)
+        return True
+
+    def get_edges(self) -> List[Tuple[str, str]]:
+        return list(self.edges)
+
+    def get_nodes(self) -> List[str]:
+        return list(self.adjacency)
+
+    def get_isolated_nodes(self) -> set:
+        return self.isolated
+
+    @staticmethod
+    def get_edge_key(node1: str, node2: str) -> Tuple[str, str]:
+        """ Edges are stored with their nodes sorted. """
+        return (node1, node2) if node1 <= node2 else (node2, node1)
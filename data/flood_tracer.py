@@ -0,0 +1,189 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Tuple, Optional, Iterable
+from data.packet_store import PacketColumns
+from config import FLOOD_TRACE_TIMEOUT_SECONDS, FLOOD_TRACE_MAX_MESSAGES, FLOOD_TRACE_RETENTION_SECONDS
+
+class FloodTrace:
+    """ How one message, an (Index, Version) pair, spread through the mesh. """
+
+    def __init__(self, index_version_key: int, message_key: int, source_mac: str, source_time: int, flags: str, index: int, version: int) -> None:
+        self.index_version_key = index_version_key
+        self.message_key = message_key
+        self.source_mac = source_mac
+        self.source_time = source_time
+        self.flags = flags
+        self.index = index
+        self.version = version
+        # (timestamp, MAC address) of every packet of the message, ordered by time once the trace is closed
+        self.timeline = [(source_time, source_mac)]
+        # Filled in when the trace is closed
+        self.parents = {}
+        self.coverage_time = {}
+        self.suppressed = []
+        self.time_to_full_coverage = None
+
+    def get_transmissions(self) -> int:
+        return len(self.timeline)
+
+    def get_transmitters(self) -> List[str]:
+        """ Returns the MAC addresses that transmitted the message, in order of their first transmission. """
+        return list(self.parents)
+
+    def get_summary(self) -> Dict:
+        return {"index": self.index, "version": self.version, "flags": self.flags, "source": self.source_mac,
+                "source_time": self.source_time, "transmissions": self.get_transmissions(), "transmitters": len(self.parents),
+                "covered": len(self.coverage_time), "suppressed": len(self.suppressed),
+                "time_to_full_coverage_ms": None if self.time_to_full_coverage is None else self.time_to_full_coverage / 1000}
+
+class FloodTracer:
+    """
+    Streaming propagation trace of every message in a capture.
+
+    Packets are consumed in arrival order, which may differ slightly from the order of their timestamps.
+
+    1. The first packet of an index and version (marked by the `PacketStore`) opens a trace, its MAC address is the source. Later packets of the same
+       message (same MessageKey) are added to the timeline of the trace.
+    2. When no packet of the message can be expected any more, `timeout_seconds` after the source packet, the trace is closed.
+       Every open trace is closed at its own deadline, whatever the order in which the traces were opened:
+       - The timeline is ordered by time.
+       - Propagation tree: the parent of a transmitter is its neighbor in the topology graph that transmitted first, before it.
+         A transmitter without such a neighbor has no parent, the tool has not heard the packet it received.
+       - A node is covered at the first transmission of itself or a neighbor. Nodes that were covered but never
+         transmitted have suppressed their rebroadcast (trickle redundancy suppression).
+       - The time to full coverage is the time from the source packet until every node of the graph with an edge
+         (and every transmitter) was covered, None if some node was never covered.
+    3. Closed traces are kept in order of their source time and can be queried by message or time range. They are evicted
+       when they are older than `retention_seconds` relative to the newest packet, or when there are more than `max_messages`.
+
+    The topology graph is set with `set_graph` and is used for the traces closed after it.
+    """
+
+    def __init__(self, timeout_seconds: float = FLOOD_TRACE_TIMEOUT_SECONDS, max_messages: int = FLOOD_TRACE_MAX_MESSAGES,
+                 retention_seconds: float = FLOOD_TRACE_RETENTION_SECONDS) -> None:
+        self.timeout_us = int(timeout_seconds * 1e6)
+        self.max_messages = max_messages
+        self.retention_us = int(retention_seconds * 1e6)
+        self.neighbors = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """ Forget all traces. The topology graph stays set. """
+        # Traces whose timeout has not passed yet by IndexVersionKey, and a heap of their (source time, IndexVersionKey)
+        # so the trace with the earliest deadline is found first
+        self.open_traces = {}
+        self.deadlines = []
+        # Closed traces in order of their source time, with their source times for time range queries
+        self.traces = []
+        self.trace_times = []
+        self.traces_by_key = {}
+        self.latest_time = None
+
+    def set_graph(self, edges: Iterable[Tuple[str, str]]) -> None:
+        """ Set the topology graph, as undirected edges between MAC addresses. """
+        neighbors = {}
+        for mac1, mac2 in edges:
+            neighbors.setdefault(mac1, set()).add(mac2)
+            neighbors.setdefault(mac2, set()).add(mac1)
+        self.neighbors = neighbors
+
+    def process(self, packets: PacketColumns) -> None:
+        """ Consume new packets in arrival order and close the traces whose timeout has passed. """
+        for time_us, mac, flags, index, version, index_version_key, message_key, first in packets.rows():
+            if self.latest_time is None or time_us > self.latest_time:
+                self.latest_time = time_us
+            self._close_traces(self.latest_time)
+
+            trace = self.open_traces.get(index_version_key)
+            if trace is not None:
+                # Packets with the same index and version but a different payload are not the same message
+                if message_key == trace.message_key:
+                    trace.timeline.append((time_us, mac))
+            elif first:
+                self.open_traces[index_version_key] = FloodTrace(index_version_key, message_key, mac, time_us, flags, index, version)
+                heapq.heappush(self.deadlines, (time_us, index_version_key))
+
+        self._evict()
+
+    def finish(self) -> None:
+        """ Close all open traces, e.g. when the capture has ended. """
+        while self.deadlines:
+            self._close_oldest()
+        self._evict()
+
+    def get_trace(self, index: int, version: int) -> Optional[FloodTrace]:
+        """ Returns the closed trace of a message, None if it is unknown, still open or evicted. """
+        return self.traces_by_key.get((index << 32) | version)
+
+    def get_traces(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> List[FloodTrace]:
+        """ Returns the closed traces with a source time in [start_us, end_us), in order of their source time. """
+        low = 0 if start_us is None else bisect_left(self.trace_times, start_us)
+        high = len(self.traces) if end_us is None else bisect_left(self.trace_times, end_us)
+        return self.traces[low:high]
+
+    def get_metrics(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> Dict:
+        """
+        Returns aggregate metrics of the closed traces with a source time in [start_us, end_us): the number of messages,
+        the mean transmissions per message, the fraction of messages that reached full coverage with the mean and maximum
+        time to full coverage in milliseconds, and the mean number of suppressed rebroadcasts per message.
+        """
+        traces = self.get_traces(start_us, end_us)
+        coverage_times = [trace.time_to_full_coverage / 1000 for trace in traces if trace.time_to_full_coverage is not None]
+        count = len(traces)
+        return {"messages": count,
+                "transmissions_per_message": sum(trace.get_transmissions() for trace in traces) / count if count else None,
+                "full_coverage_fraction": len(coverage_times) / count if count else None,
+                "mean_time_to_full_coverage_ms": sum(coverage_times) / len(coverage_times) if coverage_times else None,
+                "max_time_to_full_coverage_ms": max(coverage_times) if coverage_times else None,
+                "suppressions_per_message": sum(len(trace.suppressed) for trace in traces) / count if count else None}
+
+    def _close_traces(self, now: int) -> None:
+        """ Close every open trace whose timeout has passed at `now`. """
+        while self.deadlines and now - self.deadlines[0][0] > self.timeout_us:
+            self._close_oldest()
+
+    def _close_oldest(self) -> None:
+        """ Close the open trace with the earliest source time. """
+        _, index_version_key = heapq.heappop(self.deadlines)
+        trace = self.open_traces.pop(index_version_key)
+        trace.timeline.sort()
+        source_time = trace.source_time
+
+        # First transmission of every transmitter, in order of time, and the neighbor that transmitted before it first
+        first_times = {}
+        for time_us, mac in trace.timeline:
+            first_times.setdefault(mac, time_us)
+        for mac, time_us in first_times.items():
+            earlier = [neighbor for neighbor in self.neighbors.get(mac, ()) if first_times.get(neighbor, time_us) < time_us]
+            trace.parents[mac] = min(earlier, key=first_times.get) if earlier and mac != trace.source_mac else None
+
+        # A node is covered when it or one of its neighbors has transmitted
+        coverage_time = dict(first_times)
+        for mac, time_us in first_times.items():
+            for neighbor in self.neighbors.get(mac, ()):
+                if time_us < coverage_time.get(neighbor, time_us + 1):
+                    coverage_time[neighbor] = time_us
+        trace.coverage_time = coverage_time
+        trace.suppressed = [mac for mac in coverage_time if mac not in first_times]
+        if all(mac in coverage_time for mac in self.neighbors):
+            trace.time_to_full_coverage = max(coverage_time.values()) - source_time
+
+        # Keep the closed traces sorted by source time, a trace may be closed after a later one that arrived earlier
+        index = bisect_right(self.trace_times, source_time)
+        self.traces.insert(index, trace)
+        self.trace_times.insert(index, source_time)
+        self.traces_by_key[trace.index_version_key] = trace
+
+    def _evict(self) -> None:
+        """ Drop the oldest closed traces while there are too many or they are older than the retention. """
+        count = max(len(self.traces) - self.max_messages, 0)
+        if self.latest_time is not None:
+            count = max(count, bisect_right(self.trace_times, self.latest_time - self.retention_us))
+        if count == 0:
+            return
+        for trace in self.traces[:count]:
+            # The index and version may have started a new message since, which is traced under the same key
+            if self.traces_by_key.get(trace.index_version_key) is trace:
+                del self.traces_by_key[trace.index_version_key]
+        del self.traces[:count]
+        del self.trace_times[:count]
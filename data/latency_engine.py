@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from typing import List, Callable
+from data.packet_store import PacketColumns
+from config import LATENCY_FLOOD_TIMEOUT_SECONDS, LATENCY_MAX_IN_FLIGHT_MESSAGES
+
+class InFlightMessage:
+    """ A source message whose flood has not timed out yet. """
+
+    def __init__(self, time_us: int, message_key: int) -> None:
+        self.time = time_us
+        self.message_key = message_key
+        # Timestamp of the first packet of the message from each neighbor of the destination
+        self.neighbor_times = {}
+
+class LatencyEngine:
+    """
+    Streaming latency between a source and a destination node.
+
+    Packets are consumed in arrival order:
+
+    1. The first packet of an index and version (marked by the `PacketStore`) sent by the source is a source message, if it is a SET or GET message on the
+       destination index or another message on the source index.
+    2. For every source message, the first packet of each neighbor of the destination is recorded.
+    3. When the flood of a message times out, its minimum and maximum latency in milliseconds are finalized and pushed to
+       the subscribers.
+
+    Memory is bounded by the number of messages in flight. When there are more than `max_in_flight` of them,
+    the oldest one is finalized early.
+    """
+
+    def __init__(self, source_mac: str, source_index: int, destination_index: int, neighbor_macs: List[str],
+                 timeout_seconds: float = LATENCY_FLOOD_TIMEOUT_SECONDS, max_in_flight: int = LATENCY_MAX_IN_FLIGHT_MESSAGES) -> None:
+        self.source_mac = source_mac
+        self.source_index = source_index
+        self.destination_index = destination_index
+        self.neighbor_macs = set(neighbor_macs)
+        self.timeout_us = int(timeout_seconds * 1e6)
+        self.max_in_flight = max_in_flight
+
+        # Source messages by IndexVersionKey, oldest first
+        self.in_flight = OrderedDict()
+        self.subscribers = []
+        self.latest_time = None
+
+        self.sample_count = 0
+        self.min_latency_sum = 0
+        self.max_latency = 0
+
+    def subscribe(self, callback: Callable[[List[float], List[float]], None]) -> None:
+        """ Register a callback that receives the minimum and maximum latencies of newly finalized messages. """
+        self.subscribers.append(callback)
+
+    def get_avg_latency(self) -> float:
+        return self.min_latency_sum / self.sample_count if self.sample_count else float('nan')
+
+    def get_max_latency(self) -> float:
+        return self.max_latency if self.sample_count else float('nan')
+
+    def process(self, packets: PacketColumns) -> None:
+        """ Consume new packets in arrival order and push the latencies of messages whose flood timed out. """
+        min_latencies = []
+        max_latencies = []
+        for time_us, mac, flags, index, _, index_version_key, message_key, first in packets.rows():
+            if self.latest_time is None or time_us > self.latest_time:
+                self.latest_time = time_us
+            self._finalize(self.latest_time, min_latencies, max_latencies)
+
+            if first and mac == self.source_mac and self._is_source_message(flags, index):
+                self.in_flight[index_version_key] = InFlightMessage(time_us, message_key)
+                if len(self.in_flight) > self.max_in_flight:
+                    self._finalize_oldest(min_latencies, max_latencies)
+
+            message = self.in_flight.get(index_version_key)
+            if message is not None and message.message_key == message_key and mac in self.neighbor_macs and mac not in message.neighbor_times:
+                message.neighbor_times[mac] = time_us
+
+        self._publish(min_latencies, max_latencies)
+
+    def finish(self) -> None:
+        """ Finalize all messages in flight, e.g. when the analysis is stopped. """
+        min_latencies = []
+        max_latencies = []
+        while self.in_flight:
+            self._finalize_oldest(min_latencies, max_latencies)
+        self._publish(min_latencies, max_latencies)
+
+    def _is_source_message(self, flags: str, index: int) -> bool:
+        """ SET and GET messages on the destination index and all other messages on the source index. """
+        if flags in ('[SET]', '[GET]'):
+            return index == self.destination_index
+        return index == self.source_index
+
+    def _finalize(self, now: int, min_latencies: List[float], max_latencies: List[float]) -> None:
+        """ Finalize messages whose flood timed out. """
+        while self.in_flight and now - next(iter(self.in_flight.values())).time > self.timeout_us:
+            self._finalize_oldest(min_latencies, max_latencies)
+
+    def _finalize_oldest(self, min_latencies: List[float], max_latencies: List[float]) -> None:
+        _, message = self.in_flight.popitem(last=False)
+        if not message.neighbor_times:
+            return
+        min_latency = (min(message.neighbor_times.values()) - message.time) / 1000
+        max_latency = (max(message.neighbor_times.values()) - message.time) / 1000
+        min_latencies.append(min_latency)
+        max_latencies.append(max_latency)
+        self.sample_count += 1
+        self.min_latency_sum += min_latency
+        self.max_latency = max(self.max_latency, max_latency) if self.sample_count > 1 else max_latency
+
+    def _publish(self, min_latencies: List[float], max_latencies: List[float]) -> None:
+        if not min_latencies:
+            return
+        for callback in self.subscribers:
+            callback(min_latencies, max_latencies)
@@ -0,0 +1,137 @@
+import math
+import numpy as np
+from typing import List, Dict, Iterable
+from config import LATENCY_SKETCH_RELATIVE_ACCURACY, LATENCY_SKETCH_MAX_BINS
+
+# Latencies at or below this value (ms) are counted in the zero bucket
+MIN_INDEXABLE_LATENCY_MS = 1e-3
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch of latency samples with fixed memory (DDSketch).
+
+    Every sample is counted in a logarithmic bucket, so any quantile is returned with a relative error of at most
+    `relative_accuracy`. Count, sum, min and max are exact. When there are more than `max_bins` buckets, the lowest
+    ones are collapsed, which only affects the accuracy of the lowest quantiles.
+
+    Sketches with the same accuracy can be merged, e.g. the runs of a pair or the samples of several dongles.
+    """
+
+    def __init__(self, relative_accuracy: float = LATENCY_SKETCH_RELATIVE_ACCURACY, max_bins: int = LATENCY_SKETCH_MAX_BINS) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        # Number of samples per bucket index, bucket i holds the samples in (gamma^(i-1), gamma^i]
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('nan')
+        self.max = float('nan')
+
+    def add(self, latencies: Iterable[float]) -> None:
+        """ Add latency samples in ms. """
+        latencies = np.asarray(latencies, dtype=np.float64)
+        if len(latencies) == 0:
+            return
+
+        indexable = latencies > MIN_INDEXABLE_LATENCY_MS
+        indices, counts = np.unique(np.ceil(np.log(latencies[indexable]) / self.log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += int(len(latencies) - indexable.sum())
+
+        self.min = min(self.min, float(latencies.min())) if self.count else float(latencies.min())
+        self.max = max(self.max, float(latencies.max())) if self.count else float(latencies.max())
+        self.count += len(latencies)
+        self.sum += float(latencies.sum())
+        self._collapse()
+
+    def merge(self, other: 'LatencySketch') -> None:
+        """ Add all samples of another sketch with the same relative accuracy. """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        if not other.count:
+            return
+
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min) if self.count else other.min
+        self.max = max(self.max, other.max) if self.count else other.max
+        self.count += other.count
+        self.sum += other.sum
+        self._collapse()
+
+    def get_mean(self) -> float:
+        return self.sum / self.count if self.count else float('nan')
+
+    def get_quantile(self, quantile: float) -> float:
+        """ Returns the latency at the quantile (0 to 1), NaN when there are no samples. """
+        if not self.count:
+            return float('nan')
+
+        rank = quantile * (self.count - 1)
+        cumulative_count = self.zero_count
+        if cumulative_count > rank:
+            return self.min
+        for index in sorted(self.bins):
+            cumulative_count += self.bins[index]
+            if cumulative_count > rank:
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def get_summary(self, percentiles: Iterable[int] = (50, 90, 99)) -> Dict[str, float]:
+        """ Returns the number of samples, min, mean, the given percentiles and max. """
+        summary = {"samples": self.count, "min": self.min, "mean": self.get_mean()}
+        for percentile in percentiles:
+            summary[f"p{percentile}"] = self.get_quantile(percentile / 100)
+        summary["max"] = self.max
+        return summary
+
+    def get_histogram(self, bin_size: float) -> List[float]:
+        """
+        Returns the share of samples in each bin of `bin_size` ms, starting at 0.
+
+        Every bucket is assigned to a bin by its representative value, so samples close to a bin edge may be counted
+        in the neighboring bin.
+        """
+        if not self.count:
+            return []
+
+        indices = np.fromiter(self.bins.keys(), dtype=np.int64, count=len(self.bins))
+        counts = np.fromiter(self.bins.values(), dtype=np.float64, count=len(self.bins))
+        values = np.minimum(np.maximum(self._bucket_value(indices), self.min), self.max)
+        bin_counts = np.bincount((values // bin_size).astype(np.int64), weights=counts, minlength=int(self.max // bin_size) + 1)
+        bin_counts[0] += self.zero_count
+        return (bin_counts / self.count).tolist()
+
+    def to_dict(self) -> Dict:
+        """ Serializable state, e.g. to merge the sketches of several dongles. """
+        return {"relative_accuracy": self.relative_accuracy, "max_bins": self.max_bins, "bins": dict(self.bins),
+                "zero_count": self.zero_count, "count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'LatencySketch':
+        sketch = cls(state["relative_accuracy"], state["max_bins"])
+        sketch.bins = {int(index): count for index, count in state["bins"].items()}
+        sketch.zero_count = state["zero_count"]
+        sketch.count = state["count"]
+        sketch.sum = state["sum"]
+        sketch.min = state["min"]
+        sketch.max = state["max"]
+        return sketch
+
+    def _bucket_value(self, index):
+        """ The value every sample in a bucket is represented by, within the relative accuracy of all of them. """
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def _collapse(self) -> None:
+        """ Merge the lowest buckets into one while there are more than `max_bins`. """
+        if len(self.bins) <= self.max_bins:
+            return
+        indices = sorted(self.bins)
+        collapsed = indices[:len(indices) - self.max_bins + 1]
+        self.bins[collapsed[-1]] = sum(self.bins.pop(index) for index in collapsed[:-1]) + self.bins[collapsed[-1]]
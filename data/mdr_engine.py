@@ -0,0 +1,178 @@
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional
+from data.packet_store import PacketColumns
+from config import TRICKLE_I_MIN_MS, TRICKLE_REDUNDANCY_CONSTANT, MDR_MESSAGE_TIMEOUT_SECONDS
+from config import MDR_WINDOW_SECONDS, MDR_WINDOW_SERIES_LENGTH
+
+class PendingMessage:
+    """ A source message that has not been acknowledged yet. """
+
+    def __init__(self, time_us: int, message_key: int, kind: Optional[str]) -> None:
+        self.time = time_us
+        self.message_key = message_key
+        # 'set_get' for SET and GET messages on the destination index, 'other' for other messages on the source index
+        # and None for messages the destination does not have to acknowledge
+        self.kind = kind
+        # Timestamps of neighbor rebroadcasts within the last trickle period
+        self.neighbor_times = deque()
+
+class MDREngine:
+    """
+    Streaming Message-Delivery-Rate between a source and a destination node.
+
+    Packets are consumed in arrival order and every packet is handled in O(1):
+
+    1. The first packet of an index and version (marked by the `PacketStore`) sent by the source is a source message.
+    2. A SET or GET message on the destination index is acknowledged when any ACK or RESP with the next version is seen.
+    3. Another message on the source index is acknowledged when the destination sends the same message (direct), or when
+       the neighbors of the destination rebroadcast it more than TRICKLE_REDUNDANCY_CONSTANT times within one trickle
+       period (indirect, the destination dropped its own rebroadcast).
+    4. A message that is not acknowledged within `timeout_seconds` is resolved as a timeout.
+
+    Besides the cumulative counters, the engine keeps a time series of MDR and throughput over a sliding window.
+    The window ends at the newest time up to which every message has been resolved.
+    """
+
+    def __init__(self, source_mac: str, destination_mac: str, source_index: int, destination_index: int, neighbor_macs: List[str],
+                 timeout_seconds: float = MDR_MESSAGE_TIMEOUT_SECONDS, window_seconds: float = MDR_WINDOW_SECONDS) -> None:
+        self.source_mac = source_mac
+        self.destination_mac = destination_mac
+        self.source_index = source_index
+        self.destination_index = destination_index
+        self.neighbor_macs = set(neighbor_macs)
+        self.timeout_us = int(timeout_seconds * 1e6)
+        self.window_seconds = window_seconds
+        self.trickle_us = TRICKLE_I_MIN_MS * 1000
+
+        # Unacknowledged source messages by IndexVersionKey, oldest first
+        self.pending = OrderedDict()
+
+        self.source_messages = 0
+        self.direct_acks = 0
+        self.answered_acks = 0
+        self.indirect_acks = 0
+        self.timeouts = 0
+        self.first_time = None
+        self.last_source_time = None
+        self.latest_time = None
+
+        # Source messages and acknowledgements per second of source time, for the sliding window
+        self.buckets = {}
+        self.window_series = deque(maxlen=MDR_WINDOW_SERIES_LENGTH)
+
+    def process(self, packets: PacketColumns) -> None:
+        """ Consume new packets in arrival order. """
+        for time_us, mac, flags, index, _, index_version_key, message_key, first in packets.rows():
+            if self.latest_time is None or time_us > self.latest_time:
+                self.latest_time = time_us
+            self._expire(self.latest_time)
+
+            if first and mac == self.source_mac:
+                self._register(time_us, flags, index, index_version_key, message_key)
+
+            # An ACK or RESP with the next version answers a SET or GET message of the source
+            if flags in ('[ACK]', '[RESP]'):
+                answered = self.pending.get(index_version_key - 1)
+                if answered is not None and answered.kind == 'set_get':
+                    self._acknowledge(index_version_key - 1, 'answered')
+                    continue
+
+            message = self.pending.get(index_version_key)
+            if message is None or message.kind != 'other' or message.message_key != message_key:
+                continue
+            if mac == self.destination_mac:
+                self._acknowledge(index_version_key, 'direct')
+            elif mac in self.neighbor_macs:
+                # Count rebroadcasts by the neighbors of the destination within the last trickle period
+                message.neighbor_times.append(time_us)
+                while message.neighbor_times[0] <= time_us - self.trickle_us:
+                    message.neighbor_times.popleft()
+                if len(message.neighbor_times) > TRICKLE_REDUNDANCY_CONSTANT:
+                    self._acknowledge(index_version_key, 'indirect')
+
+        self._update_window_series()
+
+    def finish(self) -> None:
+        """ Resolve all pending messages as timeouts, e.g. when the analysis is stopped. """
+        if self.latest_time is not None:
+            self._expire(self.latest_time + self.timeout_us + 1)
+            self._update_window_series()
+
+    def get_acks(self) -> int:
+        return self.direct_acks + self.answered_acks + self.indirect_acks
+
+    def get_resolved(self) -> int:
+        """ Source messages that have been acknowledged or have timed out, i.e. that are no longer pending. """
+        return self.get_acks() + self.timeouts
+
+    def get_throughput(self) -> float:
+        """ Source messages per second over the whole run. """
+        if self.first_time is None or self.last_source_time == self.first_time:
+            return 0
+        return self.source_messages / ((self.last_source_time - self.first_time) / 1e6)
+
+    def get_window_series(self) -> List[Dict]:
+        """ Returns the sliding window MDR and throughput, one entry per update: time (s since the first source message), source_messages, acks, mdr and throughput. """
+        return list(self.window_series)
+
+    def _register(self, time_us: int, flags: str, index: int, index_version_key: int, message_key: int) -> None:
+        """ Add a new source message. """
+        if flags in ('[SET]', '[GET]'):
+            kind = 'set_get' if index == self.destination_index else None
+        else:
+            kind = 'other' if index == self.source_index else None
+
+        self.pending[index_version_key] = PendingMessage(time_us, message_key, kind)
+        self.source_messages += 1
+        if self.first_time is None:
+            self.first_time = time_us
+        self.last_source_time = time_us
+        self.buckets.setdefault(time_us // 1_000_000, [0, 0])[0] += 1
+
+    def _acknowledge(self, index_version_key: int, ack_type: str) -> None:
+        message = self.pending.pop(index_version_key)
+        if ack_type == 'direct':
+            self.direct_acks += 1
+        elif ack_type == 'answered':
+            self.answered_acks += 1
+        else:
+            self.indirect_acks += 1
+        self.buckets[message.time // 1_000_000][1] += 1
+
+    def _expire(self, now: int) -> None:
+        """ Resolve messages that have not been acknowledged in time as timeouts. """
+        while self.pending:
+            index_version_key, message = next(iter(self.pending.items()))
+            if now - message.time <= self.timeout_us:
+                break
+            del self.pending[index_version_key]
+            self.timeouts += 1
+
+    def _update_window_series(self) -> None:
+        """ Add a point for the window that ends at the newest time up to which all messages are resolved. """
+        if self.first_time is None:
+            return
+        window_end = (self.pending[next(iter(self.pending))].time if self.pending else self.latest_time + 1) // 1_000_000
+        window_start = window_end - int(self.window_seconds)
+        if window_start * 1_000_000 < self.first_time or (self.window_series and self.window_series[-1]['end'] >= window_end):
+            return
+
+        source_messages = 0
+        acks = 0
+        for second in range(window_start, window_end):
+            counts = self.buckets.get(second)
+            if counts is not None:
+                source_messages += counts[0]
+                acks += counts[1]
+        # Buckets before the window are no longer needed
+        for second in [second for second in self.buckets if second < window_start]:
+            del self.buckets[second]
+
+        self.window_series.append({
+            'end': window_end,
+            'time': window_end - self.first_time / 1e6,
+            'source_messages': source_messages,
+            'acks': acks,
+            'mdr': acks / source_messages * 100 if source_messages else None,
+            'throughput': source_messages / self.window_seconds,
+        })
@@ -0,0 +1,45 @@
+from typing import List, Optional
+
+class NodeRegistry:
+    """
+    Interned node ids with O(1) lookups between a MAC address, its node id and its label number.
+
+    Node ids are dense ints given out in the order nodes are first labeled, and the label number shown in the GUI and
+    used as the node of the topology graph is the node id + 1. Ids are only appended and never change until `reset`,
+    so a reader may look up ids without locking.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        """ Forget all nodes. """
+        self.macs = []
+        self.ids = {}
+
+    def intern(self, mac: str) -> int:
+        """ Returns the node id of a MAC address, giving it the next id if it is new. """
+        node_id = self.ids.get(mac)
+        if node_id is None:
+            node_id = len(self.macs)
+            self.macs.append(mac)
+            self.ids[mac] = node_id
+        return node_id
+
+    def get_id(self, mac: str) -> Optional[int]:
+        return self.ids.get(mac)
+
+    def get_macs(self) -> List[str]:
+        """ Returns the MAC addresses in order of their node id, which is the order of their label number. """
+        return self.macs[:len(self.macs)]
+
+    @staticmethod
+    def get_number(node_id: int) -> int:
+        return node_id + 1
+
+    @staticmethod
+    def get_id_by_number(number: int) -> int:
+        return number - 1
+
+    def get_mac_by_number(self, number: int) -> str:
+        return self.macs[number - 1]
@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Dict, Tuple, Iterator
+from data.capture_reader import frame_from_rows
+from data.timestamp_parser import HourWrapUnwrapper
+from config import PACKET_STORE_CHUNK_ROWS, PACKET_STORE_RETENTION_SECONDS, PACKET_STORE_FIRST_SEEN_MEMORY_SECONDS
+
+# Columns of the store and their dtypes. MAC, Command and Flags are ids into the vocabularies of the store,
+# payload is an id into the payload table of the chunk (-1 for no payload), and first is set on the first packet
+# of every index and version (see `PacketStore`).
+PACKET_COLUMNS = {
+    'time': np.int64,
+    'mac': np.int32,
+    'index': np.int64,
+    'version': np.int64,
+    'flags': np.int16,
+    'command': np.int32,
+    'message_key': np.uint64,
+    'payload': np.int32,
+    'first': np.bool_,
+}
+
+class PacketChunk:
+    """ Fixed size block of packet columns. Rows are only appended, so views of the filled part never change. """
+
+    def __init__(self, first_row: int, capacity: int) -> None:
+        self.first_row = first_row
+        self.size = 0
+        self.columns = {column: np.empty(capacity, dtype=dtype) for column, dtype in PACKET_COLUMNS.items()}
+        # Rebroadcasts share their payload, so every distinct payload is stored once per chunk
+        self.payloads = []
+        self.payload_ids = {}
+
+    def get_capacity(self) -> int:
+        return len(self.columns['time'])
+
+    def get_payload_id(self, payload) -> int:
+        if payload is None or payload != payload:
+            return -1
+        payload_id = self.payload_ids.get(payload)
+        if payload_id is None:
+            payload_id = self.payload_ids[payload] = len(self.payloads)
+            self.payloads.append(payload)
+        return payload_id
+
+class PacketColumns:
+    """
+    Packets as NumPy columns, the form in which the streaming engines consume them.
+
+    MAC addresses and flags are ids into the `macs` and `flags` vocabularies, so reading packets does not build object
+    arrays. `rows` yields one packet at a time with its MAC address and flags looked up.
+    """
+
+    def __init__(self, time: np.ndarray, mac: np.ndarray, flags: np.ndarray, index: np.ndarray, version: np.ndarray,
+                 message_key: np.ndarray, first: np.ndarray, macs: List[str], flag_names: List[str]) -> None:
+        self.time = time
+        self.mac = mac
+        self.flags = flags
+        self.index = index
+        self.version = version
+        self.message_key = message_key
+        self.first = first
+        self.index_version_key = (index << 32) | version
+        self.macs = macs
+        self.flag_names = flag_names
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def get_unique_macs(self) -> List[str]:
+        """ Returns the MAC addresses of the packets, each once. """
+        return [self.macs[mac_id] for mac_id in np.unique(self.mac).tolist()]
+
+    def rows(self) -> Iterator[Tuple[int, str, str, int, int, int, int, bool]]:
+        """
+        Returns an iterator of (time, MAC address, flags, index, version, IndexVersionKey, MessageKey, first) of every packet
+        in order, where first tells whether the packet is the first one of its index and version.
+        """
+        return zip(self.time.tolist(), map(self.macs.__getitem__, self.mac.tolist()), map(self.flag_names.__getitem__, self.flags.tolist()),
+                   self.index.tolist(), self.version.tolist(), self.index_version_key.tolist(), self.message_key.tolist(), self.first.tolist())
+
+class PacketStore:
+    """
+    In-memory columnar store of the packets received by an analysis.
+
+    The rx thread appends raw log rows with `append`, which only queues them. Queued rows are converted in bulk to
+    append-only NumPy columns (time in unwrapped µs, MAC id, index, version, flags id, command id, message key and
+    payload id) when the store is read.
+
+    Columns are kept in chunks of `chunk_rows` rows. Rows are numbered from the start of the store, so readers can
+    keep a cursor and only read what is new. Whole chunks are dropped when all their packets are older than
+    `retention_seconds` relative to the newest packet.
+
+    While rows are stored, a first-seen index of IndexVersionKeys marks the first packet of every index and version in
+    the `first` column, so the analyses do not each keep their own set of seen messages. A key is forgotten when its
+    first packet is older than `first_seen_memory_seconds` relative to the newest packet, after which the index and
+    version can start a new message.
+    """
+
+    def __init__(self, header: List[str], chunk_rows: int = PACKET_STORE_CHUNK_ROWS,
+                 retention_seconds: float = PACKET_STORE_RETENTION_SECONDS,
+                 first_seen_memory_seconds: float = PACKET_STORE_FIRST_SEEN_MEMORY_SECONDS) -> None:
+        self.header = header
+        self.chunk_rows = chunk_rows
+        self.retention_us = int(retention_seconds * 1e6)
+        self.first_seen_memory_us = int(first_seen_memory_seconds * 1e6)
+        self.unwrapper = HourWrapUnwrapper()
+        # `pending_lock` is only held to queue or take rows, so the rx thread never waits for a conversion
+        self.pending_lock = Lock()
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.pending_lock, self.lock:
+            self.pending_rows = []
+            self.chunks = []
+            self.first_row = 0
+            self.end_row = 0
+            self.latest_time = None
+            self.cursors = {}
+            # Time of the first packet of every IndexVersionKey seen recently, in arrival order
+            self.first_seen = OrderedDict()
+            # Vocabularies of the categorical columns, a value keeps its id for the lifetime of the store
+            self.vocabularies = {'mac': ([], {}), 'flags': ([], {}), 'command': ([], {})}
+            self.unwrapper.reset()
+
+    def append(self, row: List) -> None:
+        """ Queue a row as logged by the rx thread. """
+        with self.pending_lock:
+            self.pending_rows.append(row)
+
+    def commit(self) -> int:
+        """ Convert all queued rows into columns and returns the row number after the last stored row. """
+        with self.lock:
+            with self.pending_lock:
+                rows, self.pending_rows = self.pending_rows, []
+            if rows:
+                packets = frame_from_rows(rows, self.header, self.unwrapper)
+                self._store(packets)
+                self._evict()
+            return self.end_row
+
+    def read(self, start_row: int = 0) -> Tuple[pd.DataFrame, int]:
+        """
+        Returns the packets from `start_row` on with the capture schema, and the row number to continue from.
+
+        Rows that have already been dropped by the retention are skipped.
+        """
+        end_row = self.commit()
+        return self.get_frame(start_row, end_row), end_row
+
+    def read_new(self, reader: str) -> PacketColumns:
+        """
+        Returns the packets stored since the last `read_new` call of the same reader as columns. No frame is built and the
+        columns are views into the chunk when the packets are in a single chunk.
+        """
+        start_row = self.cursors.get(reader, 0)
+        end_row = self.cursors[reader] = self.commit()
+        columns = self.get_columns(start_row, end_row, payloads=False)
+        return PacketColumns(columns['time'], columns['mac'], columns['flags'], columns['index'], columns['version'],
+                             columns['message_key'], columns['first'], self.vocabularies['mac'][0], self.vocabularies['flags'][0])
+
+    def get_columns(self, start_row: int = 0, end_row: int = None, payloads: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Returns the columns of the stored rows in [start_row, end_row).
+
+        When the rows are in a single chunk the arrays are views into the chunk, otherwise the chunks are concatenated.
+        Payload ids of different chunks refer to different payload tables, so they are replaced by the payloads themselves,
+        or left out without `payloads`.
+        """
+        with self.lock:
+            end_row = self.end_row if end_row is None else end_row
+            parts = [(chunk, max(start_row, chunk.first_row) - chunk.first_row, min(end_row, chunk.first_row + chunk.size) - chunk.first_row)
+                     for chunk in self.chunks if chunk.first_row < end_row and chunk.first_row + chunk.size > start_row]
+
+        names = [column for column in PACKET_COLUMNS if column != 'payload']
+        if len(parts) == 1:
+            chunk, start, end = parts[0]
+            columns = {column: chunk.columns[column][start:end] for column in names}
+        else:
+            columns = {column: np.concatenate([chunk.columns[column][start:end] for chunk, start, end in parts]) if parts
+                       else np.empty(0, dtype=PACKET_COLUMNS[column]) for column in names}
+        if payloads:
+            columns['payload'] = self._payloads(parts)
+        return columns
+
+    def get_frame(self, start_row: int = 0, end_row: int = None) -> pd.DataFrame:
+        """ Returns the stored rows in [start_row, end_row) with the capture schema, as `CaptureReader.get_frame`. """
+        columns = self.get_columns(start_row, end_row)
+        return pd.DataFrame({
+            'Timestamp': columns['time'],
+            'MAC': self._categorical('mac', columns['mac']),
+            'Command': self._categorical('command', columns['command']),
+            'Flags': self._categorical('flags', columns['flags']),
+            'Index': columns['index'],
+            'Payload': pd.Series(columns['payload'], dtype='object', copy=False),
+            'Version': columns['version'],
+            'MessageKey': columns['message_key'],
+            'IndexVersionKey': (columns['index'] << 32) | columns['version'],
+        }, copy=False)
+
+    def _store(self, packets: pd.DataFrame) -> None:
+        """ Append converted packets to the chunks, starting a new chunk when the last one is full. """
+        newest_time = int(packets['Timestamp'].max()) if len(packets) else None
+        if newest_time is not None and (self.latest_time is None or newest_time > self.latest_time):
+            self.latest_time = newest_time
+
+        values = {
+            'time': packets['Timestamp'].to_numpy(),
+            'mac': self._intern('mac', packets['MAC']),
+            'index': packets['Index'].to_numpy(),
+            'version': packets['Version'].to_numpy(),
+            'flags': self._intern('flags', packets['Flags']),
+            'command': self._intern('command', packets['Command']),
+            'message_key': packets['MessageKey'].to_numpy(),
+            'first': self._mark_first(packets['Timestamp'].to_numpy(), packets['IndexVersionKey'].to_numpy()),
+        }
+        payloads = packets['Payload'].tolist()
+
+        position = 0
+        while position < len(packets):
+            if not self.chunks or self.chunks[-1].size == self.chunks[-1].get_capacity():
+                self.chunks.append(PacketChunk(self.end_row, self.chunk_rows))
+            chunk = self.chunks[-1]
+            count = min(len(packets) - position, chunk.get_capacity() - chunk.size)
+
+            for column, column_values in values.items():
+                chunk.columns[column][chunk.size:chunk.size + count] = column_values[position:position + count]
+            chunk.columns['payload'][chunk.size:chunk.size + count] = [chunk.get_payload_id(payload) for payload in payloads[position:position + count]]
+
+            chunk.size += count
+            self.end_row += count
+            position += count
+
+    def _mark_first(self, times: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """ Returns whether each packet is the first of its IndexVersionKey, and adds the new keys to the first-seen index. """
+        while self.first_seen and self.latest_time - next(iter(self.first_seen.values())) >= self.first_seen_memory_us:
+            self.first_seen.popitem(last=False)
+
+        # Only the first packet of each key in these rows can be new, so the index is looked up once per key
+        first = np.zeros(len(keys), dtype=np.bool_)
+        unique_keys, positions = np.unique(keys, return_index=True)
+        new = [position for key, position in zip(unique_keys.tolist(), positions.tolist()) if key not in self.first_seen]
+        new.sort()
+        first[new] = True
+        for key, time_us in zip(keys[new].tolist(), times[new].tolist()):
+            self.first_seen[key] = time_us
+        return first
+
+    def _evict(self) -> None:
+        """ Drop the oldest chunks while all their packets are older than the retention. The last chunk is always kept. """
+        while len(self.chunks) > 1 and self.latest_time - self.chunks[0].columns['time'][:self.chunks[0].size].max() >= self.retention_us:
+            chunk = self.chunks.pop(0)
+            self.first_row = chunk.first_row + chunk.size
+
+    def _intern(self, vocabulary: str, values: pd.Series) -> np.ndarray:
+        """ Map the values of a categorical column to ids of the vocabulary, adding values that are new. """
+        names, ids = self.vocabularies[vocabulary]
+        categories = values.cat.categories
+        for name in categories:
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+        category_ids = np.array([ids[name] for name in categories], dtype=PACKET_COLUMNS[vocabulary])
+        return category_ids[values.cat.codes.to_numpy()]
+
+    def _categorical(self, vocabulary: str, ids: np.ndarray) -> pd.Categorical:
+        names, _ = self.vocabularies[vocabulary]
+        return pd.Categorical.from_codes(ids, categories=list(names))
+
+    @staticmethod
+    def _payloads(parts: List[Tuple[PacketChunk, int, int]]) -> np.ndarray:
+        """ Look up the payloads of the rows in the payload tables of their chunks. """
+        payloads = []
+        for chunk, start, end in parts:
+            table = np.empty(len(chunk.payloads) + 1, dtype=object)
+            table[:-1] = chunk.payloads
+            table[-1] = None
+            payloads.append(table[chunk.columns['payload'][start:end]])
+        return np.concatenate(payloads) if payloads else np.empty(0, dtype=object)
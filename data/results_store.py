@@ -0,0 +1,191 @@
+import os
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import List, Dict, Optional
+from config import RESULTS_DB_PATH, RESULTS_BATCH_SIZE, RESULTS_FLUSH_INTERVAL_SECONDS, RESULTS_PAGE_SIZE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    source_messages INTEGER,
+    acks INTEGER,
+    mdr REAL,
+    throughput REAL,
+    sample_count INTEGER,
+    avg_latency REAL,
+    max_latency REAL
+);
+CREATE INDEX IF NOT EXISTS runs_site_time ON runs (site, started_at);
+CREATE INDEX IF NOT EXISTS runs_pair_time ON runs (source, destination, started_at);
+
+CREATE TABLE IF NOT EXISTS mdr_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    time REAL NOT NULL,
+    source_messages INTEGER,
+    acks INTEGER,
+    throughput REAL,
+    mdr REAL
+);
+CREATE INDEX IF NOT EXISTS mdr_results_run_time ON mdr_results (run_id, time);
+
+CREATE TABLE IF NOT EXISTS latency_samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    time REAL NOT NULL,
+    latency_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS latency_samples_run_time ON latency_samples (run_id, time);
+
+CREATE TABLE IF NOT EXISTS latency_sketches (
+    run_id INTEGER PRIMARY KEY REFERENCES runs (run_id),
+    sketch TEXT NOT NULL
+);
+"""
+
+class ResultsStore:
+    """
+    Embedded SQLite store for MDR and latency analysis runs.
+
+    A run is registered when an analysis starts and receives a summary when it ends. Intermediate MDR results and raw
+    latency samples are queued and written in batches. All query methods are paged so the GUI never has to load
+    a whole history into memory.
+    """
+    _instance = None  # Class-level attribute to store the singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ResultsStore, cls).__new__(cls)
+            # Initialize the instance once
+            cls._instance.init_once()
+        return cls._instance
+
+    def init_once(self):
+        self.lock = Lock()
+        self.pending_mdr_results = []
+        self.pending_latency_samples = []
+        self.last_flush = time.time()
+
+        os.makedirs(os.path.dirname(RESULTS_DB_PATH), exist_ok=True)
+        self.connection = sqlite3.connect(RESULTS_DB_PATH, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # WAL lets the GUI read history while analysis threads are writing
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def begin_run(self, site: str, kind: str, source: str, destination: str) -> int:
+        """ Register a new 'mdr' or 'latency' run and return its id. """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (site, kind, source, destination, started_at) VALUES (?, ?, ?, ?, ?)",
+                (site, kind, source, destination, time.time()))
+            return cursor.lastrowid
+
+    def end_run(self, run_id: int, **summary) -> None:
+        """
+        Write all queued results of the run and store its summary.
+
+        Keyword arguments are summary columns of the runs table, e.g. source_messages, acks, mdr, throughput,
+        sample_count, avg_latency and max_latency.
+        """
+        self.flush()
+        columns = ["ended_at = ?"] + [f"{column} = ?" for column in summary]
+        with self.lock, self.connection:
+            self.connection.execute(f"UPDATE runs SET {', '.join(columns)} WHERE run_id = ?",
+                                    (time.time(), *summary.values(), run_id))
+
+    def record_latency_sketch(self, run_id: int, sketch: Dict) -> None:
+        """ Store the latency sketch of a finished run, as returned by `LatencySketch.to_dict`. """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO latency_sketches (run_id, sketch) VALUES (?, ?)", (run_id, json.dumps(sketch)))
+
+    def record_mdr_result(self, run_id: int, result: Dict) -> None:
+        """ Queue an intermediate MDR result, as returned by `DataService.add_or_update_mdr_pair`. """
+        with self.lock:
+            self.pending_mdr_results.append((run_id, time.time(), result['source_messages'], result['acks'],
+                                             result['throughput'], result['mdr']))
+        self._flush_if_due()
+
+    def record_latency_samples(self, run_id: int, latencies: List[float]) -> None:
+        """ Queue raw latency samples (ms) of a run. """
+        now = time.time()
+        with self.lock:
+            self.pending_latency_samples.extend((run_id, now, float(latency)) for latency in latencies)
+        self._flush_if_due()
+
+    def flush(self) -> None:
+        """ Write all queued results in a single transaction. """
+        with self.lock:
+            mdr_results, self.pending_mdr_results = self.pending_mdr_results, []
+            latency_samples, self.pending_latency_samples = self.pending_latency_samples, []
+            self.last_flush = time.time()
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO mdr_results (run_id, time, source_messages, acks, throughput, mdr) VALUES (?, ?, ?, ?, ?, ?)",
+                    mdr_results)
+                self.connection.executemany(
+                    "INSERT INTO latency_samples (run_id, time, latency_ms) VALUES (?, ?, ?)", latency_samples)
+
+    def get_runs(self, site: str, kind: Optional[str] = None, source: Optional[str] = None, destination: Optional[str] = None,
+                 before_run_id: Optional[int] = None, limit: int = RESULTS_PAGE_SIZE) -> List[Dict]:
+        """
+        Returns one page of runs for a site, newest first.
+
+        Pass the smallest run_id of the previous page as `before_run_id` to get the next page.
+        """
+        conditions = ["site = ?"]
+        parameters = [site]
+        for column, value in (("kind", kind), ("source", source), ("destination", destination)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if before_run_id is not None:
+            conditions.append("run_id < ?")
+            parameters.append(before_run_id)
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT * FROM runs WHERE {' AND '.join(conditions)} ORDER BY run_id DESC LIMIT ?",
+                (*parameters, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_latency_samples(self, run_id: int, after_id: int = 0, limit: int = RESULTS_PAGE_SIZE) -> List[Dict]:
+        """ Returns one page of raw latency samples of a run, oldest first. Pass the last id to get the next page. """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT * FROM latency_samples WHERE run_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (run_id, after_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_latency_sketches(self, site: str, source: str, destination: str, before_run_id: Optional[int] = None,
+                             limit: int = RESULTS_PAGE_SIZE) -> List[Dict]:
+        """
+        Returns one page of (run_id, sketch) of the latency runs of a pair, newest first. The sketches are the dictionaries
+        stored with `record_latency_sketch`. Pass the smallest run_id of the previous page as `before_run_id` to get the next page.
+        """
+        conditions = ["site = ?", "kind = 'latency'", "source = ?", "destination = ?"]
+        parameters = [site, source, destination]
+        if before_run_id is not None:
+            conditions.append("runs.run_id < ?")
+            parameters.append(before_run_id)
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT runs.run_id, sketch FROM runs JOIN latency_sketches ON runs.run_id = latency_sketches.run_id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY runs.run_id DESC LIMIT ?",
+                (*parameters, limit)).fetchall()
+        return [{"run_id": row["run_id"], "sketch": json.loads(row["sketch"])} for row in rows]
+
+    def _flush_if_due(self) -> None:
+        pending = len(self.pending_mdr_results) + len(self.pending_latency_samples)
+        if pending >= RESULTS_BATCH_SIZE or time.time() - self.last_flush > RESULTS_FLUSH_INTERVAL_SECONDS:
+            self.flush()
@@ -0,0 +1,99 @@
+import json
+import os
+from threading import Lock
+from typing import List, Dict
+
+# Directory with the site JSON files written by the authentication tab
+SITE_DIRECTORY = '.auth'
+
+class SiteInfo:
+    """
+    Parsed site JSON with the lookups the analyses need, computed once per load.
+
+    MAC addresses are in the capture format (AA:BB:CC:DD:EE:FF). The JSON keys of the devices are the same MAC
+    addresses without colons.
+    """
+
+    def __init__(self, name: str, data: Dict, mtime_ns: int) -> None:
+        self.name = name
+        self.data = data
+        self.mtime_ns = mtime_ns
+        self.devices = data['devices']
+
+        self.index_by_mac = {}
+        self.mac_by_index = {}
+        self.title_by_mac = {}
+        for key, device in self.devices.items():
+            mac = ':'.join(key[position:position + 2] for position in range(0, len(key), 2))
+            self.index_by_mac[mac] = device['deviceAddress']
+            self.mac_by_index[device['deviceAddress']] = mac
+            self.title_by_mac[mac] = device.get('title')
+
+        # Every deviceAddress followed by the rx_index of the device if it has one, the indices stimulated by the topology analysis
+        self.rx_indices = [value for device in self.devices.values() for value in (device['deviceAddress'], device.get('rx_index'))
+                           if value is not None]
+
+        self.access_addr = data.get('accessAddr')
+        self.crypto_key = data.get('cryptoKey')
+        self.access_addr_bytes = [int(hex_val, 16) for hex_val in self.access_addr.split()] if self.access_addr else []
+        self.crypto_key_bytes = [int(hex_val, 16) for hex_val in self.crypto_key.split()] if self.crypto_key else []
+
+    def get_index(self, mac: str) -> int:
+        """ Returns the deviceAddress of a MAC address, None if it is not in the site. """
+        return self.index_by_mac.get(mac)
+
+    def get_title(self, mac: str, default: str = "UNIDENTIFIED") -> str:
+        """ Returns the title of a MAC address, `default` if it is not in the site. """
+        title = self.title_by_mac.get(mac)
+        return default if title is None else title
+
+class SiteRegistry:
+    """
+    Cache of the parsed site files.
+
+    A site is parsed on first use and kept until the modification time of its file changes, so the analyses can ask
+    for it on every update without reading the file again.
+    """
+    _instance = None  # Class-level attribute to store the singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(SiteRegistry, cls).__new__(cls)
+            # Initialize the instance once
+            cls._instance.init_once()
+        return cls._instance
+
+    def init_once(self):
+        self.sites = {}
+        self.lock = Lock()
+
+    def get(self, site_name: str) -> SiteInfo:
+        """ Returns the site, loading it again if its file has changed. Raises OSError if the file cannot be read. """
+        path = self.get_path(site_name)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self.lock:
+            site = self.sites.get(site_name)
+            if site is None or site.mtime_ns != mtime_ns:
+                with open(path, 'r') as file:
+                    site = self.sites[site_name] = SiteInfo(site_name, json.load(file), mtime_ns)
+            return site
+
+    def invalidate(self, site_name: str = None) -> None:
+        """ Drop a cached site, or all of them. """
+        with self.lock:
+            if site_name is None:
+                self.sites = {}
+            else:
+                self.sites.pop(site_name, None)
+
+    @staticmethod
+    def get_path(site_name: str) -> str:
+        return os.path.join(SITE_DIRECTORY, f"{site_name}.json")
+
+    @staticmethod
+    def get_site_names() -> List[str]:
+        """ Returns the names of all sites in the site directory. """
+        try:
+            return [os.path.splitext(filename)[0] for filename in os.listdir(SITE_DIRECTORY)]
+        except OSError:
+            return []
@@ -0,0 +1,37 @@
+from types import MappingProxyType
+from typing import Dict, Iterable, Optional, Tuple
+from data.edge_store import EdgeStore
+
+class StateSnapshot:
+    """
+    Immutable view of the analysis results of `DataService` at one point in time.
+
+    A new snapshot with a higher version is published after every update, and the published snapshot is replaced as a
+    whole (read-copy-update). A reader that keeps a reference to a snapshot sees a consistent state without locking,
+    and can skip work when the version has not changed since it last looked.
+
+    The next snapshot is made with `update`, which copies only the parts of the working state that changed and shares
+    the other parts with the previous snapshot. Entries of the MAC label map and the MDR results are never modified,
+    a changed entry is replaced, so the maps are copied shallowly.
+    """
+
+    def __init__(self, version: int = 0, connections: Tuple[Tuple[str, str], ...] = (), isolated_nodes: frozenset = frozenset(),
+                 mac_label_map: MappingProxyType = MappingProxyType({}), all_unique_macs: frozenset = frozenset(),
+                 mdr_results: MappingProxyType = MappingProxyType({})) -> None:
+        self.version = version
+        self.connections = connections
+        self.isolated_nodes = isolated_nodes
+        self.mac_label_map = mac_label_map
+        self.all_unique_macs = all_unique_macs
+        self.mdr_results = mdr_results
+
+    def update(self, edge_store: Optional[EdgeStore] = None, mac_label_map: Optional[Dict] = None,
+               all_unique_macs: Optional[Iterable[str]] = None, mdr_results: Optional[Dict] = None) -> 'StateSnapshot':
+        """ Returns the next version with copies of the given parts of the working state. Parts that are None are shared with this snapshot. """
+        return StateSnapshot(
+            self.version + 1,
+            self.connections if edge_store is None else tuple(edge_store.get_edges()),
+            self.isolated_nodes if edge_store is None else frozenset(edge_store.get_isolated_nodes()),
+            self.mac_label_map if mac_label_map is None else MappingProxyType(dict(mac_label_map)),
+            self.all_unique_macs if all_unique_macs is None else frozenset(all_unique_macs),
+            self.mdr_results if mdr_results is None else MappingProxyType(dict(mdr_results)))
@@ -0,0 +1,117 @@
+from math import sqrt, ceil, floor
+from statistics import NormalDist
+from typing import List, Dict, Optional, Union
+from data.latency_sketch import LatencySketch
+from config import LATENCY_STOP_STATISTIC, LATENCY_STOP_CONFIDENCE, LATENCY_STOP_RELATIVE_HALF_WIDTH, LATENCY_STOP_MIN_SAMPLES, LATENCY_STOP_MAX_SAMPLES
+from config import MDR_STOP_CONFIDENCE, MDR_STOP_HALF_WIDTH, MDR_STOP_MIN_MESSAGES, MDR_STOP_MAX_MESSAGES
+
+def z_score(confidence: float) -> float:
+    """ Returns the two-sided standard normal quantile of a confidence level, e.g. 1.96 for 0.95. """
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+def wilson_interval(successes: int, trials: int, confidence: float) -> Optional[tuple]:
+    """ Returns the Wilson score interval (low, high) of a proportion, None without trials. """
+    if trials <= 0:
+        return None
+    z = z_score(confidence)
+    proportion = successes / trials
+    denominator = 1 + z * z / trials
+    center = (proportion + z * z / (2 * trials)) / denominator
+    half_width = z * sqrt(proportion * (1 - proportion) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+class LatencyStoppingRule:
+    """
+    Sequential stopping rule for a latency run, evaluated every time new samples arrive.
+
+    The run is done when the confidence interval of the statistic is narrower than `relative_half_width` of the
+    estimate, but never before `min_samples` and always at `max_samples`.
+
+    1. The statistic 'mean' uses the normal interval of the mean, with the variance kept up to date by Welford's method.
+    2. A percentile (e.g. 90) uses the distribution-free interval of the order statistics around its rank, read from
+       the latency sketch of the run, so no samples have to be kept.
+    """
+
+    def __init__(self, sketch: LatencySketch, statistic: Union[str, float] = LATENCY_STOP_STATISTIC, confidence: float = LATENCY_STOP_CONFIDENCE,
+                 relative_half_width: float = LATENCY_STOP_RELATIVE_HALF_WIDTH, min_samples: int = LATENCY_STOP_MIN_SAMPLES,
+                 max_samples: int = LATENCY_STOP_MAX_SAMPLES) -> None:
+        self.sketch = sketch
+        self.statistic = statistic
+        self.z = z_score(confidence)
+        self.relative_half_width = relative_half_width
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, latencies: List[float]) -> None:
+        """ Update the running mean and variance with new samples. The sketch is updated by its owner. """
+        for latency in latencies:
+            self.count += 1
+            delta = latency - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (latency - self.mean)
+
+    def get_interval(self) -> Optional[tuple]:
+        """ Returns the (estimate, low, high) of the statistic, None while there are too few samples for an interval. """
+        if self.statistic == 'mean':
+            if self.count < 2:
+                return None
+            half_width = self.z * sqrt(self.m2 / (self.count - 1) / self.count)
+            return float(self.mean), float(self.mean - half_width), float(self.mean + half_width)
+
+        count = self.sketch.count
+        if count < 2:
+            return None
+        q = self.statistic / 100
+        rank_half_width = self.z * sqrt(count * q * (1 - q))
+        low_rank = max(floor(count * q - rank_half_width), 1)
+        high_rank = min(ceil(count * q + rank_half_width), count)
+        return (self.sketch.get_quantile(q), self.sketch.get_quantile((low_rank - 1) / (count - 1)),
+                self.sketch.get_quantile((high_rank - 1) / (count - 1)))
+
+    def get_status(self) -> Dict:
+        """ Returns the number of samples, the estimate and its interval, and whether and why the run is done. """
+        samples = self.sketch.count if self.statistic != 'mean' else self.count
+        interval = self.get_interval()
+        status = {"samples": samples, "estimate": None, "low": None, "high": None, "done": False, "reason": None}
+        if interval is not None:
+            status["estimate"], status["low"], status["high"] = interval
+
+        if samples >= self.max_samples:
+            status["done"], status["reason"] = True, "max_samples"
+        elif samples >= self.min_samples and interval is not None and \
+                (interval[2] - interval[1]) / 2 <= self.relative_half_width * abs(interval[0]):
+            status["done"], status["reason"] = True, "converged"
+        return status
+
+class MDRStoppingRule:
+    """
+    Sequential stopping rule for an MDR run, evaluated after every update of the MDR.
+
+    The run is done when the Wilson interval of the delivery ratio is at most `half_width` wide on each side
+    (as a fraction, 0.02 is ±2 %), but never before `min_messages` resolved messages and always at `max_messages`.
+    Only resolved messages (acknowledged or timed out) are trials, a pending message cannot be acknowledged yet.
+    """
+
+    def __init__(self, confidence: float = MDR_STOP_CONFIDENCE, half_width: float = MDR_STOP_HALF_WIDTH,
+                 min_messages: int = MDR_STOP_MIN_MESSAGES, max_messages: int = MDR_STOP_MAX_MESSAGES) -> None:
+        self.confidence = confidence
+        self.half_width = half_width
+        self.min_messages = min_messages
+        self.max_messages = max_messages
+
+    def get_status(self, resolved_messages: int, acks: int) -> Dict:
+        """ Returns the number of resolved messages, the MDR in % over them and its interval, and whether and why the run is done. """
+        interval = wilson_interval(min(acks, resolved_messages), resolved_messages, self.confidence)
+        status = {"samples": resolved_messages, "estimate": acks / resolved_messages * 100 if resolved_messages else None,
+                  "low": None, "high": None, "done": False, "reason": None}
+        if interval is not None:
+            status["low"], status["high"] = interval[0] * 100, interval[1] * 100
+
+        if resolved_messages >= self.max_messages:
+            status["done"], status["reason"] = True, "max_samples"
+        elif resolved_messages >= self.min_messages and interval is not None and (interval[1] - interval[0]) / 2 <= self.half_width:
+            status["done"], status["reason"] = True, "converged"
+        return status
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# The dongle timestamp is minutes:seconds:milliseconds:microseconds, so it wraps every hour
+HOUR_US = 3_600_000_000
+INVALID_TIMESTAMP = -1
+
+# Place value of each timestamp component in microseconds
+_COMPONENT_US = np.array([60_000_000, 1_000_000, 1_000, 1], dtype=np.int64)
+
+def parse_packet_timestamps(timestamps: pd.Series) -> np.ndarray:
+    """
+    Convert packet timestamps of the form '[minutes.seconds.milliseconds.microseconds]' to int64 microseconds
+    since the start of the hour.
+
+    All strings are parsed at once on their bytes: digits are grouped into numbers with `np.add.reduceat` and every
+    timestamp must contain exactly four numbers. Timestamps that can not be parsed are returned as INVALID_TIMESTAMP.
+    """
+    count = len(timestamps)
+    if count == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # One line per timestamp, so every number can be mapped back to its row by the newlines before it
+    data = np.frombuffer(('\n'.join(map(str, timestamps.astype(object).fillna('').tolist())) + '\n').encode(), dtype=np.uint8)
+    newline_positions = np.flatnonzero(data == ord('\n'))
+
+    is_digit = (data >= ord('0')) & (data <= ord('9'))
+    digit_positions = np.flatnonzero(is_digit)
+    # A number starts at a digit that does not follow another digit
+    is_number_start = np.ones(len(digit_positions), dtype=bool)
+    is_number_start[1:] = np.diff(digit_positions) > 1
+    first_digits = np.flatnonzero(is_number_start)
+
+    # Position of every digit counted from the end of its number gives its power of ten
+    last_digits = np.append(first_digits[1:], len(digit_positions)) - 1
+    number_of_digit = np.cumsum(is_number_start) - 1
+    exponents = last_digits[number_of_digit] - np.arange(len(digit_positions))
+    digit_values = (data[digit_positions] - ord('0')).astype(np.int64) * (10 ** np.minimum(exponents, 18))
+    numbers = np.add.reduceat(digit_values, first_digits) if len(first_digits) else digit_values
+
+    # Only rows with exactly four numbers are valid timestamps
+    row_of_number = np.searchsorted(newline_positions, digit_positions[first_digits])
+    numbers_per_row = np.bincount(row_of_number, minlength=count)
+    valid_rows = numbers_per_row == 4
+    valid_numbers = valid_rows[row_of_number]
+
+    result = np.full(count, INVALID_TIMESTAMP, dtype=np.int64)
+    result[valid_rows] = numbers[valid_numbers].reshape(-1, 4) @ _COMPONENT_US
+    return result
+
+class HourWrapUnwrapper:
+    """
+    Turns hour-wrapping packet timestamps into a monotonic timeline, chunk by chunk, in arrival order.
+
+    A jump back by more than half an hour between consecutive packets is an hour rollover. A jump forward by more than
+    half an hour is a packet from before the rollover that arrived after it, so the rollover is undone for it.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.last_timestamp = None
+        self.offset = 0
+
+    def unwrap(self, timestamps: np.ndarray) -> np.ndarray:
+        if len(timestamps) == 0:
+            return timestamps
+        previous = np.empty_like(timestamps)
+        previous[0] = timestamps[0] if self.last_timestamp is None else self.last_timestamp
+        previous[1:] = timestamps[:-1]
+        steps = timestamps - previous
+
+        rollovers = (steps < -HOUR_US // 2).astype(np.int64) - (steps > HOUR_US // 2)
+        offsets = self.offset + np.cumsum(rollovers) * HOUR_US
+
+        self.last_timestamp = timestamps[-1]
+        self.offset = offsets[-1]
+        return timestamps + offsets
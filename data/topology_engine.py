@@ -0,0 +1,209 @@
+from collections import OrderedDict, deque
+from typing import List, Dict, Tuple, Optional
+from data.packet_store import PacketColumns
+from config import NETWORK_TOPOLOGY_THRESHOLD, TRICKLE_I_MIN_MS, TOPOLOGY_EVIDENCE_WINDOW_SECONDS
+from config import TOPOLOGY_CONVERGENCE_STABLE_SECONDS, TOPOLOGY_CONVERGENCE_MIN_EVIDENCE_PER_NODE
+
+# Flags of the packets that open a flood in active mode, where the tool stimulates RESPONSE floods with GET messages
+RESPONSE_FLAGS = ('[RESP]',)
+
+class Flood:
+    """ State of a RESPONSE flood whose first trickle period has not passed yet. """
+
+    def __init__(self, source_mac: str, source_time: int, message_key: int) -> None:
+        self.source_mac = source_mac
+        self.source_time = source_time
+        self.message_key = message_key
+        # MAC address of every packet that rebroadcasted the message within the first trickle period
+        self.rebroadcasts = []
+        # Set when the message was rebroadcasted before 16 ms, i.e. the tool has not heard the original packet
+        self.too_early = False
+
+class TopologyEngine:
+    """
+    Streaming topology inference.
+
+    Packets are consumed in arrival order and only new packets are processed, so the cost of an update does not depend
+    on the length of the capture. It follows the same rules as `DataService.find_direct_connections`:
+
+    1. The first packet of an index and version (marked by the `PacketStore`) opens a flood, if it is a RESPONSE on the
+       index of its MAC address.
+    2. Packets of the same message from other nodes within the first trickle period (32 ms) are rebroadcasts.
+       A rebroadcast before 16 ms means the tool has not heard the original message, and the flood is discarded.
+    3. When the trickle period of a flood has passed, the flood is closed and every rebroadcast is counted as evidence
+       for its (source, rebroadcaster) pair.
+    4. Two nodes are connected while a pair in either direction has at least NETWORK_TOPOLOGY_THRESHOLD pieces
+       of evidence within the evidence window. Evidence older than the window expires and the connection is removed.
+
+    Every update returns the edge deltas as ('add', (mac1, mac2)) and ('remove', (mac1, mac2)), with the MAC
+    addresses of an edge sorted.
+
+    With `source_flags` None the engine is passive: the first packet of an index and version opens a flood whatever
+    its flags, so edges are inferred from the ordinary traffic of the mesh without any stimulation. Only RESPONSE
+    packets are checked against the index of their MAC address, other messages may be sent on any index.
+    """
+
+    def __init__(self, index_by_mac: Dict[str, int], threshold: int = NETWORK_TOPOLOGY_THRESHOLD,
+                 evidence_window_seconds: Optional[float] = TOPOLOGY_EVIDENCE_WINDOW_SECONDS,
+                 source_flags: Optional[Tuple[str, ...]] = RESPONSE_FLAGS) -> None:
+        self.index_by_mac = index_by_mac
+        self.source_flags = source_flags
+        self.threshold = threshold
+        self.window_us = TRICKLE_I_MIN_MS * 1000
+        self.evidence_window_us = None if evidence_window_seconds is None else int(evidence_window_seconds * 1e6)
+
+        # Floods in their first trickle period by IndexVersionKey, in order of their source time
+        self.open_floods = OrderedDict()
+        # Number of pieces of evidence for every (source, rebroadcaster) pair, and the evidence in order of time for expiry
+        self.pair_counts = {}
+        self.evidence = deque()
+        self.edges = set()
+        self.latest_time = None
+
+        # Convergence statistics: time of the last edge change (or the first packet), the time every edge was added,
+        # the number of floods each node has sourced, and all rebroadcasts ever counted for each pair and each rebroadcaster
+        self.last_change_time = None
+        self.edge_added_time = {}
+        self.floods_by_source = {}
+        self.pair_totals = {}
+        self.rebroadcasts_by_node = {}
+
+    def get_edges(self) -> set:
+        return self.edges
+
+    def get_convergence(self, stable_seconds: float = TOPOLOGY_CONVERGENCE_STABLE_SECONDS,
+                        min_evidence_per_node: int = TOPOLOGY_CONVERGENCE_MIN_EVIDENCE_PER_NODE) -> Dict:
+        """
+        Returns how settled the topology is, in capture time.
+
+        1. Per edge, the hit rate: pieces of evidence in the evidence window per second.
+        2. The time since an edge was last added or removed.
+        3. Per node, the number of floods it has sourced, its evidence (floods sourced and rebroadcasts of floods of other
+           nodes) and the fraction of the expected rebroadcasts of its floods that were heard, where every neighbor is
+           expected to rebroadcast every flood. Trickle suppresses redundant rebroadcasts, so the fraction is only a guide.
+        4. The topology has converged when there is at least one edge, no edge has changed for `stable_seconds`, and every
+           node that has taken part in a flood has at least `min_evidence_per_node` pieces of evidence.
+        """
+        now = self.latest_time
+        if now is None:
+            return {"converged": False, "stable_seconds": 0, "edges": {}, "nodes": {}}
+
+        edge_hit_rates = {}
+        neighbors = {}
+        for edge in self.edges:
+            mac1, mac2 = edge
+            hits = self.pair_counts.get(edge, 0) + self.pair_counts.get(edge[::-1], 0)
+            observed_us = max(now - self.edge_added_time[edge], 1)
+            if self.evidence_window_us is not None:
+                observed_us = min(observed_us, self.evidence_window_us)
+            edge_hit_rates[edge] = hits / (observed_us / 1e6)
+            neighbors.setdefault(mac1, []).append(mac2)
+            neighbors.setdefault(mac2, []).append(mac1)
+
+        nodes = self.get_node_evidence(min_evidence_per_node, neighbors)
+        stable = (now - self.last_change_time) / 1e6
+        # Nodes of the site that have never been heard do not hold back convergence, they may be switched off
+        converged = bool(self.edges) and stable >= stable_seconds and \
+            all(not node["needs_probe"] for node in nodes.values() if node["heard"])
+        return {"converged": converged, "stable_seconds": stable, "edges": edge_hit_rates, "nodes": nodes}
+
+    def get_node_evidence(self, min_evidence_per_node: int = TOPOLOGY_CONVERGENCE_MIN_EVIDENCE_PER_NODE,
+                          neighbors: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict]:
+        """
+        Returns the evidence of every node that has been heard and of every node of the site.
+
+        Per node: the number of floods it has sourced, its evidence (floods sourced and rebroadcasts of floods of other
+        nodes), the fraction of the expected rebroadcasts of its floods that were heard, whether it has taken part in any
+        flood, and whether it needs a targeted probe because it has less than `min_evidence_per_node` pieces of evidence.
+        """
+        if neighbors is None:
+            neighbors = {}
+            for mac1, mac2 in self.edges:
+                neighbors.setdefault(mac1, []).append(mac2)
+                neighbors.setdefault(mac2, []).append(mac1)
+
+        nodes = {}
+        heard_macs = set(self.floods_by_source) | set(self.rebroadcasts_by_node) | set(neighbors)
+        for mac in heard_macs | set(self.index_by_mac):
+            floods = self.floods_by_source.get(mac, 0)
+            expected = floods * len(neighbors.get(mac, []))
+            heard = sum(self.pair_totals.get((mac, neighbor), 0) for neighbor in neighbors.get(mac, []))
+            evidence = floods + self.rebroadcasts_by_node.get(mac, 0)
+            nodes[mac] = {"floods": floods, "evidence": evidence, "expected_fraction": min(heard / expected, 1.0) if expected else None,
+                          "heard": mac in heard_macs, "needs_probe": evidence < min_evidence_per_node}
+        return nodes
+
+    def process(self, packets: PacketColumns) -> List[Tuple[str, Tuple[str, str]]]:
+        """ Consume new packets in arrival order and return the resulting edge deltas. """
+        deltas = []
+        for time_us, mac, flags, index, _, index_version_key, message_key, first in packets.rows():
+            self.latest_time = time_us if self.latest_time is None else max(self.latest_time, time_us)
+            if self.last_change_time is None:
+                self.last_change_time = time_us
+            self._close_floods(self.latest_time, deltas)
+
+            flood = self.open_floods.get(index_version_key)
+            if flood is not None:
+                if message_key == flood.message_key and mac != flood.source_mac:
+                    delay = abs(time_us - flood.source_time)
+                    if delay < self.window_us // 2:
+                        flood.too_early = True
+                    elif delay < self.window_us:
+                        flood.rebroadcasts.append(mac)
+                continue
+
+            # The first packet of an index and version is the source packet, if it has one of the source flags
+            if not first or (self.source_flags is not None and flags not in self.source_flags):
+                continue
+            # A node sends response messages on its own index. MACs that are not in the site data are always accepted.
+            mac_index = self.index_by_mac.get(mac) if flags == '[RESP]' else None
+            if mac_index is None or mac_index == index:
+                self.open_floods[index_version_key] = Flood(mac, time_us, message_key)
+
+        if self.latest_time is not None:
+            self._expire(self.latest_time, deltas)
+        return deltas
+
+    def _close_floods(self, now: int, deltas: List) -> None:
+        """ Close all floods whose first trickle period has passed and count their rebroadcasts. """
+        while self.open_floods:
+            index_version_key, flood = next(iter(self.open_floods.items()))
+            if flood.source_time + self.window_us > now:
+                break
+            del self.open_floods[index_version_key]
+            if flood.too_early:
+                continue
+            self.floods_by_source[flood.source_mac] = self.floods_by_source.get(flood.source_mac, 0) + 1
+            for mac in flood.rebroadcasts:
+                self.pair_totals[(flood.source_mac, mac)] = self.pair_totals.get((flood.source_mac, mac), 0) + 1
+                self.rebroadcasts_by_node[mac] = self.rebroadcasts_by_node.get(mac, 0) + 1
+                pair = (flood.source_mac, mac)
+                self.evidence.append((flood.source_time, pair))
+                self.pair_counts[pair] = self.pair_counts.get(pair, 0) + 1
+                self._update_edge(pair, deltas)
+
+    def _expire(self, now: int, deltas: List) -> None:
+        """ Forget evidence that is older than the evidence window. """
+        if self.evidence_window_us is None:
+            return
+        while self.evidence and now - self.evidence[0][0] >= self.evidence_window_us:
+            _, pair = self.evidence.popleft()
+            self.pair_counts[pair] -= 1
+            if self.pair_counts[pair] == 0:
+                del self.pair_counts[pair]
+            self._update_edge(pair, deltas)
+
+    def _update_edge(self, pair: Tuple[str, str], deltas: List) -> None:
+        """ Add or remove the edge of a pair after its evidence changed. """
+        edge = tuple(sorted(pair))
+        connected = max(self.pair_counts.get(pair, 0), self.pair_counts.get(pair[::-1], 0)) >= self.threshold
+        if connected and edge not in self.edges:
+            self.edges.add(edge)
+            self.edge_added_time[edge] = self.latest_time
+            self.last_change_time = self.latest_time
+            deltas.append(('add', edge))
+        elif not connected and edge in self.edges:
+            self.edges.discard(edge)
+            del self.edge_added_time[edge]
+            self.last_change_time = self.latest_time
+            deltas.append(('remove', edge))
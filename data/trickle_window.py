@@ -0,0 +1,35 @@
+import numpy as np
+from typing import Tuple
+
+def max_packets_in_window(group_keys: np.ndarray, timestamps: np.ndarray, window_us: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For every group, the maximum number of its packets within any window of `window_us` microseconds.
+
+    The result is the same as counting with a time-based rolling window, `(t - window, t]` for every packet, and taking the
+    maximum per group. All groups are handled at once: the packets are sorted by (group, time) and every group is
+    shifted onto its own time range, so a single `np.searchsorted` finds the start of the window of every packet.
+
+    It counts the indirect acknowledgements of `DataService.calculate_mdr_matrix`. A single pair is handled by `MDREngine`,
+    which keeps the window of every pending message as packets arrive.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The sorted unique group keys and the maximum count of each of them.
+    """
+    if len(group_keys) == 0:
+        return np.empty(0, dtype=np.asarray(group_keys).dtype), np.empty(0, dtype=np.int64)
+
+    order = np.lexsort((timestamps, group_keys))
+    sorted_keys = np.asarray(group_keys)[order]
+    sorted_times = np.asarray(timestamps, dtype=np.int64)[order]
+
+    group_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    group_numbers = np.cumsum(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) - 1
+
+    # Place each group after the previous one with a gap larger than the window, so windows never reach into another group
+    relative_times = sorted_times - sorted_times.min()
+    group_span = relative_times.max() + window_us + 1
+    shifted_times = group_numbers * group_span + relative_times
+
+    window_starts = np.searchsorted(shifted_times, shifted_times - window_us, side='right')
+    counts = np.arange(len(shifted_times)) - window_starts + 1
+    return sorted_keys[group_starts], np.maximum.reduceat(counts, group_starts)
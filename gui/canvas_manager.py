@@ -41,6 +41,12 @@ class CanvasManager:
                             pass
                     
     def redraw_edge_colors(self, mdr_result):
+        # MDR of every pair of label numbers, in both directions, so each edge is a single lookup
+        mdr_by_pair = {}
+        for mdr_result_node in reversed(mdr_result):
+            node_pair = (mdr_result_node['source_label']['number'], mdr_result_node['destination_label']['number'])
+            mdr_by_pair[node_pair] = mdr_by_pair[node_pair[::-1]] = mdr_result_node['mdr']
+        
         for edge in self.G.edges:
             start_pos = np.array(self.pos[edge[0]])
             end_pos = np.array(self.pos[edge[1]])
@@ -55,16 +61,9 @@ class CanvasManager:
             node1 = self.G.edges[edge]['node1']
             node2 = self.G.edges[edge]['node2']
             
-            # Find node1 and node2 in mdr_result dictionary
-            for mdr_result_node in mdr_result:
-                if mdr_result_node['source_label']['number'] == node1 and mdr_result_node['destination_label']['number'] == node2:
-                    mdr = mdr_result_node['mdr']
-                    break
-                elif mdr_result_node['source_label']['number'] == node2 and mdr_result_node['destination_label']['number']== node1:
-                    mdr = mdr_result_node['mdr']
-                    break
-            else:
+            if (node1, node2) not in mdr_by_pair:
                 continue
+            mdr = mdr_by_pair[(node1, node2)]
                 
             if mdr is None:
                 color = (255, 255, 255)
@@ -77,7 +76,7 @@ class CanvasManager:
             
             dpg.draw_line(start_pos, end_pos, thickness=1, color=color, parent="__topology_analysis_drawing_canvas")
 
-    def plot_data(self, connections, mac_to_letter):
+    def plot_data(self, connections, isolated_nodes, mac_to_letter):
         canvas_width = DRAWLIST_SIZE[0]
         canvas_height = DRAWLIST_SIZE[1]
         
@@ -85,12 +84,10 @@ class CanvasManager:
         self.G.clear()
         dpg.draw_rectangle((0, 0), (DRAWLIST_SIZE[0], DRAWLIST_SIZE[1]), color=(255, 255, 255), thickness=1, parent="__topology_analysis_drawing_canvas")
         
-        for connection in connections:
-            start, end = connection
-            if (connection[1] == "0"):
-                self.G.add_node(mac_to_letter[start]['number'])
-            else:
-                self.G.add_edge(mac_to_letter[start]['number'], mac_to_letter[end]['number'], weight=1, node1 = mac_to_letter[start]['number'], node2 = mac_to_letter[end]['number'])
+        for node in isolated_nodes:
+            self.G.add_node(mac_to_letter[node]['number'])
+        for start, end in connections:
+            self.G.add_edge(mac_to_letter[start]['number'], mac_to_letter[end]['number'], weight=1, node1 = mac_to_letter[start]['number'], node2 = mac_to_letter[end]['number'])
             
         # Adjust the spring layout's distance parameter dynamically based on the number of nodes
         node_count = len(self.G.nodes)
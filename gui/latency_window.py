@@ -1,6 +1,8 @@
 import dearpygui.dearpygui as dpg
-from config import CANVAS_WINDOW_SIZE, WINDOW_SIZE, LATENCY_WINDOW_SIZE, LATENCY_HISTOGRAM_TIMESLOT_SIZE_SEC
+from config import CANVAS_WINDOW_SIZE, WINDOW_SIZE, LATENCY_WINDOW_SIZE, LATENCY_HISTOGRAM_TIMESLOT_SIZE_SEC, LATENCY_MAP_PERCENTILES, RESULTS_PAGE_SIZE
 from network.latency_service import LatencyService
+from data.results_store import ResultsStore
+from data.latency_sketch import LatencySketch
 from gui.canvas_manager import CanvasManager
 
 class LatencyTab:
@@ -37,16 +39,16 @@ class LatencyWindow:
         self.latency_action_handler = LatencyService(self._analysis_complete_callback)
         self.theoretical_latency = 0
         self.site = ""                                                                    # site for which the analysis is being performed
-        self.avg_latency_list = [0] * 50
-        self.max_latency_list = [0]* 50
-        self.theoretical_latency_list = [0]* 50
+        self.current_latency = None                                                       # (avg, max) latency of the running run
+        self.history_runs = []                                                            # Page of runs shown in the average latency plot
+        self.history_before_run_id = None                                                 # None shows the newest page of runs
     
     def create_latency_window(self, site: str) -> None:
         
         self.site = site
-        self.avg_latency_list = [0]* 50
-        self.max_latency_list = [0]* 50
-        self.theoretical_latency_list = [0]* 50
+        self.current_latency = None
+        self.history_runs = []
+        self.history_before_run_id = None
         
         # Get Mac to letter map for dropdown menu
         mac_label_map = self.latency_action_handler.latency_service_get_mac_label_map()
@@ -69,10 +71,20 @@ class LatencyWindow:
                 dpg.add_text("", tag="__latency_error_text", color=(255, 0, 0))
                 dpg.add_loading_indicator(tag="__latency_loading_indicator", show=False)
             dpg.add_text("", tag="__latency_error_text2", color=(255, 0, 0))
+            dpg.add_button(label="LATENCY MAP", callback=self._on_latency_map_button_callback, tag="__latency_map_button")
+            dpg.add_text("", tag="__latency_quantiles_text")
+            dpg.add_text("", tag="__latency_pair_quantiles_text")
             
             # Prepare plots
             self._prepare_plot()
             
+            # Browse the runs of the chosen pair stored in the results store, one page at a time
+            with dpg.group(horizontal=True, parent="__latency_window"):
+                dpg.add_button(label="Older Runs", callback=self._on_older_runs_button_callback, tag="__latency_older_runs_button")
+                dpg.add_button(label="Latest Runs", callback=self._on_latest_runs_button_callback, tag="__latency_latest_runs_button")
+                dpg.add_combo(label="Show Run Histogram", items=[], tag="__latency_history_run", width=200,
+                              callback=self._on_history_run_callback)
+            
             # Add button to start latency test            
             dpg.add_button(label="Start Latency Test", callback=self.start_latency_button_cb, tag="__start_stop_latency_button", parent="__latency_window")
         
@@ -131,7 +143,9 @@ class LatencyWindow:
             
             manual_mode = dpg.get_value("__latency_manual_mode_checkbox")
             
-            # Start analysis
+            # Start analysis, the history shows the newest runs of the pair including this one
+            self.current_latency = None
+            self.history_before_run_id = None
             self.latency_action_handler.start_latency_analysis(source_mac, destination_mac, self._update_latency_histogram_callback, 
                                                                self.site, manual_mode, CanvasManager().get_node_neighbor_map())
             
@@ -155,55 +169,55 @@ class LatencyWindow:
         dpg.configure_item("__start_stop_latency_button", label="Start Latency Analysis", callback=self.start_latency_button_cb)
         dpg.configure_item("__latency_loading_indicator", show=False)
 
-    def _map_latency_to_custom_bins(self, latency_list, bin_size=5):
-        """
-        Map the given latency values to custom bins of a specified size and normalize the histogram
-        to reflect probabilities of each bin.
-
-        Args:
-            latency_list (list): A list of latency values.
-            bin_size (int, optional): The size of each bin. Defaults to 5.
-
-        Returns:
-            list: A list of normalized counts for each bin which reflect the probability distribution
-            of the observed latency values.
-        """
-        # Determine the maximum latency to understand the range of data.
-        max_latency = max(latency_list)
-        # Calculate the number of bins needed by dividing the maximum latency by the bin size.
-        # The ceil operation (achieved through integer division plus 1) ensures that any remaining
-        # latency value that does not perfectly divide by the bin size is accounted for in a final bin.
-        num_bins = int(max_latency // bin_size) + 1
+    def _on_latency_map_button_callback(self):
+        """ Compute the latency from every node to every other node from the latency capture and show the median as a heat map, rows are sources. """
+        macs, latency_matrix, pairs = self.latency_action_handler.calculate_latency_map()
+        if not pairs:
+            dpg.configure_item("__latency_error_text", default_value="No floods captured to compute the latency map from")
+            return
         
-        # Initialize a list with zero counts for each bin.
-        # This array will hold the raw count of latency events that fall into each bin.
-        bin_counts = [0] * num_bins
+        mac_label_map = self.latency_action_handler.latency_service_get_mac_label_map()
+        labels = [str(mac_label_map[mac]['number']) for mac in macs]
+        # Pairs without samples are shown as 0
+        values = [value if value == value else 0 for row in latency_matrix for value in row]
+        max_latency = max(values)
         
-        # Iterate over each latency value in the provided list.
-        for latency in latency_list:
-            # Determine the bin index for each latency value using floor division.
-            # This groups each latency value into the correct bin by its size.
-            bin_index = int(latency // bin_size)
-            # Increment the count of the corresponding bin to count how many latencies fall into this range.
-            bin_counts[bin_index] += 1
+        if dpg.does_item_exist("__latency_map_window"):
+            dpg.delete_item("__latency_map_window")
+        with dpg.window(label=f"Latency Map ({len(pairs)} pairs with samples)", tag="__latency_map_window",
+                        width=LATENCY_WINDOW_SIZE[0] // 2, height=LATENCY_WINDOW_SIZE[1] // 2):
+            with dpg.group(horizontal=True):
+                dpg.add_colormap_scale(min_scale=0, max_scale=max_latency, height=LATENCY_WINDOW_SIZE[1] // 2 - 60)
+                with dpg.plot(label="Median First Rebroadcast Latency (ms)", height=-1, width=-1):
+                    dpg.add_plot_axis(dpg.mvXAxis, label="Node", no_gridlines=True, tag="__latency_map_x_axis")
+                    dpg.set_axis_ticks("__latency_map_x_axis", tuple((label, (i + 0.5) / len(labels)) for i, label in enumerate(labels)))
+                    with dpg.plot_axis(dpg.mvYAxis, label="Source", no_gridlines=True, tag="__latency_map_y_axis"):
+                        dpg.set_axis_ticks("__latency_map_y_axis", tuple((label, 1 - (i + 0.5) / len(labels)) for i, label in enumerate(labels)))
+                        dpg.add_heat_series(values, rows=len(labels), cols=len(labels), scale_min=0, scale_max=max_latency, format="")
 
-        # Normalize the histogram to create a probability distribution.
-        # First, calculate the total number of events observed.
-        total_events = sum(bin_counts)
-        # Create a new list of normalized counts, where each count is divided by the total number of events.
-        # This transformation converts raw counts into a probability that a randomly selected latency value
-        # from the list falls into a given bin.
-        normalized_bin_counts = [count / total_events for count in bin_counts]
+    def _update_latency_histogram_callback(self, latency_sketch, avg_latency, max_latency, pair_sketch=None):
+        
+        self._plot_histogram(latency_sketch)
+        dpg.configure_item("__latency_quantiles_text", default_value=self._format_quantiles("Samples", latency_sketch))
+        # The samples of all runs of the pair are sent with the last update of a run
+        if pair_sketch is not None:
+            dpg.configure_item("__latency_pair_quantiles_text", default_value=self._format_quantiles("All runs of the pair, samples", pair_sketch))
+        
+        self.current_latency = (avg_latency, max_latency)
+        self._plot_history()
 
-        return normalized_bin_counts
+    @staticmethod
+    def _format_quantiles(title: str, latency_sketch: LatencySketch) -> str:
+        quantiles = latency_sketch.get_summary(LATENCY_MAP_PERCENTILES)
+        return (f"{title}: {quantiles['samples']}   " +
+                "   ".join(f"p{percentile}: {quantiles[f'p{percentile}']:.2f} ms" for percentile in LATENCY_MAP_PERCENTILES) +
+                f"   max: {quantiles['max']:.2f} ms")
 
-    
-    def _update_latency_histogram_callback(self, latency_list, avg_latency, max_latency, consecutive_runs):
-        
-        ################## HISTOGRAM PLOT ##################
+    def _plot_histogram(self, latency_sketch: LatencySketch) -> None:
+        """ Plot the normalized histogram of the latency samples in a sketch. """
         bin_size = LATENCY_HISTOGRAM_TIMESLOT_SIZE_SEC
-        # Map result from latency analysis to custom, normalized bins
-        normalized_bins = self._map_latency_to_custom_bins(latency_list, bin_size=bin_size)
+        # Normalized histogram of the latency samples, straight from the sketch buckets
+        normalized_bins = latency_sketch.get_histogram(bin_size)
        
         x_axis = [i*bin_size + bin_size/2 for i in range(len(normalized_bins))] # Middle point of each bin
         if dpg.does_item_exist("__histogram_bars"):
@@ -211,56 +225,88 @@ class LatencyWindow:
         else:
             dpg.add_bar_series(x_axis, normalized_bins, weight=bin_size-0.1, tag="__histogram_bars",parent="__latency_histogram_y_axis")
         
-        ################## AVG LATENCY PLOT ##################
-        # Get selected source and destination
-        source = dpg.get_value("__latency_source")
-        destination = dpg.get_value("__latency_destination")
+        dpg.set_axis_limits_auto("__latency_histogram_y_axis")
+        dpg.set_axis_limits_auto("__latency_histogram_x_axis")
+        dpg.fit_axis_data("__latency_histogram_y_axis")
+        dpg.fit_axis_data("__latency_histogram_x_axis")
 
-        # Split the source and destination strings
-        source_parts = source.split(':')
-        destination_parts = destination.split(':')
+    def _plot_history(self) -> None:
+        """
+        Plot the average, max and theoretical latency of one page of runs of the chosen pair, oldest on the left.
 
-        ticks = [1 + (i * 5) for i in range(consecutive_runs)]
-        labels = []
-        for i in range(consecutive_runs):
-            # Create the label for this run
-            source_label = f"{source_parts[0].strip()}: {source_parts[1].strip()}"
-            destination_label = f"{destination_parts[0].strip()}: {destination_parts[1].strip()}"
-            run_label = f"Run {i+1}"
-            label = f"{source_label} <-> {destination_label}\n{run_label}"
-            labels.append(label)
+        The runs are read from the results store. The running run has no summary yet, it is shown with the latest
+        latency reported by the analysis. The theoretical latency is the one of the current topology.
+        """
+        pair = self._get_selected_pair()
+        if pair is None:
+            return
+        source, destination = dpg.get_value("__latency_source"), dpg.get_value("__latency_destination")
+        source_label = ": ".join(part.strip() for part in source.split(':')[:2])
+        destination_label = ": ".join(part.strip() for part in destination.split(':')[:2])
         
-        # Combine the ticks and labels into a list of tuples
-        ticks_and_labels = list(zip(labels, ticks))
-        dpg.set_axis_ticks("__avg_latency_x_axis", tuple(ticks_and_labels))
+        runs = ResultsStore().get_runs(self.site, kind='latency', source=pair[0], destination=pair[1], before_run_id=self.history_before_run_id)
+        self.history_runs = runs[::-1]
+        avg_latencies, max_latencies = [], []
+        for run in self.history_runs:
+            if run['ended_at'] is None and run['run_id'] == self.latency_action_handler.run_id and self.current_latency is not None:
+                avg_latency, max_latency = self.current_latency
+            else:
+                avg_latency, max_latency = run['avg_latency'] or 0, run['max_latency'] or 0
+            avg_latencies.append(round(avg_latency, 2))
+            max_latencies.append(max_latency)
+        theoretical_latencies = [self.theoretical_latency] * len(self.history_runs)
         
+        bar_x = [1 + (i * 5) for i in range(len(self.history_runs))]
+        labels = [f"{source_label} <-> {destination_label}\nRun {run['run_id']}" for run in self.history_runs]
+        dpg.set_axis_ticks("__avg_latency_x_axis", tuple(zip(labels, bar_x)))
+        dpg.configure_item("__latency_history_run", items=[f"Run {run['run_id']}" for run in self.history_runs])
         
-        self.avg_latency_list[consecutive_runs - 1] = round(avg_latency, 2)
-        self.max_latency_list[consecutive_runs - 1] = max_latency
-        self.theoretical_latency_list[consecutive_runs - 1] = self.theoretical_latency
-        bar_x = [1 + (i * 5) for i in range(consecutive_runs)]
         bar_width = 1
         if dpg.does_item_exist("__avg_latency"):
-            dpg.configure_item("__avg_latency", x=bar_x, y=self.avg_latency_list, weight=bar_width)
-            dpg.configure_item("__max_latency", x=[x + 1 for x in bar_x], y=self.max_latency_list, weight=bar_width)
-            dpg.configure_item("__theoretical_latency", x=[x - 1 for x in bar_x], y=self.theoretical_latency_list, weight=bar_width)
+            dpg.configure_item("__avg_latency", x=bar_x, y=avg_latencies, weight=bar_width)
+            dpg.configure_item("__max_latency", x=[x + 1 for x in bar_x], y=max_latencies, weight=bar_width)
+            dpg.configure_item("__theoretical_latency", x=[x - 1 for x in bar_x], y=theoretical_latencies, weight=bar_width)
         else:
-            dpg.add_bar_series(bar_x, self.avg_latency_list, label="Average Latency", weight=bar_width, 
+            dpg.add_bar_series(bar_x, avg_latencies, label="Average Latency", weight=bar_width, 
                                parent="__avg_latency_y_axis", tag = "__avg_latency")
-            dpg.add_bar_series([x + 1 for x in bar_x], self.max_latency_list, label="Max Latency", 
+            dpg.add_bar_series([x + 1 for x in bar_x], max_latencies, label="Max Latency", 
                                weight=bar_width, parent="__avg_latency_y_axis", tag="__max_latency")
-            dpg.add_bar_series([x - 1 for x in bar_x], self.theoretical_latency_list, label=f"Theoretical Latency", 
+            dpg.add_bar_series([x - 1 for x in bar_x], theoretical_latencies, label=f"Theoretical Latency", 
                                weight=bar_width, parent="__avg_latency_y_axis", tag="__theoretical_latency")
             
-        dpg.set_axis_limits_auto("__latency_histogram_y_axis")
-        dpg.set_axis_limits_auto("__latency_histogram_x_axis")
-        dpg.fit_axis_data("__latency_histogram_y_axis")
-        dpg.fit_axis_data("__latency_histogram_x_axis")
         dpg.set_axis_limits_auto("__avg_latency_y_axis")
         dpg.set_axis_limits_auto("__avg_latency_x_axis")
         dpg.fit_axis_data("__avg_latency_y_axis")
         dpg.fit_axis_data("__avg_latency_x_axis")
 
+    def _on_older_runs_button_callback(self):
+        """ Show the page of runs before the oldest run shown, if the page shown is full. """
+        if len(self.history_runs) == RESULTS_PAGE_SIZE:
+            self.history_before_run_id = self.history_runs[0]['run_id']
+            self._plot_history()
+
+    def _on_latest_runs_button_callback(self):
+        """ Show the newest page of runs. """
+        self.history_before_run_id = None
+        self._plot_history()
+
+    def _on_history_run_callback(self, sender, app_data):
+        """ Plot the histogram of a stored run, from its latency samples read page by page. """
+        run_id = int(app_data.split(" ")[1])
+        latency_sketch = LatencySketch()
+        samples = ResultsStore().get_latency_samples(run_id)
+        while samples:
+            latency_sketch.add([sample['latency_ms'] for sample in samples])
+            samples = ResultsStore().get_latency_samples(run_id, after_id=samples[-1]['id'])
+        self._plot_histogram(latency_sketch)
+
+    def _get_selected_pair(self):
+        """ Returns the MAC addresses of the chosen source and destination, None if they are not chosen. """
+        try:
+            return dpg.get_value("__latency_source").split(": ")[2], dpg.get_value("__latency_destination").split(": ")[2]
+        except (AttributeError, IndexError):
+            return None
+
     def _delete_window(self,sender):
         """When the window is closed, delete the window and its associated items."""
         dpg.delete_item(sender)
@@ -1,10 +1,9 @@
 
 import dearpygui.dearpygui as dpg
 from typing import List
-import os
 from network.mesh_communication import MeshCommunicationService
 from config import WINDOW_SIZE
-import json
+from data.site_registry import SiteRegistry
 
 class LogInWindowManager:
     def __init__(self):
@@ -29,10 +28,7 @@ class LogInWindowManager:
     @staticmethod      
     def get_sites() -> List:
         """ Find all available sites, remove .json extension and return the list of sites """
-        try:
-            return [os.path.splitext(filename)[0] for filename in os.listdir("./.auth")]
-        except:
-            return []
+        return SiteRegistry.get_site_names()
         
     # Function to get hex keys from the file
     @staticmethod
@@ -46,18 +42,8 @@ class LogInWindowManager:
         Returns:
             List: A list containing the access address and crypto key.
         """
-        hex_keys = []
-        # Construct the file path
-        file_path = os.path.join("./.auth", f"{selected_site}.json")
-        # Open the file and read the first two lines
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-        
-        access_addr = data["accessAddr"]
-        crypto_key = data["cryptoKey"]
-        hex_keys = [access_addr, crypto_key]
-        
-        return hex_keys
+        site = SiteRegistry().get(selected_site)
+        return [site.access_addr, site.crypto_key]
 
     # Function to handle the monitoring button click
     def _on_monitoring_button(self, sender: str) -> None:
@@ -30,7 +30,7 @@ class MDRTab:
 class MDRWindow:
     
     def __init__(self) -> None:
-        self.mdr_service = MDRService(self._plot_mdr_callback)
+        self.mdr_service = MDRService(self._plot_mdr_callback, self._analysis_complete_callback)
         self.conn_mdr_map = {}
         self.site = ""
     
@@ -64,6 +64,8 @@ class MDRWindow:
                     
             # Prepare place for error text
             dpg.add_text("", tag="__mdr_error_text", color=(255, 0, 0))
+            # MDR of all node pairs from everything captured so far
+            dpg.add_button(label="ALL PAIRS MDR", callback=self._on_all_pairs_mdr_button_callback, tag="__all_pairs_mdr_button")
             # Add bar plot for mdr values
             self._prepare_plot()
             
@@ -126,6 +128,31 @@ class MDRWindow:
         dpg.delete_item("__mdr_window")
         dpg.delete_item(sender)
         
+    def _on_all_pairs_mdr_button_callback(self):
+        """ Compute the MDR of all node pairs from the MDR capture and show it as a heat map, rows are sources and columns destinations. """
+        macs, mdr_matrix, edges = self.mdr_service.calculate_all_pairs_mdr(self.site, CanvasManager().get_node_neighbor_map())
+        if not macs:
+            dpg.configure_item("__mdr_error_text", default_value="No nodes to compute MDR for")
+            return
+        
+        mac_label_map = self.mdr_service.get_mac_label_map()
+        labels = [str(mac_label_map[mac]['number']) for mac in macs]
+        # Pairs without enough source messages are shown as 0
+        values = [value if value == value else 0 for row in mdr_matrix for value in row]
+        
+        if dpg.does_item_exist("__mdr_matrix_window"):
+            dpg.delete_item("__mdr_matrix_window")
+        with dpg.window(label=f"All Pairs MDR ({len(edges)} pairs with acknowledgements)", tag="__mdr_matrix_window",
+                        width=MDR_WINDOW_SIZE[0] // 2, height=MDR_WINDOW_SIZE[1] // 2):
+            with dpg.group(horizontal=True):
+                dpg.add_colormap_scale(min_scale=0, max_scale=100, height=MDR_WINDOW_SIZE[1] // 2 - 60)
+                with dpg.plot(label="MDR (%)", height=-1, width=-1):
+                    dpg.add_plot_axis(dpg.mvXAxis, label="Destination", no_gridlines=True, tag="__mdr_matrix_x_axis")
+                    dpg.set_axis_ticks("__mdr_matrix_x_axis", tuple((label, (i + 0.5) / len(labels)) for i, label in enumerate(labels)))
+                    with dpg.plot_axis(dpg.mvYAxis, label="Source", no_gridlines=True, tag="__mdr_matrix_y_axis"):
+                        dpg.set_axis_ticks("__mdr_matrix_y_axis", tuple((label, 1 - (i + 0.5) / len(labels)) for i, label in enumerate(labels)))
+                        dpg.add_heat_series(values, rows=len(labels), cols=len(labels), scale_min=0, scale_max=100, format="")
+        
     def _on_stop_mdr_button_callback(self):
         """
         Executes when the stop button for the mdr service is clicked. Prints a message indicating that the stop button was pressed, 
@@ -137,6 +164,12 @@ class MDRWindow:
         dpg.delete_item("__stop_mdr")
         dpg.add_button(label="START MDR", callback=self._on_start_mdr_button_callback, tag="__start_mdr_button", parent="__mdr_window")
         
+    def _analysis_complete_callback(self):
+        """ Executes when the MDR service ended the run by itself, because the MDR is known precisely enough. Swaps the stop button for a start button. """
+        if dpg.does_item_exist("__stop_mdr"):
+            dpg.delete_item("__stop_mdr")
+            dpg.add_button(label="START MDR", callback=self._on_start_mdr_button_callback, tag="__start_mdr_button", parent="__mdr_window")
+        
     def _plot_mdr_callback(self, result, mac_label_map, consecutive_runs):
         """
         Plot mdr values with Dear PyGui, including connection labels and mdr percentages.
@@ -149,6 +182,7 @@ class MDRWindow:
             label = f"{conn['source_label']['number']}: {conn['source_label']['title']} <-> {conn['destination_label']['number']}: {conn['destination_label']['title']}: Run {consecutive_runs}"
             mdr_value = conn['mdr'] if conn['mdr'] is not None else 0  # mdr Percentage
             self.conn_mdr_map[label] = {'mdr': mdr_value, 'throughput': throughput}
+            self._plot_mdr_trend(label, conn.get('window_series', []))
 
         for i, (label, values) in enumerate(self.conn_mdr_map.items()):
             mdr_value = values['mdr']
@@ -179,8 +213,19 @@ class MDRWindow:
         dpg.fit_axis_data("__throughput_plot_x_axis")
         
         
+    def _plot_mdr_trend(self, label: str, window_series: list):
+        """ Plot the sliding window MDR of a run over time. """
+        x = [point['time'] for point in window_series]
+        y = [point['mdr'] if point['mdr'] is not None else 0 for point in window_series]
+        if dpg.does_item_exist(f'{label}_trend'):
+            dpg.configure_item(item = f'{label}_trend', x=x, y=y)
+        else:
+            dpg.add_line_series(x, y, label=label, parent="__mdr_trend_plot_y_axis", tag = f'{label}_trend')
+        dpg.set_axis_limits("__mdr_trend_plot_y_axis", 0, 110)
+        dpg.fit_axis_data("__mdr_trend_plot_x_axis")
+        
     def _prepare_plot(self):
-        with dpg.subplots(2, 1, height=MDR_WINDOW_SIZE[1]-200, width=-1):
+        with dpg.subplots(3, 1, height=MDR_WINDOW_SIZE[1]-200, width=-1):
             
             with dpg.plot(label="Message-Delivery-Rate (MDR) Plot", height=(MDR_WINDOW_SIZE[1]/2)-300, width=MDR_WINDOW_SIZE[0] - 100, tag="__mdr_plot"):
                 dpg.add_plot_legend(outside=True)
@@ -192,4 +237,9 @@ class MDRWindow:
                 dpg.add_plot_legend(outside=True)
                 dpg.add_plot_axis(dpg.mvXAxis, label="Connection", no_gridlines=True, 
                                         no_tick_labels=True, tag="__throughput_plot_x_axis")
-                dpg.add_plot_axis(dpg.mvYAxis, label="Throughput (Msg/s)", tag="__throughput_plot_y_axis")
\ No newline at end of file
+                dpg.add_plot_axis(dpg.mvYAxis, label="Throughput (Msg/s)", tag="__throughput_plot_y_axis")
+                
+            with dpg.plot(label="MDR Over Time Plot", height=(MDR_WINDOW_SIZE[1]/2)-300, width=MDR_WINDOW_SIZE[0] - 100, tag="__mdr_trend_plot"):
+                dpg.add_plot_legend(outside=True)
+                dpg.add_plot_axis(dpg.mvXAxis, label="Time (s)", tag="__mdr_trend_plot_x_axis")
+                dpg.add_plot_axis(dpg.mvYAxis, label="Windowed MDR (%)", tag="__mdr_trend_plot_y_axis")
\ No newline at end of file
@@ -12,11 +12,21 @@ class topologyAnalysisInterfaceManager:
     def create_topology_analysis_button(self, site_name, reset_callback):
         
         self.site_name = site_name
-        self.discover_handler = TopologyAnalysisService()
+        self.discover_handler = TopologyAnalysisService(self._on_converged, self._on_nodes_needing_probe, self._on_flood_metrics)
         self.reset_callback = reset_callback
         
         dpg.add_button(label="START Topology Analysis", callback=self._on_start, tag="__start_stop_topology_analysis_button", 
                        parent="__topology_analysis_window", height=30)
+        dpg.add_checkbox(label="Passive (no TX)", tag="__topology_passive_checkbox", parent="__topology_analysis_window")
+        dpg.add_text(default_value="", tag="__topology_probe_text", parent="__topology_analysis_window")
+        dpg.add_checkbox(label="Trace floods", tag="__topology_flood_trace_checkbox", parent="__topology_analysis_window")
+        dpg.add_text(default_value="", tag="__topology_flood_text", parent="__topology_analysis_window")
+        with dpg.group(horizontal=True, parent="__topology_analysis_window"):
+            dpg.add_text("Trace message:")
+            dpg.add_input_int(label="Index", tag="__topology_flood_index", width=100, min_value=0, min_clamped=True)
+            dpg.add_input_int(label="Version", tag="__topology_flood_version", width=100, min_value=0, min_clamped=True)
+            dpg.add_button(label="Show", callback=self._on_show_flood_trace, tag="__topology_flood_trace_button")
+        dpg.add_text(default_value="", tag="__topology_flood_trace_text", parent="__topology_analysis_window", wrap=DRAWLIST_SIZE[0])
         
         
         dpg.add_text("Find shortest paths:", parent="__topology_analysis_window")
@@ -37,12 +47,55 @@ class topologyAnalysisInterfaceManager:
         print("Start Topology Analysis button pressed")
         
         # Start Topology analysis
-        self.discover_handler.start_topology_analysis(self.site_name)
+        self.discover_handler.start_topology_analysis(self.site_name, dpg.get_value("__topology_passive_checkbox"),
+                                                     dpg.get_value("__topology_flood_trace_checkbox"))
+        dpg.set_value("__topology_probe_text", "")
+        dpg.set_value("__topology_flood_text", "")
+        dpg.set_value("__topology_flood_trace_text", "")
         
         dpg.delete_item("__start_topology_analysis_button")
         dpg.configure_item(item ="__start_stop_topology_analysis_button", label="STOP Topology Analysis", callback=self._on_stop, 
                            tag="__stop_topology_analysis_button", parent="__topology_analysis_window")
             
+    def _on_converged(self):
+        """ Called when the topology has converged and the stimulation has stopped. The analysis keeps receiving until it is stopped. """
+        if dpg.does_item_exist("__stop_topology_analysis_button"):
+            dpg.configure_item(item="__stop_topology_analysis_button", label="STOP Topology Analysis (converged)")
+            
+    def _on_nodes_needing_probe(self, macs):
+        """ Called in passive mode when the nodes with too little evidence for their connections change. """
+        mac_label_map = self.discover_handler.get_mac_label_map()
+        labels = [str(mac_label_map[mac]['number']) if mac in mac_label_map else mac for mac in macs]
+        text = f"Nodes needing a probe: {', '.join(labels)}" if labels else "All nodes have enough evidence"
+        if dpg.does_item_exist("__topology_probe_text"):
+            dpg.set_value("__topology_probe_text", text)
+            
+    def _on_flood_metrics(self, metrics):
+        """ Called after every update of the flood trace with its aggregate metrics. """
+        if not metrics or not metrics["messages"] or not dpg.does_item_exist("__topology_flood_text"):
+            return
+        coverage = f"{metrics['full_coverage_fraction']:.0%} reach full coverage"
+        if metrics["mean_time_to_full_coverage_ms"] is not None:
+            coverage += f" in {metrics['mean_time_to_full_coverage_ms']:.1f} ms on average"
+        dpg.set_value("__topology_flood_text", f"Floods: {metrics['messages']} messages, {metrics['transmissions_per_message']:.1f} transmissions "
+                                                f"and {metrics['suppressions_per_message']:.1f} suppressions per message, {coverage}")
+            
+    def _on_show_flood_trace(self):
+        """ Show how the message with the entered index and version spread: its transmitters, propagation tree and suppressed nodes. """
+        trace = self.discover_handler.get_flood_trace(dpg.get_value("__topology_flood_index"), dpg.get_value("__topology_flood_version"))
+        if trace is None:
+            dpg.set_value("__topology_flood_trace_text", "Message not traced (unknown, still in flight or evicted)")
+            return
+        mac_label_map = self.discover_handler.get_mac_label_map()
+        def label(mac):
+            return str(mac_label_map[mac]['number']) if mac in mac_label_map else mac
+        tree = [f"{label(parent)} -> {label(mac)}" for mac, parent in trace["parents"].items() if parent is not None]
+        coverage = "never fully covered" if trace["time_to_full_coverage_ms"] is None else f"full coverage in {trace['time_to_full_coverage_ms']:.1f} ms"
+        dpg.set_value("__topology_flood_trace_text", f"{trace['flags']} from {label(trace['source'])}: {trace['transmissions']} transmissions by "
+                                                      f"{trace['transmitters']} nodes, {coverage}\n"
+                                                      f"Propagation: {', '.join(tree) if tree else '-'}\n"
+                                                      f"Suppressed: {', '.join(label(mac) for mac in trace['suppressed']) or '-'}")
+            
     def _on_stop(self):
         print("Stop Topology Analysis button pressed")
         
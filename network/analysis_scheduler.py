@@ -0,0 +1,101 @@
+import time
+from threading import Thread, Event
+from typing import Callable, Dict
+from config import SCHEDULER_COST_FACTOR, SCHEDULER_MAX_INTERVAL_FACTOR
+
+class AnalysisScheduler:
+    """
+    Runs the periodic processing job of an analysis, at most one at a time.
+
+    The rx thread calls `tick` in its receive loop. When the interval has passed, the job is handed to a single worker
+    thread. If the previous job is still running the tick is skipped, and all skipped ticks are coalesced into one
+    run right after it, so the job always processes everything that arrived in the meantime.
+
+    The interval adapts to the measured cost of the job: it is at least SCHEDULER_COST_FACTOR times the duration of
+    the last run and at most SCHEDULER_MAX_INTERVAL_FACTOR times the configured interval. A run that takes longer
+    than the interval is an overrun.
+    """
+
+    def __init__(self, name: str, job: Callable, interval_seconds: float) -> None:
+        self.name = name
+        self.job = job
+        self.base_interval = interval_seconds
+        self.interval = interval_seconds
+
+        self.due = Event()
+        self.stopped = Event()
+        self.running = False
+        self.worker = None
+        self.next_tick = 0
+        self._reset_stats()
+
+    def start(self) -> None:
+        """ Start the worker thread and the statistics of a new run. The first run is due one interval from now. """
+        self.stopped.clear()
+        self.due.clear()
+        self._reset_stats()
+        self.interval = self.base_interval
+        self.next_tick = time.time() + self.interval
+        self.worker = Thread(target=self._worker_thread, daemon=True)
+        self.worker.start()
+
+    def tick(self) -> bool:
+        """ Called by the rx thread, returns immediately. Schedules a run if the interval has passed and returns whether it did. """
+        now = time.time()
+        if now < self.next_tick:
+            return False
+        self.next_tick = now + self.interval
+        self.ticks += 1
+
+        if self.running or self.due.is_set():
+            # The previous job is still running, this tick is coalesced into the next run
+            self.skipped_ticks += 1
+            print(f"{self.name}: skipped tick, previous run still busy ({self.skipped_ticks} skipped so far)")
+        self.due.set()
+        return True
+
+    def stop(self) -> None:
+        """ Wait for the running job to finish and stop the worker. Runs that are only due are dropped. """
+        self.stopped.set()
+        self.due.set()
+        if self.worker:
+            self.worker.join()
+            self.worker = None
+
+    def get_stats(self) -> Dict:
+        """ Returns the number of ticks, runs, skipped ticks and overruns, the current interval and the duration of the last run. """
+        return {"ticks": self.ticks, "runs": self.runs, "skipped_ticks": self.skipped_ticks, "overruns": self.overruns,
+                "interval": self.interval, "last_duration": self.last_duration}
+
+    def _reset_stats(self) -> None:
+        self.ticks = 0
+        self.runs = 0
+        self.skipped_ticks = 0
+        self.overruns = 0
+        self.last_duration = 0
+
+    def _worker_thread(self) -> None:
+        while True:
+            self.due.wait()
+            if self.stopped.is_set():
+                return
+            self.due.clear()
+
+            self.running = True
+            time_before = time.time()
+            try:
+                self.job()
+            except Exception as error:
+                print(f"{self.name}: processing failed: {error}")
+            finally:
+                self.running = False
+            self.runs += 1
+            self._adapt_interval(time.time() - time_before)
+
+    def _adapt_interval(self, duration: float) -> None:
+        """ Keep the job from taking more than 1 / SCHEDULER_COST_FACTOR of the time, within the bounds of the interval. """
+        self.last_duration = duration
+        if duration > self.interval:
+            self.overruns += 1
+            print(f"{self.name}: run took {duration:.2f} s, longer than the interval of {self.interval:.2f} s ({self.overruns} overruns so far)")
+        self.interval = min(max(self.base_interval, duration * SCHEDULER_COST_FACTOR), self.base_interval * SCHEDULER_MAX_INTERVAL_FACTOR)
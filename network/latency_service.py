@@ -1,13 +1,18 @@
 from network.mesh_communication import MeshCommunicationService
 from threading import Thread
 from data.data_service import DataService
-from config import LATENCY_DATA_POINT_AMOUNT, LATENCY_DEBUG_FILE_PATH, LATENCY_FILE_PATH, LATENCY_ANALYSIS_UPDATE_INTERVAL_SECONDS
+from data.results_store import ResultsStore
+from data.site_registry import SiteRegistry, SiteInfo
+from data.latency_sketch import LatencySketch
+from data.stopping_rules import LatencyStoppingRule
+from network.analysis_scheduler import AnalysisScheduler
+from data.capture_writer import TeeWriter, CaptureSink, WindowedRetention, ArchiveRetention
+from config import LATENCY_DEBUG_FILE_PATH, LATENCY_FILE_PATH, LATENCY_ANALYSIS_UPDATE_INTERVAL_SECONDS
+from config import CAPTURE_FILE_LINES_TO_PRESERVE, CAPTURE_FILE_LINE_THRESHOLD, CAPTURE_DEBUG_FILE_MAX_BYTES
 from typing import List, Dict, Tuple
 from math import prod, exp
-import csv
 import os
 import time
-import json
 
 # Plibble
 from plibble.mesh import SetupMesh
@@ -20,26 +25,41 @@ class LatencyService:
         self.latency_analysis_stop = False
         self.source_mac = ""
         self.destination_mac = ""
-        self.latency_list = []
+        self.latency_sketch = LatencySketch()   # Latency samples of the current run
+        self.stopping_rule = LatencyStoppingRule(self.latency_sketch)
+        self.stop_status = None                 # Last evaluation of the stopping rule
         self.analysis_complete_callback = analysis_complete_callback
         self.latency_callback = None
         self.rx_thread = None
         self.gatt_thread = None
         self.site = ""
         self.node_neighbor_map = None
-        self.time_before = 0
-        self.consecutive_runs = 0
+        self.scheduler = AnalysisScheduler("Latency", self._data_processing_thread, LATENCY_ANALYSIS_UPDATE_INTERVAL_SECONDS)
+        self.capture_writer = None
+        self.capture_header = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version']
+        self.packet_store = None    # Packets received in the current run
+        self.run_id = None
+        self.avg_latency = 0
+        self.max_latency = 0
         
     def start_latency_analysis(self, source_mac, destination_mac, latency_callback, site, manual_mode, node_neighbor_map: Dict):
         
         self.source_mac = source_mac
         self.destination_mac = destination_mac
         self.latency_analysis_stop = False
-        self.latency_list = []
+        self.latency_sketch = LatencySketch()
+        self.stopping_rule = LatencyStoppingRule(self.latency_sketch)
+        self.stop_status = None
         self.latency_callback = latency_callback
         self.site = site
         self.node_neighbor_map = node_neighbor_map
-        self.consecutive_runs += 1
+        self.run_id = ResultsStore().begin_run(site, 'latency', source_mac, destination_mac)
+        self.avg_latency = 0
+        self.max_latency = 0
+        
+        # Latency samples are pushed by the streaming latency engine when the flood of a message is over
+        latency_engine = DataService().start_latency_engine(source_mac, destination_mac, site, node_neighbor_map)
+        latency_engine.subscribe(self._on_latency_samples)
         
         MeshCommunicationService().enable_radio()    
         
@@ -52,7 +72,7 @@ class LatencyService:
             self.gatt_thread.start()
         
     def stop_latency_analysis(self):
-        """ Stop the latency analysis process by setting a flag to True and joining threads. """
+        """ Stop the latency analysis process by setting a flag to True and joining threads. The rx thread ends the run. """
         self.latency_analysis_stop = True
         if self.gatt_thread:
             self.gatt_thread.join()
@@ -61,17 +81,36 @@ class LatencyService:
     def latency_service_get_mac_label_map(self) -> dict:
         """ Returns a dictionary containing the mapping of MAC addresses to labels. """
         return DataService().get_mac_label_map()
-            
+
+    def get_pair_sketch(self, source_mac: str, destination_mac: str) -> LatencySketch:
+        """ Returns the latency samples of all finished runs between the source and the destination at the site, merged into one sketch. """
+        pair_sketch = LatencySketch()
+        runs = ResultsStore().get_latency_sketches(self.site, source_mac, destination_mac)
+        while runs:
+            for run in runs:
+                pair_sketch.merge(LatencySketch.from_dict(run["sketch"]))
+            runs = ResultsStore().get_latency_sketches(self.site, source_mac, destination_mac, before_run_id=runs[-1]["run_id"])
+        return pair_sketch
+
+    def calculate_latency_map(self) -> Tuple[List[str], List[List[float]], List[Dict]]:
+        """
+        Computes the latency from every node to every other node from everything captured in the latency capture file so far, in a single pass.
+
+        :return: The MAC addresses in order of their label number, the N x N median latency matrix in ms (rows are sources) and the per pair latency summaries.
+        """
+        csv_file_path = os.path.join(os.path.dirname(__file__), '..', LATENCY_FILE_PATH)
+        macs, latency_matrix, pairs = DataService().data_processing_latency_map(csv_file_path)
+        return macs, latency_matrix.tolist(), pairs
+
     def rx_packet_thread(self):
         
         self._prepare_logging_environment()
-            
-        self.time_before = time.time()
         
+        self.scheduler.start()
         
         while not self.latency_analysis_stop:
             
-            self._perform_periodic_processing(self.time_before)
+            self._perform_periodic_processing()
             
             received_packet, metadata = MeshCommunicationService().receive_mesh_packet()
             
@@ -79,10 +118,23 @@ class LatencyService:
                 continue
             
             log_data = self._parse_packet_data(metadata, received_packet)
-            self._log_packet_data(LATENCY_FILE_PATH, log_data)
-            self._log_packet_data(LATENCY_DEBUG_FILE_PATH, log_data)
+            self.capture_writer.write_row(log_data)
+            self.packet_store.append(log_data)
             
+        self.capture_writer.close()
         MeshCommunicationService().disable_radio()
+        
+        # Finalize all messages that are still in flight, after the running processing finished
+        self.scheduler.stop()
+        print(f"Latency scheduler: {self.scheduler.get_stats()}")
+        self.avg_latency, self.max_latency = DataService().process_latency_packets(self.source_mac, self.destination_mac, LATENCY_FILE_PATH,
+                                                                                   final=True)
+        self._end_run()
+        
+        # Show the samples finalized last, with all runs of the pair including this one
+        if self.latency_sketch.count > 0:
+            self.latency_callback(self.latency_sketch, self.avg_latency, self.max_latency,
+                                  self.get_pair_sketch(self.source_mac, self.destination_mac))
     
     def _gatt_thread(self, source_mac, destination_mac):
         
@@ -113,45 +165,42 @@ class LatencyService:
         print("Data processing started")
         time_before = time.time()
         
-        # Construct path to the file for writing the results to
-        csv_file_path = os.path.join(os.path.dirname(__file__), '..', '', LATENCY_FILE_PATH)
+        # Feed the packets added to the packet store since the last run to the latency engine. The capture file is only an export.
+        avg_latency, max_latency = DataService().process_latency_packets(self.source_mac, self.destination_mac, LATENCY_FILE_PATH)
+        self.avg_latency, self.max_latency = avg_latency, max_latency
         
-        # Perform latency analysis
-        self.latency_list, avg_latency, max_latency = DataService().calculate_latency(self.source_mac, self.destination_mac,
-                                                                                    csv_file_path, self.site, self.node_neighbor_map)
         # Update Latency Plot only when enough data points are available
-        if len(self.latency_list) > 0:
-            self.latency_callback(self.latency_list, avg_latency, max_latency, self.consecutive_runs)
+        if self.latency_sketch.count > 0:
+            self.latency_callback(self.latency_sketch, avg_latency, max_latency)
         
-        # Stop the analysis when enough data points are available
-        if len(self.latency_list) > LATENCY_DATA_POINT_AMOUNT:
+        # Stop the analysis when the latency is known precisely enough or the sample budget is spent.
+        # The rx thread finalizes and ends the run when it stops.
+        self.stop_status = self.stopping_rule.get_status()
+        if self.stop_status["done"] and not self.latency_analysis_stop:
+            print(f"Latency analysis done ({self.stop_status['reason']}): {self.stop_status}")
             self.latency_analysis_stop = True
             self.analysis_complete_callback()
-            if self.gatt_thread:
-                self.gatt_thread.join()
-            self.rx_thread.join()
             
         print(f"Data processing finished in {time.time() - time_before} seconds")
-        print(f"Data points: {len(self.latency_list)}")
+        print(f"Data points: {self.latency_sketch.count}")
         
-    def _prepare_logging_environment(self):
-        """Prepares logging files and directories."""
-        os.makedirs('.results', exist_ok=True)
-        header = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version']
-        self._initialize_log_file(LATENCY_FILE_PATH, header)
-        self._initialize_log_file(LATENCY_DEBUG_FILE_PATH, header)
+    def _on_latency_samples(self, min_latencies: List[float], max_latencies: List[float]) -> None:
+        """ Receives the latencies of messages finalized by the latency engine and stores them. """
+        self.latency_sketch.add(min_latencies)
+        self.stopping_rule.add(min_latencies)
+        ResultsStore().record_latency_samples(self.run_id, min_latencies)
         
-    @staticmethod
-    def _initialize_log_file(file_path, header):
-        """Initializes a log file with a given header."""
-        with open(file_path, 'w', newline='') as file:
-            csv.writer(file).writerow(header)
+    def _end_run(self) -> None:
+        """ Store the summary and the latency sketch of the current run in the results store. """
+        ResultsStore().end_run(self.run_id, sample_count=self.latency_sketch.count, avg_latency=float(self.avg_latency),
+                               max_latency=float(self.max_latency))
+        ResultsStore().record_latency_sketch(self.run_id, self.latency_sketch.to_dict())
         
-    @staticmethod
-    def _log_packet_data(file_path, data):
-        """Logs packet data to the specified file."""
-        with open(file_path, 'a', newline='') as file:
-            csv.writer(file).writerow(data)
+    def _prepare_logging_environment(self):
+        """Prepares logging files and directories. Each row is written to the analysed capture file and to the debug file."""
+        self.capture_writer = TeeWriter([CaptureSink(LATENCY_FILE_PATH, WindowedRetention(CAPTURE_FILE_LINES_TO_PRESERVE, CAPTURE_FILE_LINE_THRESHOLD)),
+                                         CaptureSink(LATENCY_DEBUG_FILE_PATH, ArchiveRetention(CAPTURE_DEBUG_FILE_MAX_BYTES))], self.capture_header)
+        self.packet_store = DataService().start_packet_store(LATENCY_FILE_PATH, self.capture_header)
             
     @staticmethod
     def _parse_packet_data(metadata, received_packet):
@@ -167,27 +216,21 @@ class LatencyService:
         incoming_flags = flag_dict.get(flags, "[Unknown]")
         return [packet_time, incoming_mac, incoming_command, incoming_flags, incoming_handle, incoming_payload, incoming_version]
         
-    def _perform_periodic_processing(self, time_before):
-        """Performs data processing periodically."""
-        if time.time() - time_before > LATENCY_ANALYSIS_UPDATE_INTERVAL_SECONDS:
-            Thread(target=self._data_processing_thread, daemon=True).start()
-            self.time_before = time.time()
+    def _perform_periodic_processing(self):
+        """Performs data processing periodically. The scheduler runs one processing job at a time."""
+        if self.scheduler.tick():
+            self.capture_writer.flush()
             
     def _parse_site_data(self, site_data, destination_mac):
         """ Parse site data and return crypto key and destination index. """
         
-        # Read cryptoKey from the json file and convert each hex value to a list of integers
-        crypto_key = [int(hex_val, 16) for hex_val in site_data['cryptoKey'].split()]
-        # MAC here is of form xx:xx:xx
-        destination_mac_cleaned = destination_mac.replace(":", "")
-        destination_index = site_data['devices'][destination_mac_cleaned]['deviceAddress']
-        return crypto_key, destination_index
+        # The crypto key is parsed into a list of integers when the site is loaded
+        return site_data.crypto_key_bytes, site_data.index_by_mac[destination_mac]
             
-    def _load_site_data(self, site: str):
-        """ Load site data from a JSON file for a given site name. """
+    def _load_site_data(self, site: str) -> SiteInfo:
+        """ Get the site data from the site registry for a given site name. """
         try:
-            with open(f'.auth/{site}.json') as file:
-                return json.load(file)
+            return SiteRegistry().get(site)
         except IOError:
             return None
 
@@ -2,18 +2,25 @@ from network.mesh_communication import MeshCommunicationService
 from threading import Thread
 from data.data_service import DataService
 from gui.canvas_manager import CanvasManager
-from config import MDR_FILE_PATH, MDR_DEBUG_FILE_PATH
+from data.results_store import ResultsStore
+from network.analysis_scheduler import AnalysisScheduler
+from data.stopping_rules import MDRStoppingRule
+from data.capture_writer import TeeWriter, CaptureSink, WindowedRetention, ArchiveRetention
+from config import MDR_FILE_PATH, MDR_DEBUG_FILE_PATH, CAPTURE_FILE_LINES_TO_PRESERVE, CAPTURE_FILE_LINE_THRESHOLD
+from config import CAPTURE_DEBUG_FILE_MAX_BYTES, MDR_ANALYSIS_UPDATE_INTERVAL_SECONDS
 from typing import List, Dict, Tuple
-import csv
 import os
 import time
 
 class MDRService:
-    def __init__(self, mdr_callback) -> None:
+    def __init__(self, mdr_callback, analysis_complete_callback=None) -> None:
         
         self.mdr_stop = False               # Stop the MDR thread
         self.mdr_callback = mdr_callback    # MDR callback to update MDR Bar Plot
-        self.time_before = 0
+        self.analysis_complete_callback = analysis_complete_callback    # Called when the stopping rule ends the run
+        self.stopping_rule = MDRStoppingRule()
+        self.stop_status = None             # Last evaluation of the stopping rule
+        self.scheduler = AnalysisScheduler("MDR", self._data_processing_thread, MDR_ANALYSIS_UPDATE_INTERVAL_SECONDS)
         self.mdr_results = []               # MDR results
         self.rx_thread = None
         self.site = ""
@@ -21,6 +28,10 @@ class MDRService:
         self.source_mac = ""
         self.destination_mac = ""
         self.consecutive_runs = 0
+        self.capture_writer = None
+        self.capture_header = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version', 'Channel']
+        self.packet_store = None            # Packets received in the current run
+        self.run_id = None
         
     def start_analysis(self, source_mac: str, destination_mac: str, site_name: str, node_neighbor_map: Dict) -> None:
         """
@@ -38,8 +49,11 @@ class MDRService:
         self.destination_mac = destination_mac
         self.site = site_name
         self.consecutive_runs += 1
+        self.run_id = ResultsStore().begin_run(site_name, 'mdr', source_mac, destination_mac)
+        self.stop_status = None
         
         DataService().clean_mdr_data()
+        DataService().start_mdr_engine(source_mac, destination_mac, site_name, node_neighbor_map)
         # Thread for receiving 
         self.rx_thread = Thread(target=self._rx_packet_thread, daemon=True)
         self.rx_thread.start()
@@ -49,6 +63,16 @@ class MDRService:
         self.mdr_stop = True
         self.rx_thread.join()
         
+    def calculate_all_pairs_mdr(self, site_name: str, node_neighbor_map: Dict) -> Tuple[List[str], List[List[float]], List[Dict]]:
+        """
+        Computes the MDR of every node pair from everything captured in the MDR capture file so far, in a single pass.
+
+        :return: The MAC addresses in order of their label number, the N x N MDR matrix (rows are sources) and the list of pairs with acknowledgements.
+        """
+        csv_file_path = os.path.join(os.path.dirname(__file__), '..', MDR_FILE_PATH)
+        macs, mdr_matrix, edges = DataService().data_processing_mdr_matrix(csv_file_path, site_name, node_neighbor_map)
+        return macs, mdr_matrix.tolist(), edges
+        
     def get_mac_label_map(self) -> dict:
         """
         Retrieves the MAC label map from the DataService.
@@ -64,11 +88,11 @@ class MDRService:
         
         self._prepare_logging_environment()
         
-        self.time_before = time.time()
+        self.scheduler.start()
         
         while not self.mdr_stop:
             
-            self._perform_periodic_processing(self.time_before)
+            self._perform_periodic_processing()
             
             received_packet, metadata = MeshCommunicationService().receive_mesh_packet()
             
@@ -76,57 +100,60 @@ class MDRService:
                 continue
             
             log_data = self._parse_packet_data(metadata, received_packet)
-            self._log_packet_data(MDR_FILE_PATH, log_data)
-            self._log_packet_data(MDR_DEBUG_FILE_PATH, log_data)
+            self.capture_writer.write_row(log_data)
+            self.packet_store.append(log_data)
             
-        # Perform last processing after the loop ends
-        Thread(target=self._data_processing_thread, daemon=True).start()
+        # Perform last processing after the loop ends and the running one finished, with everything received
+        self.capture_writer.close()
+        self.scheduler.stop()
+        print(f"MDR scheduler: {self.scheduler.get_stats()}")
+        self._data_processing_thread(final=True)
             
         MeshCommunicationService().disable_radio()
         
-    def _data_processing_thread(self) -> None:
-        """ Executes the data processing thread for the MDR (Packet Delivery Ratio)."""
+    def _data_processing_thread(self, final: bool = False) -> None:
+        """
+        Executes the data processing thread for the MDR (Packet Delivery Ratio). Packets added to the packet store since the last run
+        are fed to the streaming MDR engine, the capture file is only an export. The final run resolves pending messages and closes the run in the results store.
+        """
         print("Data processing MDR started")
         
         time_before = time.time()
         
-        # Get the directory of the current script
-        current_script_dir = os.path.dirname(__file__)
-        csv_file_path = os.path.join(current_script_dir, '..', MDR_FILE_PATH)
+        new_results = DataService().process_mdr_packets(self.source_mac, self.destination_mac, MDR_FILE_PATH, final=final)
+        print(f"MDR {new_results[0]['mdr']} from {new_results[0]['source_messages']} messages, {new_results[0]['timeouts']} timeouts")
         
-        new_results = DataService().data_processing_mdr(self.source_mac, self.destination_mac,
-                                                        csv_file_path, self.site, self.node_neighbor_map)
-        print(new_results)
+        # Keep the MDR history of the run
+        run_id = self.run_id
+        ResultsStore().record_mdr_result(run_id, new_results[0])
+        if final:
+            ResultsStore().end_run(run_id, source_messages=new_results[0]['source_messages'], acks=new_results[0]['acks'],
+                                   mdr=new_results[0]['mdr'], throughput=new_results[0]['throughput'])
                 
         self.mdr_callback(new_results, DataService().get_mac_label_map(), self.consecutive_runs)
         
+        # Stop the analysis when the MDR is known precisely enough or the message budget is spent. Only resolved messages
+        # are trials, pending messages cannot have been acknowledged yet. The rx thread does the final processing when it stops.
+        self.stop_status = self.stopping_rule.get_status(new_results[0]['resolved'], new_results[0]['acks'])
+        if self.stop_status["done"] and not self.mdr_stop:
+            print(f"MDR analysis done ({self.stop_status['reason']}): {self.stop_status}")
+            self.mdr_stop = True
+            if self.analysis_complete_callback:
+                self.analysis_complete_callback()
+        
         print(f"MDR processing took {time.time() - time_before} seconds")
     
         
     def _prepare_logging_environment(self):
-        """Prepares logging files and directories."""
-        os.makedirs('.results', exist_ok=True)
-        header = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version', 'Channel']
-        self._initialize_log_file(MDR_FILE_PATH, header)
-        self._initialize_log_file(MDR_DEBUG_FILE_PATH, header)
+        """Prepares logging files and directories. Each row is written to the analysed capture file and to the debug file."""
+        self.capture_writer = TeeWriter([CaptureSink(MDR_FILE_PATH, WindowedRetention(CAPTURE_FILE_LINES_TO_PRESERVE, CAPTURE_FILE_LINE_THRESHOLD)),
+                                         CaptureSink(MDR_DEBUG_FILE_PATH, ArchiveRetention(CAPTURE_DEBUG_FILE_MAX_BYTES))], self.capture_header)
+        self.packet_store = DataService().start_packet_store(MDR_FILE_PATH, self.capture_header)
             
-    def _perform_periodic_processing(self, time_before):
-        """Performs data processing periodically."""
-        if time.time() - time_before > 2:
-            Thread(target=self._data_processing_thread, daemon=True).start()
-            self.time_before = time.time()
-    
-    @staticmethod
-    def _initialize_log_file(file_path, header):
-        """Initializes a log file with a given header."""
-        with open(file_path, 'w', newline='') as file:
-            csv.writer(file).writerow(header)
-    
-    @staticmethod
-    def _log_packet_data(file_path, data):
-        """Logs packet data to the specified file."""
-        with open(file_path, 'a', newline='') as file:
-            csv.writer(file).writerow(data)
+    def _perform_periodic_processing(self):
+        """Performs data processing periodically. The scheduler runs one processing job at a time."""
+        if self.scheduler.tick():
+            self.capture_writer.flush()
     
     @staticmethod
     def delete_lines_preserving_header(file_path: str, lines_to_preserve=5000, threshold=10000) -> None:
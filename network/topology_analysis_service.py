@@ -1,37 +1,60 @@
 from threading import Thread
 from network.mesh_communication import MeshCommunicationService
 from data.data_service import DataService
+from data.site_registry import SiteRegistry
+from network.analysis_scheduler import AnalysisScheduler
 from gui.canvas_manager import CanvasManager
-from common import prepare_logging_environment, delete_lines_preserving_header, parse_packet_data
-from common import log_packet_data
+from data.capture_writer import TeeWriter, CaptureSink, WindowedRetention
+from common import parse_packet_data
 from config import TOPOLOGY_ANALYSIS_FILE_PATH, TOPOLOGY_ANALYSIS_UPDATE_INTERVAL_SECONDS
-from config import TOPOLOGY_ANALYSIS_TX_PERIOD_MS, TOPOLOGY_ANALYSIS_STIMULATION_COMMAND, GET_FLAG
-from typing import List
+from config import TOPOLOGY_ANALYSIS_TX_PERIOD_MS, TOPOLOGY_ANALYSIS_STIMULATION_COMMAND, GET_FLAG, TOPOLOGY_AUTO_STOP_TX
+from typing import List, Dict, Optional
 import time
-import os
-import json
 
 class TopologyAnalysisService:
-    def __init__(self):
+    def __init__(self, convergence_callback=None, probe_callback=None, flood_callback=None):
         self.stop = False
+        self.tx_stop = False                 # Stop only the stimulation, set when the topology has converged
+        self.convergence_callback = convergence_callback
+        self.convergence = None              # Last convergence status of the topology
+        self.passive = False                 # Infer the topology from ordinary traffic only, without stimulation
+        self.probe_callback = probe_callback
+        self.nodes_needing_probe = []        # MAC addresses with too little evidence in passive mode
+        self.trace_floods = False            # Trace how every message spreads over the topology
+        self.flood_callback = flood_callback
         self.site_name = ""
+        self.plotted_version = None          # Version of the DataService snapshot that was plotted last
         self.rx_thread = None
         self.tx_thread = None
+        self.capture_header = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version', 'Channel']
+        self.scheduler = AnalysisScheduler("Topology", self._data_processing_thread, TOPOLOGY_ANALYSIS_UPDATE_INTERVAL_SECONDS)
         
-    def start_topology_analysis(self, selected_site: str) -> None:
+    def start_topology_analysis(self, selected_site: str, passive: bool = False, trace_floods: bool = False) -> None:
         MeshCommunicationService().enable_radio()
 
         self.site_name = selected_site
         self.stop = False
-        
-        # Find all indices for the selected network site to stimulate each individual node
-        indices = self.find_indices(selected_site)
-        print(indices)
+        self.tx_stop = False
+        self.convergence = None
+        self.passive = passive
+        self.nodes_needing_probe = []
+        self.trace_floods = trace_floods
+        if trace_floods:
+            DataService().reset_flood_tracer()
         
         # Thread for receiving 
         self.rx_thread = Thread(target=self._rx_packet_thread, daemon=True)
         self.rx_thread.start()
         
+        # In passive mode nothing is transmitted
+        if passive:
+            self.tx_thread = None
+            return
+        
+        # Find all indices for the selected network site to stimulate each individual node
+        indices = self.find_indices(selected_site)
+        print(indices)
+        
         # Thread for transmitting
         self.tx_thread = Thread(target=self._tx_packet_thread, args=(indices,), daemon=True)
         self.tx_thread.start()
@@ -39,15 +62,26 @@ class TopologyAnalysisService:
     def stop_topology_analysis(self) -> None:
         self.stop = True
         self.rx_thread.join()
-        self.tx_thread.join()
+        if self.tx_thread:
+            self.tx_thread.join()
         
     def get_mac_label_map(self):
         return DataService().get_mac_label_map()
+    
+    def get_flood_trace(self, index: int, version: int) -> Optional[Dict]:
+        """ Returns the trace of a message of the running or last flood trace, None if it is not traced. """
+        return DataService().get_flood_trace(index, version)
+    
+    def get_nodes_needing_probe(self) -> List[str]:
+        """ Returns the MAC addresses of the nodes with too little evidence so far, which a targeted probe could resolve. """
+        return self.nodes_needing_probe
          
     def _tx_packet_thread(self, indices: List) -> None:
         ''' Send GET commands to each node index in the network and listen for responses. '''
-        while not self.stop:
+        while not self.stop and not self.tx_stop:
             for index in indices:
+                if self.stop or self.tx_stop:
+                    break
                 MeshCommunicationService().send_mesh_command(GET_FLAG, TOPOLOGY_ANALYSIS_STIMULATION_COMMAND, b"", index)
                 time.sleep(TOPOLOGY_ANALYSIS_TX_PERIOD_MS / 1000)
                     
@@ -56,18 +90,17 @@ class TopologyAnalysisService:
 
         # Empty Serial Buffers before starting
         MeshCommunicationService().clear_buffers()
-        prepare_logging_environment(TOPOLOGY_ANALYSIS_FILE_PATH)
-        time_before = time.time()
+        capture_writer = TeeWriter([CaptureSink(TOPOLOGY_ANALYSIS_FILE_PATH,
+                                                WindowedRetention(lines_to_preserve=50000, threshold=100000))],
+                                   header=self.capture_header)
+        # Received packets are read by the topology engine from the packet store, the capture file is only an export
+        packet_store = DataService().start_packet_store(TOPOLOGY_ANALYSIS_FILE_PATH, self.capture_header)
+        self.scheduler.start()
         
         while not self.stop:
-            # Do topology analysis once a second
-            if time.time() - time_before > TOPOLOGY_ANALYSIS_UPDATE_INTERVAL_SECONDS:
-                delete_lines_preserving_header(TOPOLOGY_ANALYSIS_FILE_PATH, 
-                                               lines_to_preserve=50000, threshold=100000)
-                    
-                processing_thread = Thread(target=self._data_processing_thread, daemon=True)
-                processing_thread.start()
-                time_before = time.time()  
+            # Do topology analysis once a second, one analysis at a time
+            if self.scheduler.tick():
+                capture_writer.flush()
                 
             received_packet, metadata = MeshCommunicationService().receive_mesh_packet()
             
@@ -75,42 +108,54 @@ class TopologyAnalysisService:
                 continue
             
             log_data = parse_packet_data(metadata, received_packet)
-            log_packet_data(TOPOLOGY_ANALYSIS_FILE_PATH, log_data)
+            capture_writer.write_row(log_data)
+            packet_store.append(log_data)
             
+        capture_writer.close()
         MeshCommunicationService().disable_radio()
+        self.scheduler.stop()
+        print(f"Topology scheduler: {self.scheduler.get_stats()}")
     
     def _data_processing_thread(self) -> None:
         print("Data processing RTT started")
         time_before = time.time()
         
-        unique_connections = DataService().data_processing_find_connections(TOPOLOGY_ANALYSIS_FILE_PATH, self.site_name)
-        mac_label_map = DataService().get_mac_label_map()
-        print(unique_connections)
-        print(mac_label_map)
+        deltas = DataService().process_topology_packets(TOPOLOGY_ANALYSIS_FILE_PATH, self.site_name, passive=self.passive)
+        snapshot = DataService().get_snapshot()
+        print(deltas)
+        
+        # Only redraw when a new snapshot has been published since the last plot
+        if (snapshot.connections or snapshot.isolated_nodes) and snapshot.version != self.plotted_version:
+            CanvasManager().plot_data(snapshot.connections, snapshot.isolated_nodes, snapshot.mac_label_map)
+            self.plotted_version = snapshot.version
+        
+        # Stop the stimulation once the edge set has been stable long enough with enough evidence for every node.
+        # Receiving goes on, so the topology is still updated until the analysis is stopped.
+        self.convergence = DataService().get_topology_convergence()
+        if TOPOLOGY_AUTO_STOP_TX and self.convergence and self.convergence["converged"] and not self.tx_stop:
+            print(f"Topology converged, stable for {self.convergence['stable_seconds']:.1f} s with {len(self.convergence['edges'])} edges. Stopping TX.")
+            self.tx_stop = True
+            if self.convergence_callback:
+                self.convergence_callback()
+        # In passive mode, report the nodes that still need a targeted probe whenever they change
+        if self.passive and self.convergence:
+            nodes_needing_probe = sorted(mac for mac, node in self.convergence["nodes"].items() if node["needs_probe"])
+            if nodes_needing_probe != self.nodes_needing_probe:
+                self.nodes_needing_probe = nodes_needing_probe
+                if self.probe_callback:
+                    self.probe_callback(nodes_needing_probe)
         
-        if len(unique_connections) > 0:
-            CanvasManager().plot_data(unique_connections, mac_label_map)
+        # Trace how the messages of the capture spread over the topology found so far
+        if self.trace_floods:
+            DataService().process_flood_packets(TOPOLOGY_ANALYSIS_FILE_PATH)
+            if self.flood_callback:
+                self.flood_callback(DataService().get_flood_metrics())
             
         print(f"Data processing Topology finished in {time.time() - time_before} seconds")
             
     @staticmethod
     def find_indices(site: str) -> List:
-        # Construct the file path
-        file_path = os.path.join("./.auth", f"{site}.json")
-
-        # Open the file and read the last two lines
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            
-        # Extracting deviceAddress and rx_index for each device, if available
-        device_addresses_and_rx_indices = [(device["deviceAddress"], device.get("rx_index", None)) for device in data["devices"].values()]
-
-        # Putting all deviceAddress and rx_index values, including None for missing rx_index, into a list
-        all_values_list = [value for pair in device_addresses_and_rx_indices for value in pair]
-        
-        # Removing all occurrences of None from the list
-        cleaned_values_list = [value for value in all_values_list if value is not None]
-
-        return cleaned_values_list
+        """ Returns the deviceAddress and, if available, the rx_index of each device of the site. """
+        return SiteRegistry().get(site).rx_indices
         
     
@@ -0,0 +1,64 @@
+import sys
+import os
+import random
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.packet_store import PacketStore
+from data.flood_tracer import FloodTracer
+from synthetic_capture import HEADER, make_site, make_packets, get_edges, to_log_rows
+
+# 1. A hand-made flood on a small graph must give the expected timeline, propagation tree, coverage and suppressed nodes.
+# 2. The traces of a capture must not depend on the order in which its packets arrive, as long as the source packet of
+#    every message arrives first: traces are closed by their own deadline and kept in order of their source time.
+
+def trace_packets(packets, edges, batch_rows: int = 500) -> FloodTracer:
+    store = PacketStore(HEADER)
+    tracer = FloodTracer()
+    tracer.set_graph(edges)
+    log_rows = to_log_rows(packets)
+    for start in range(0, len(log_rows), batch_rows):
+        for row in log_rows[start:start + batch_rows]:
+            store.append(row)
+        tracer.process(store.read_new('flood'))
+    tracer.finish()
+    return tracer
+
+# A - B - C and A - D. A sends, B rebroadcasts after 20 ms and C after 45 ms, D is covered by A and stays silent.
+# A packet of the same index and version with another payload is another message and is not part of the flood.
+A, B, C, D = 'AA:00:00:00:00:01', 'AA:00:00:00:00:02', 'AA:00:00:00:00:03', 'AA:00:00:00:00:04'
+tracer = trace_packets([(1_000_000, A, '[RESP]', 300, '[01]', 7), (1_020_000, B, '[RESP]', 300, '[01]', 7),
+                        (1_030_000, D, '[RESP]', 300, '[02]', 7), (1_045_000, C, '[RESP]', 300, '[01]', 7)],
+                       [(A, B), (B, C), (A, D)])
+trace = tracer.get_trace(300, 7)
+assert trace is not None and trace.source_mac == A
+assert [mac for _, mac in trace.timeline] == [A, B, C], f"Timeline: {trace.timeline}"
+assert trace.parents == {A: None, B: A, C: B}, f"Parents: {trace.parents}"
+assert trace.coverage_time == {A: 1_000_000, B: 1_000_000, D: 1_000_000, C: 1_020_000}, f"Coverage: {trace.coverage_time}"
+assert trace.suppressed == [D], f"Suppressed: {trace.suppressed}"
+assert trace.time_to_full_coverage == 20_000, f"Time to full coverage: {trace.time_to_full_coverage}"
+print("Hand-made flood traced as expected")
+
+# Arrival is delayed by up to 3 ms per packet, then the source packet of every message is moved before the other packets of its message
+macs, index_by_mac, neighbors = make_site(12)
+edges = get_edges(neighbors)
+packets = make_packets(20_000, macs, index_by_mac, neighbors)
+rng = random.Random(5)
+arrival = sorted(range(len(packets)), key=lambda position: packets[position][0] + rng.randint(0, 3_000))
+first_arrival = {}
+for arrival_position, position in enumerate(arrival):
+    key = (packets[position][3], packets[position][5])
+    if key not in first_arrival:
+        first_arrival[key] = arrival_position
+    elif position < arrival[first_arrival[key]]:
+        arrival[first_arrival[key]], arrival[arrival_position] = position, arrival[first_arrival[key]]
+assert arrival != sorted(arrival), "Arrival order is not shuffled"
+
+in_order = trace_packets(packets, edges)
+shuffled = trace_packets([packets[position] for position in arrival], edges)
+expected = [trace.get_summary() for trace in in_order.get_traces()]
+actual = [trace.get_summary() for trace in shuffled.get_traces()]
+assert len(expected) > 1000, f"Only {len(expected)} traces"
+assert actual == expected, f"{sum(summary not in expected for summary in actual)} traces differ with shuffled arrival"
+assert shuffled.trace_times == sorted(shuffled.trace_times), "Traces are not in order of their source time"
+assert in_order.get_metrics() == shuffled.get_metrics()
+print(f"{len(expected)} traces identical with shuffled arrival")
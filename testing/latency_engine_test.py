@@ -0,0 +1,74 @@
+import sys
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.data_service import DataService
+from config import LATENCY_FLOOD_TIMEOUT_SECONDS
+from synthetic_capture import HEADER, make_site, make_packets, to_log_rows, write_site
+
+# The streaming latency engine of a pair must push the same latencies as a batch computation of its rules on the same
+# packets, whatever the size of the updates: for every source message, the time until each neighbor of the destination
+# first sent the message within the flood timeout, the minimum and the maximum over the neighbors. The pairs are not
+# neighbors of each other, a source next to the destination would always have a latency of 0.
+SITE = 'latency_test'
+BATCH_ROWS = 500
+PAIRS = ((0, 4), (4, 0), (5, 11), (6, 10))
+
+def batch_latencies(frame: pd.DataFrame, source_mac: str, source_index: int, destination_index: int, neighbor_macs: list) -> tuple:
+    """ Returns the sorted minimum and maximum latencies of the source messages in ms. """
+    source_messages = frame.drop_duplicates(subset='IndexVersionKey')
+    is_set_or_get = source_messages['Flags'].isin(['[SET]', '[GET]'])
+    source_messages = source_messages[(source_messages['MAC'] == source_mac) &
+                                      ((is_set_or_get & (source_messages['Index'] == destination_index)) |
+                                       (~is_set_or_get & (source_messages['Index'] == source_index)))]
+    heard = frame[frame['MAC'].isin(neighbor_macs)].merge(source_messages[['MessageKey', 'Timestamp']], on='MessageKey', suffixes=('', '_source'))
+    heard['delay'] = heard['Timestamp'] - heard['Timestamp_source']
+    heard = heard[(heard['delay'] >= 0) & (heard['delay'] <= LATENCY_FLOOD_TIMEOUT_SECONDS * 1e6)]
+    first_delays = heard.groupby(['MessageKey', heard['MAC'].astype(object)])['delay'].min().groupby(level='MessageKey')
+    return sorted((first_delays.min() / 1000).tolist()), sorted((first_delays.max() / 1000).tolist())
+
+macs, index_by_mac, neighbors = make_site(12)
+log_rows = to_log_rows(make_packets(20_000, macs, index_by_mac, neighbors))
+
+working_directory = os.getcwd()
+with tempfile.TemporaryDirectory() as directory:
+    os.chdir(directory)
+    write_site(SITE, index_by_mac)
+    data_service = DataService()
+    data_service.reset()
+
+    # The topology analysis numbers the nodes, the latency analyses use the neighbors by number
+    store = data_service.start_packet_store('latency.csv', HEADER)
+    for row in log_rows:
+        store.append(row)
+    data_service.process_topology_packets('latency.csv', SITE)
+    mac_label_map = data_service.get_mac_label_map()
+    node_neighbor_map = {mac_label_map[mac]['number']: [mac_label_map[neighbor]['number'] for neighbor in neighbors[mac]] for mac in macs}
+    frame = data_service.load_capture('latency.csv')
+
+    store = data_service.start_packet_store('latency.csv', HEADER)
+    samples = {}
+    for source, destination in PAIRS:
+        engine = data_service.start_latency_engine(macs[source], macs[destination], SITE, node_neighbor_map)
+        pair_samples = samples[(source, destination)] = ([], [])
+        engine.subscribe(lambda min_latencies, max_latencies, pair_samples=pair_samples: (pair_samples[0].extend(min_latencies),
+                                                                                          pair_samples[1].extend(max_latencies)))
+    for start in range(0, len(log_rows), BATCH_ROWS):
+        for row in log_rows[start:start + BATCH_ROWS]:
+            store.append(row)
+        for source, destination in PAIRS:
+            data_service.process_latency_packets(macs[source], macs[destination], 'latency.csv')
+
+    for source, destination in PAIRS:
+        avg_latency, max_latency = data_service.process_latency_packets(macs[source], macs[destination], 'latency.csv', final=True)
+        min_latencies, max_latencies = batch_latencies(frame, macs[source], index_by_mac[macs[source]], index_by_mac[macs[destination]], neighbors[macs[destination]])
+        assert min_latencies, f"Pair {source}->{destination}: no latency samples in the reference"
+        assert sorted(samples[(source, destination)][0]) == min_latencies, f"Pair {source}->{destination}: minimum latencies differ"
+        assert sorted(samples[(source, destination)][1]) == max_latencies, f"Pair {source}->{destination}: maximum latencies differ"
+        assert np.isclose(avg_latency, np.mean(min_latencies)) and max_latency == max(max_latencies), \
+            f"Pair {source}->{destination}: average {avg_latency} / max {max_latency} ms, reference {np.mean(min_latencies)} / {max(max_latencies)} ms"
+        print(f"Pair {source}->{destination}: {len(min_latencies)} samples, average {avg_latency:.2f} ms, max {max_latency:.2f} ms, same as the reference")
+    os.chdir(working_directory)
@@ -0,0 +1,54 @@
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.data_service import DataService
+from synthetic_capture import HEADER, make_site, make_packets, to_log_rows, write_site
+
+# The streaming MDR engine of a pair must count the same source messages and acknowledgements as the single pass
+# reference DataService.calculate_mdr_matrix on the same packets, whatever the size of the updates.
+SITE = 'mdr_test'
+BATCH_ROWS = 500
+PAIRS = ((0, 3), (3, 0), (1, 2), (5, 11), (7, 4), (10, 6))
+
+macs, index_by_mac, neighbors = make_site(12)
+log_rows = to_log_rows(make_packets(20_000, macs, index_by_mac, neighbors))
+
+working_directory = os.getcwd()
+with tempfile.TemporaryDirectory() as directory:
+    os.chdir(directory)
+    write_site(SITE, index_by_mac)
+    data_service = DataService()
+    data_service.reset()
+
+    # The topology analysis numbers the nodes, the MDR analyses use the neighbors by number
+    store = data_service.start_packet_store('topology.csv', HEADER)
+    for row in log_rows:
+        store.append(row)
+    data_service.process_topology_packets('topology.csv', SITE)
+    mac_label_map = data_service.get_mac_label_map()
+    node_neighbor_map = {mac_label_map[mac]['number']: [mac_label_map[neighbor]['number'] for neighbor in neighbors[mac]] for mac in macs}
+
+    _, _, reference_pairs = data_service.calculate_mdr_matrix(data_service.load_capture('topology.csv'), index_by_mac, node_neighbor_map)
+    reference = {(pair['source'], pair['destination']): pair for pair in reference_pairs}
+
+    data_service.clean_mdr_data()
+    store = data_service.start_packet_store('mdr.csv', HEADER)
+    for source, destination in PAIRS:
+        data_service.start_mdr_engine(macs[source], macs[destination], SITE, node_neighbor_map)
+    for start in range(0, len(log_rows), BATCH_ROWS):
+        for row in log_rows[start:start + BATCH_ROWS]:
+            store.append(row)
+        for source, destination in PAIRS:
+            data_service.process_mdr_packets(macs[source], macs[destination], 'mdr.csv')
+
+    for source, destination in PAIRS:
+        result = data_service.process_mdr_packets(macs[source], macs[destination], 'mdr.csv', final=True)[0]
+        expected = reference[(macs[source], macs[destination])]
+        assert (result['source_messages'], result['acks']) == (expected['source_messages'], expected['acks']), \
+            f"Pair {source}->{destination}: streaming {result['source_messages']} messages / {result['acks']} acks, " \
+            f"reference {expected['source_messages']} messages / {expected['acks']} acks"
+        assert result['resolved'] == result['source_messages'], f"Pair {source}->{destination}: messages left pending after the final update"
+        print(f"Pair {source}->{destination}: {result['acks']} of {result['source_messages']} messages acknowledged, same as the reference")
+    os.chdir(working_directory)
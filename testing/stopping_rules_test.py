@@ -0,0 +1,69 @@
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.latency_sketch import LatencySketch
+from data.stopping_rules import z_score, wilson_interval, LatencyStoppingRule, MDRStoppingRule
+
+# The stopping rules must give the textbook intervals, stop only when the interval is narrow enough and never before
+# the minimum or after the maximum number of samples.
+
+assert abs(z_score(0.95) - 1.959964) < 1e-6
+low, high = wilson_interval(50, 100, 0.95)
+assert abs(low - 0.403832) < 1e-6 and abs(high - 0.596168) < 1e-6, f"Wilson interval of 50/100: {low}, {high}"
+assert wilson_interval(0, 0, 0.95) is None
+low, high = wilson_interval(100, 100, 0.95)
+assert 0.96 < low < 1 and high == 1.0
+
+def run_latency_rule(latencies, **parameters) -> tuple:
+    """ Feed latencies in batches of 10 like the latency engine does, returns the rule and the status when it stopped. """
+    sketch = LatencySketch()
+    rule = LatencyStoppingRule(sketch, **parameters)
+    for start in range(0, len(latencies), 10):
+        sketch.add(latencies[start:start + 10])
+        rule.add(latencies[start:start + 10])
+        status = rule.get_status()
+        if status["done"]:
+            break
+    return rule, status
+
+rng = np.random.default_rng(9)
+latencies = rng.gamma(4, 10, 20_000)
+
+# Mean: Welford's running mean and variance equal the direct computation, and the rule stops once the 95 % interval is within +-5 %
+rule, status = run_latency_rule(latencies, statistic='mean', confidence=0.95, relative_half_width=0.05, min_samples=100, max_samples=5000)
+samples = latencies[:status["samples"]]
+assert status["reason"] == "converged", status
+assert np.isclose(rule.mean, samples.mean()) and np.isclose(rule.m2 / (rule.count - 1), samples.var(ddof=1))
+half_width = 1.959964 * samples.std(ddof=1) / np.sqrt(len(samples))
+assert half_width <= 0.05 * samples.mean(), "Stopped before the interval was narrow enough"
+previous = latencies[:status["samples"] - 10]
+assert 1.959964 * previous.std(ddof=1) / np.sqrt(len(previous)) > 0.05 * previous.mean(), "Did not stop as soon as the interval was narrow enough"
+print(f"Mean rule converged after {status['samples']} samples: {status['estimate']:.2f} ms [{status['low']:.2f}, {status['high']:.2f}]")
+
+# Percentile: the estimate is within the accuracy of the sketch and the interval covers the sample percentile
+rule, status = run_latency_rule(latencies, statistic=90, confidence=0.95, relative_half_width=0.05, min_samples=100, max_samples=20_000)
+samples = latencies[:status["samples"]]
+percentile = np.quantile(samples, 0.9)
+assert status["done"] and abs(status["estimate"] - percentile) <= 0.02 * percentile, status
+assert status["low"] <= percentile <= status["high"], status
+print(f"p90 rule stopped after {status['samples']} samples ({status['reason']}): {status['estimate']:.2f} ms, sample p90 {percentile:.2f} ms")
+
+# Minimum and maximum number of samples
+rule, status = run_latency_rule(np.full(1000, 20.0), statistic='mean', min_samples=200, max_samples=5000)
+assert status == {**status, "samples": 200, "done": True, "reason": "converged"}, status
+rule, status = run_latency_rule(latencies, statistic='mean', relative_half_width=0.001, min_samples=100, max_samples=500)
+assert status["samples"] == 500 and status["reason"] == "max_samples", status
+print("Latency rules respect the minimum and maximum number of samples")
+
+# MDR: +-2 % at 95 % around 50 % needs about 2400 resolved messages
+mdr_rule = MDRStoppingRule(confidence=0.95, half_width=0.02, min_messages=200, max_messages=20_000)
+assert not mdr_rule.get_status(2000, 1000)["done"]
+status = mdr_rule.get_status(2500, 1250)
+assert status["done"] and status["reason"] == "converged" and status["estimate"] == 50, status
+assert not mdr_rule.get_status(150, 150)["done"], "Stopped before the minimum number of messages"
+assert mdr_rule.get_status(200, 200)["reason"] == "converged"
+assert mdr_rule.get_status(20_000, 10_000)["reason"] == "max_samples"
+assert mdr_rule.get_status(0, 0) == {"samples": 0, "estimate": None, "low": None, "high": None, "done": False, "reason": None}
+print("MDR rule stops at the expected number of messages")
@@ -0,0 +1,102 @@
+import csv
+import json
+import os
+import random
+from typing import List, Dict, Tuple
+
+# Synthetic captures of a mesh with a known topology, shared by the test scripts in this directory.
+#
+# Every message is sent by a source node and rebroadcast by most of its neighbors within the first trickle period
+# (16-32 ms), sometimes again later. Nodes that are not neighbors are heard late (> 32 ms), and a few floods are heard
+# without their original packet (< 16 ms). SET and GET messages are often answered with an ACK with the next version.
+
+HEADER = ['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version']
+FLAGS = ('[SET]', '[GET]', '[RESP]', '[ACK]', '[DR]')
+
+def make_site(node_count: int, seed: int = 1) -> Tuple[List[str], Dict[str, int], Dict[str, List[str]]]:
+    """ Returns the MAC addresses, the deviceAddress of every MAC address and the neighbors of every MAC address (a ring with random chords). """
+    rng = random.Random(seed)
+    macs = []
+    while len(macs) < node_count:
+        mac = ":".join(f"{rng.randrange(256):02X}" for _ in range(6))
+        if mac not in macs:
+            macs.append(mac)
+    index_by_mac = {mac: 200 + node for node, mac in enumerate(macs)}
+
+    neighbors = {mac: set() for mac in macs}
+    for node, mac in enumerate(macs):
+        for other in (macs[(node + 1) % node_count], macs[(node + 2) % node_count]):
+            if other != mac:
+                neighbors[mac].add(other)
+                neighbors[other].add(mac)
+    for _ in range(node_count):
+        mac1, mac2 = rng.sample(macs, 2)
+        neighbors[mac1].add(mac2)
+        neighbors[mac2].add(mac1)
+    return macs, index_by_mac, {mac: sorted(neighbors[mac]) for mac in macs}
+
+def get_edges(neighbors: Dict[str, List[str]]) -> set:
+    """ Returns the undirected edges of the neighbor map with the MAC addresses of an edge sorted. """
+    return {(min(mac, neighbor), max(mac, neighbor)) for mac in neighbors for neighbor in neighbors[mac]}
+
+def make_packets(packet_count: int, macs: List[str], index_by_mac: Dict[str, int], neighbors: Dict[str, List[str]], seed: int = 2,
+                 flags: Tuple[str, ...] = FLAGS, miss_probability: float = 0.05) -> List[Tuple[int, str, str, int, str, int]]:
+    """ Returns (time in µs, MAC, flags, index, payload, version) packets in order of time. Every packet is missed by the tool with `miss_probability`. """
+    rng = random.Random(seed)
+    time_us = 0
+    versions = {}
+    packets = []
+    while len(packets) < packet_count:
+        source = rng.choice(macs)
+        flag = rng.choice(flags)
+        index = index_by_mac[rng.choice(macs)] if flag in ('[SET]', '[GET]') else index_by_mac[source]
+        version = versions.get(index, 0) + 1
+        versions[index] = version
+        payload = "".join(f"[{rng.randrange(256):02X}]" for _ in range(rng.randrange(4)))
+
+        flood = [(time_us, source, flag, version)]
+        for neighbor in neighbors[source]:
+            if rng.random() < 0.8:
+                flood.append((time_us + rng.randint(16_000, 32_000), neighbor, flag, version))
+                if rng.random() < 0.3:
+                    flood.append((time_us + rng.randint(40_000, 90_000), neighbor, flag, version))
+        for mac in macs:
+            if mac != source and mac not in neighbors[source] and rng.random() < 0.3:
+                flood.append((time_us + rng.randint(33_000, 120_000), mac, flag, version))
+        if rng.random() < 0.05:
+            flood.append((time_us + rng.randint(1_000, 15_000), rng.choice(macs), flag, version))
+        if flag in ('[SET]', '[GET]') and rng.random() < 0.7:
+            versions[index] = version + 1
+            flood.append((time_us + rng.randint(30_000, 60_000), rng.choice(macs), '[ACK]', version + 1))
+
+        for packet_time, mac, packet_flag, packet_version in flood:
+            if rng.random() >= miss_probability:
+                packets.append((packet_time, mac, packet_flag, index, payload, packet_version))
+        time_us += rng.randint(5_000, 30_000)
+    packets.sort(key=lambda packet: packet[0])
+    return packets[:packet_count]
+
+def format_timestamp(time_us: int) -> str:
+    """ The [minutes.seconds.milliseconds.microseconds] timestamp of the capture, which wraps every hour. """
+    minutes, rest = divmod(time_us % 3_600_000_000, 60_000_000)
+    seconds, rest = divmod(rest, 1_000_000)
+    milliseconds, microseconds = divmod(rest, 1000)
+    return f"[{minutes}.{seconds}.{milliseconds}.{microseconds}]"
+
+def to_log_rows(packets: List[Tuple[int, str, str, int, str, int]]) -> List[List[str]]:
+    """ Returns the packets as rows logged by the rx thread of an analysis. """
+    return [[format_timestamp(time_us), mac, '[0056]', flags, str(index), payload, str(version)]
+            for time_us, mac, flags, index, payload, version in packets]
+
+def write_capture(file_path: str, packets: List[Tuple[int, str, str, int, str, int]]) -> None:
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADER)
+        writer.writerows(to_log_rows(packets))
+
+def write_site(site_name: str, index_by_mac: Dict[str, int]) -> None:
+    """ Write the site file of the MAC addresses to the site directory of the working directory. """
+    devices = {mac.replace(":", ""): {'deviceAddress': index, 'title': f"Node {index}"} for mac, index in index_by_mac.items()}
+    os.makedirs('.auth', exist_ok=True)
+    with open(os.path.join('.auth', f"{site_name}.json"), 'w') as file:
+        json.dump({'devices': devices, 'cryptoKey': "00 11", 'accessAddr': "AA BB"}, file)
@@ -0,0 +1,57 @@
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.timestamp_parser import parse_packet_timestamps, HourWrapUnwrapper
+
+# Benchmark of the vectorized timestamp parser against the previous per-row Series.apply parser on 1M rows.
+ROWS = 1_000_000
+
+def get_packet_timestamp(packet_timestamp: str):
+    # Previous implementation, parses one timestamp per call
+    parts = packet_timestamp.strip('[]').split('.')
+    if len(parts) != 4:
+        print(f"Invalid timestamp format: {packet_timestamp}")
+        return None
+    minutes, seconds, milliseconds, microseconds = [int(part) for part in parts]
+    delta = timedelta(minutes=minutes, seconds=seconds, milliseconds=milliseconds, microseconds=microseconds)
+    return datetime(1970, 1, 1, hour=0) + delta
+
+# A capture of roughly 80 minutes with packets every ~5 ms, so it wraps over the hour once
+rng = np.random.default_rng(7)
+true_time_us = np.cumsum(rng.integers(1, 10_000, ROWS))
+wrapped_us = true_time_us % 3_600_000_000
+minutes, rest = np.divmod(wrapped_us, 60_000_000)
+seconds, rest = np.divmod(rest, 1_000_000)
+milliseconds, microseconds = np.divmod(rest, 1000)
+timestamps = pd.Series([f"[{m}.{s}.{ms}.{us}]" for m, s, ms, us in zip(minutes, seconds, milliseconds, microseconds)])
+
+time_before = time.time()
+apply_result = timestamps.apply(get_packet_timestamp)
+apply_time = time.time() - time_before
+
+time_before = time.time()
+vectorized_result = HourWrapUnwrapper().unwrap(parse_packet_timestamps(timestamps))
+vectorized_time = time.time() - time_before
+
+# Without unwrapping, both parsers must agree on the time within the hour
+apply_us = (apply_result - datetime(1970, 1, 1)).dt.total_seconds().mul(1e6).round().astype(np.int64).to_numpy()
+assert np.array_equal(apply_us, parse_packet_timestamps(timestamps)), "The parsers disagree"
+assert np.array_equal(vectorized_result - vectorized_result[0], true_time_us - true_time_us[0]), "The unwrapped timeline is wrong"
+
+# Unwrapping chunk by chunk, as the packet store does, must give the same timeline as unwrapping everything at once
+unwrapper = HourWrapUnwrapper()
+chunk_ends = np.sort(rng.choice(np.arange(1, ROWS), 200, replace=False))
+chunked_result = np.concatenate([unwrapper.unwrap(chunk) for chunk in np.split(parse_packet_timestamps(timestamps), chunk_ends)])
+assert np.array_equal(chunked_result, vectorized_result), "Unwrapping in chunks differs"
+
+# A packet from before the rollover that arrives after it stays before the rollover
+late = HourWrapUnwrapper().unwrap(np.array([3_599_990_000, 5_000, 3_599_995_000, 10_000], dtype=np.int64))
+assert np.array_equal(late, [3_599_990_000, 3_600_005_000, 3_599_995_000, 3_600_010_000]), f"Late packet unwrapped to {late}"
+print("Parsers agree, unwrapped timeline correct")
+print(f"Series.apply:  {apply_time:.3f} s")
+print(f"Vectorized:    {vectorized_time:.3f} s ({apply_time / vectorized_time:.1f}x faster)")
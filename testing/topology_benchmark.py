@@ -0,0 +1,133 @@
+import sys
+import os
+import csv
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.capture_reader import CaptureReader
+from data.data_service import DataService
+from config import NETWORK_TOPOLOGY_THRESHOLD
+
+# Benchmark of the topology inference from a 100k-row capture file, from reading the file to the edge set:
+#   Previous: pd.read_csv, per-row timestamp parsing and one merge over the whole capture per MAC address, as in the
+#             original DataService.data_processing_find_connections.
+#   Current:  CaptureReader (vectorized timestamps and message keys) and the single pass of DataService.find_direct_connections.
+# The previous path is copied below unchanged, apart from returning the edges instead of storing them.
+ROWS = 100_000
+NODES = 40
+
+def get_packet_timestamp(packet_timestamp: str):
+    parts = packet_timestamp.strip('[]').split('.')
+    if len(parts) != 4:
+        print(f"Invalid timestamp format: {packet_timestamp}")
+        return None
+    try:
+        minutes, seconds, milliseconds, microseconds = [int(part) for part in parts]
+        delta = timedelta(minutes=minutes, seconds=seconds, milliseconds=milliseconds, microseconds=microseconds)
+        base_datetime = datetime(1970, 1, 1, hour=0)
+        final_datetime = base_datetime + delta
+        return final_datetime
+    except ValueError as e:
+        print(f"Error parsing timestamp: {e}")
+        return None
+
+def get_first_occurrences(df, mac_address):
+    copy_df = df.copy()
+    copy_df['Payload'] = copy_df['Payload'].fillna('NoPayload')
+    copy_df = copy_df.groupby(['Version', 'Index']).first().reset_index()
+    copy_df = copy_df[copy_df['MAC'] == mac_address]
+    return copy_df
+
+def previous_find_connections(file_path: str, site_devices: dict) -> set:
+    connections = set()
+    data = pd.read_csv(file_path)
+    data['Timestamp'] = data['Timestamp'].apply(get_packet_timestamp)
+    all_unique_macs = set(data['MAC'].unique())
+    data_resp = data[data['Flags'] == '[RESP]']
+
+    for mac_address in all_unique_macs:
+        user_mac = mac_address.replace(":", "")
+        source_packets = get_first_occurrences(data_resp, mac_address)
+        try:
+            mac_index = site_devices[user_mac]['deviceAddress']
+        except:
+            mac_index = None
+        if mac_index is not None:
+            source_packets = source_packets[source_packets['Index'] == mac_index]
+        if source_packets.empty:
+            continue
+
+        potential_connections = data.merge(source_packets, on=['Index', 'Payload', 'Version'], suffixes=('', '_source'))
+        potential_connections = potential_connections[potential_connections['MAC'] != mac_address]
+        potential_connections['time_diff'] = (potential_connections['Timestamp'] - potential_connections['Timestamp_source']).dt.total_seconds().abs()
+        directly_connected = potential_connections[potential_connections['time_diff'] < 0.032]
+        versions_to_remove = directly_connected[directly_connected['time_diff'] < 0.016]['Version'].unique()
+        directly_connected = directly_connected[~directly_connected['Version'].isin(versions_to_remove)]
+        mac_occurrences = directly_connected['MAC'].value_counts()
+        mac_occurrences = mac_occurrences[mac_occurrences >= NETWORK_TOPOLOGY_THRESHOLD]
+        filtered_macs = mac_occurrences.index.tolist()
+        directly_connected_filtered = directly_connected[directly_connected['MAC'].isin(filtered_macs)]
+        for conn_mac in set(directly_connected_filtered['MAC'].unique()):
+            connections.add((mac_address, conn_mac))
+    return connections
+
+def current_find_connections(file_path: str, index_by_mac: dict) -> set:
+    reader = CaptureReader(file_path)
+    reader.update()
+    connections, _ = DataService.find_direct_connections(reader.get_frame(), index_by_mac)
+    return set(connections)
+
+# A site where every node answers GET messages on its own index and about a quarter of the other nodes rebroadcast
+# the response. Some rebroadcasts are late (no connection) and some floods are heard without the original (< 16 ms).
+# Payloads are never empty: the previous path filled empty payloads before the merge, so it never matched those messages.
+rng = np.random.default_rng(11)
+macs = [':'.join(f"{byte:02X}" for byte in rng.integers(0, 256, 6)) for _ in range(NODES)]
+site_devices = {mac.replace(":", ""): {'deviceAddress': 100 + node, 'title': f"Node {node}"} for node, mac in enumerate(macs)}
+index_by_mac = {mac: 100 + node for node, mac in enumerate(macs)}
+neighbors = rng.random((NODES, NODES)) < 0.25
+
+rows = []
+time_us = 0
+versions = np.zeros(NODES, dtype=int)
+while len(rows) < ROWS:
+    source = rng.integers(NODES)
+    versions[source] += 1
+    payload = ''.join(f"[{byte:02X}]" for byte in rng.integers(0, 256, rng.integers(1, 4)))
+    flood = [(time_us, source)]
+    for node in np.flatnonzero(neighbors[source]):
+        if node != source:
+            flood.append((time_us + rng.integers(16_000, 40_000) if rng.random() < 0.9 else time_us + rng.integers(1_000, 16_000), node))
+    for time_sent, node in flood:
+        if rng.random() > 0.05:
+            rows.append((time_sent, macs[node], '[0056]', '[RESP]', 100 + source, payload, versions[source]))
+    time_us += rng.integers(5_000, 20_000)
+rows.sort(key=lambda row: row[0])
+
+# The capture stays within one hour, the previous timestamp parser does not handle the hour rollover
+with tempfile.TemporaryDirectory() as directory:
+    file_path = os.path.join(directory, 'topology.csv')
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Timestamp', 'MAC', 'Command', 'Flags', 'Index', 'Payload', 'Version'])
+        for time_sent, mac, command, flags, index, payload, version in rows[:ROWS]:
+            minutes, rest = divmod(int(time_sent), 60_000_000)
+            seconds, rest = divmod(rest, 1_000_000)
+            milliseconds, microseconds = divmod(rest, 1000)
+            writer.writerow([f"[{minutes}.{seconds}.{milliseconds}.{microseconds}]", mac, command, flags, index, payload, version])
+
+    time_before = time.time()
+    previous_result = previous_find_connections(file_path, site_devices)
+    previous_time = time.time() - time_before
+
+    time_before = time.time()
+    current_result = current_find_connections(file_path, index_by_mac)
+    current_time = time.time() - time_before
+
+assert previous_result == current_result, f"Edge sets differ: {len(previous_result ^ current_result)} connections"
+print(f"Connections: {len(current_result)}, same edge set")
+print(f"Previous (read_csv, apply, per-MAC merge): {previous_time:.3f} s")
+print(f"Current (CaptureReader, single pass):      {current_time:.3f} s ({previous_time / current_time:.1f}x faster)")
@@ -0,0 +1,53 @@
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.capture_reader import CaptureReader
+from data.data_service import DataService
+from synthetic_capture import HEADER, make_site, make_packets, get_edges, to_log_rows, write_capture, write_site
+
+# The streaming topology must find the same edge set as the batch reference DataService.find_direct_connections on the
+# same capture, whatever the size of the updates. In passive mode, without any RESPONSE flood, it must find the true
+# topology of the synthetic mesh.
+SITE = 'topology_test'
+BATCH_ROWS = 500
+
+def stream_topology(log_rows, passive: bool = False) -> set:
+    data_service = DataService()
+    data_service.reset()
+    store = data_service.start_packet_store('topology.csv', HEADER)
+    for start in range(0, len(log_rows), BATCH_ROWS):
+        for row in log_rows[start:start + BATCH_ROWS]:
+            store.append(row)
+        data_service.process_topology_packets('topology.csv', SITE, passive=passive)
+    # The published edges must be the edges of the engine
+    assert set(data_service.get_connections()) == data_service.topology_engine.get_edges()
+    return set(data_service.get_connections())
+
+macs, index_by_mac, neighbors = make_site(12)
+true_edges = get_edges(neighbors)
+
+working_directory = os.getcwd()
+with tempfile.TemporaryDirectory() as directory:
+    os.chdir(directory)
+    write_site(SITE, index_by_mac)
+
+    packets = make_packets(20_000, macs, index_by_mac, neighbors)
+    write_capture('capture.csv', packets)
+    reader = CaptureReader('capture.csv')
+    reader.update()
+    connections, _ = DataService.find_direct_connections(reader.get_frame(), index_by_mac)
+    batch_edges = {(min(connection), max(connection)) for connection in connections}
+    assert batch_edges, "The batch reference found no connections"
+    assert batch_edges <= true_edges, f"The batch reference found connections that do not exist: {batch_edges - true_edges}"
+
+    streamed_edges = stream_topology(to_log_rows(packets))
+    assert streamed_edges == batch_edges, f"Edge sets differ: {streamed_edges ^ batch_edges}"
+    print(f"Streaming equals batch: {len(streamed_edges)} of {len(true_edges)} edges")
+
+    passive_packets = make_packets(6_000, macs, index_by_mac, neighbors, flags=('[SET]', '[GET]', '[ACK]', '[DR]'))
+    passive_edges = stream_topology(to_log_rows(passive_packets), passive=True)
+    assert passive_edges == true_edges, f"Passive edges differ from the topology: {passive_edges ^ true_edges}"
+    print(f"Passive mode finds the topology: {len(passive_edges)} edges")
+    os.chdir(working_directory)
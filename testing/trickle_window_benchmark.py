@@ -0,0 +1,42 @@
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from data.trickle_window import max_packets_in_window
+from config import TRICKLE_I_MIN_MS
+
+# Benchmark of the vectorized trickle window counting against the previous groupby/rolling path on 5k messages.
+MESSAGES = 5_000
+
+def rolling_max_rebroadcasts(neighbor_packets: pd.DataFrame) -> pd.Series:
+    # Previous implementation, a rolling window per message followed by a maximum per message
+    neighbor_packets = neighbor_packets.reset_index()
+    neighbor_packets['Timestamp'] = pd.to_datetime(neighbor_packets['Timestamp'], unit='us')
+    grouped_packets = neighbor_packets.groupby('IndexVersionKey')
+    rolling_window_result = grouped_packets.apply(lambda group: group.rolling(window=pd.Timedelta(TRICKLE_I_MIN_MS, 'ms'), on='Timestamp').count(), include_groups=False)
+    grouped_packets = rolling_window_result.groupby(level='IndexVersionKey')
+    return grouped_packets.apply(lambda group: group['index'].max())
+
+# Every message is rebroadcasted 1 to 15 times by neighbors over a few trickle periods. Some rebroadcasts share a timestamp.
+rng = np.random.default_rng(3)
+sizes = rng.integers(1, 16, MESSAGES)
+keys = np.repeat(np.arange(MESSAGES, dtype=np.int64) + (215 << 32), sizes)
+times = np.repeat(np.arange(MESSAGES, dtype=np.int64) * 20_000, sizes) + rng.integers(0, 150_000, sizes.sum()) // 1000 * 1000
+neighbor_packets = pd.DataFrame({'IndexVersionKey': keys, 'Timestamp': times}).sort_values('Timestamp', kind='stable', ignore_index=True)
+
+time_before = time.time()
+rolling_result = rolling_max_rebroadcasts(neighbor_packets)
+rolling_time = time.time() - time_before
+
+time_before = time.time()
+group_keys, max_counts = max_packets_in_window(neighbor_packets['IndexVersionKey'].to_numpy(), neighbor_packets['Timestamp'].to_numpy(),
+                                               TRICKLE_I_MIN_MS * 1000)
+vectorized_time = time.time() - time_before
+
+assert np.array_equal(rolling_result.index.to_numpy(), group_keys) and np.array_equal(rolling_result.to_numpy(), max_counts), "Counts differ"
+print("Identical counts")
+print(f"groupby.apply rolling: {rolling_time:.3f} s")
+print(f"searchsorted:          {vectorized_time:.4f} s ({rolling_time / vectorized_time:.0f}x faster)")